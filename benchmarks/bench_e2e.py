@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+"""
+End-to-end benchmark of actions and probes against a simulated salt-api.
+
+For each scenario and fleet size, measures the wall time, the number of
+salt-api requests and the peak Python memory of one activity:
+
+    $ python benchmarks/bench_e2e.py --sizes 10,1000,10000 \\
+        --save benchmarks/baseline.json
+    $ python benchmarks/bench_e2e.py --sizes 10,1000,10000 \\
+        --baseline benchmarks/baseline.json --tolerance 0.25
+
+With `--transports tcp,unix`, every measure is also taken with the
+simulated salt-api listening on a Unix socket, keyed `<scenario>@<size>/unix`.
+
+With `--baseline`, exits with a non-zero status when any measure regressed
+beyond the tolerance. Request counts are deterministic and must never grow.
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import sys
+import tempfile
+import tracemalloc
+from time import perf_counter
+from typing import Any, Callable, Dict
+
+import logzero
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from saltapi import SaltApiSimulator, serve, serve_unix  # noqa: E402
+
+from chaossaltstack.machine.actions import burn_cpu, \
+    network_latency  # noqa: E402
+from chaossaltstack.machine.probes import is_iproute_tc_installed, \
+    is_minion_online  # noqa: E402
+
+SCENARIOS = {
+    "burn_cpu": lambda ids, **kw: burn_cpu(
+        instance_ids=ids, execution_duration="0", **kw),
+    "network_latency": lambda ids, **kw: network_latency(
+        instance_ids=ids, execution_duration="0", **kw),
+    "is_minion_online": lambda ids, **kw: is_minion_online(
+        instance_ids=ids, **kw),
+    "is_iproute_tc_installed": lambda ids, **kw: is_iproute_tc_installed(
+        instance_ids=ids, **kw),
+}  # type: Dict[str, Callable]
+
+
+def measure(scenario: Callable, simulator: SaltApiSimulator,
+            secrets: Dict[str, str], configuration: Dict[str, Any],
+            memory: bool = True) -> Dict[str, Any]:
+    ids = list(simulator.minions)
+    simulator.reset_counters()
+    gc.collect()
+    start = perf_counter()
+    scenario(ids, configuration=configuration, secrets=secrets)
+    seconds = perf_counter() - start
+    result = {
+        "seconds": round(seconds, 4),
+        "requests": simulator.requests,
+        "bytes_received": simulator.bytes_received,
+        "bytes_sent": simulator.bytes_sent,
+    }
+
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            scenario(ids, configuration=configuration, secrets=secrets)
+            result["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def compare(results: Dict[str, Dict[str, Any]],
+            baseline: Dict[str, Dict[str, Any]], tolerance: float,
+            min_seconds: float = 0.05) -> int:
+    regressions = 0
+    for key, current in sorted(results.items()):
+        reference = baseline.get(key)
+        if not reference:
+            continue
+        for measure_, allowed in (("seconds", 1 + tolerance),
+                                  ("peak_bytes", 1 + tolerance),
+                                  ("requests", 1)):
+            if measure_ not in reference or measure_ not in current:
+                continue
+            if measure_ == "seconds" and \
+                    current[measure_] - reference[measure_] < min_seconds:
+                # timer noise on very short runs
+                continue
+            if current[measure_] > reference[measure_] * allowed:
+                regressions += 1
+                print("REGRESSION {} {}: {} > {}".format(
+                    key, measure_, current[measure_], reference[measure_]))
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="10,1000,10000")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--transports", default="tcp",
+                        help="comma separated list of tcp and unix")
+    parser.add_argument("--gzip", action="store_true",
+                        help="let the simulated salt-api compress responses")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip the peak memory run")
+    parser.add_argument("--configuration", default=None,
+                        help="JSON `saltstack` configuration section")
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="compare with this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--min-seconds", type=float, default=0.05,
+                        help="ignore slowdowns shorter than this")
+    args = parser.parse_args()
+
+    logzero.loglevel(logging.WARNING)
+    configuration = {"saltstack": json.loads(args.configuration or "{}")}
+    results = dict()
+
+    tmp = tempfile.mkdtemp()
+    sizes = [int(s) for s in args.sizes.split(",")]
+    for transport in args.transports.split(","):
+        for size in sizes:
+            simulator = SaltApiSimulator(
+                size, args.latency, args.jitter, args.failure_rate,
+                gzip=args.gzip)
+            if transport == "unix":
+                path = os.path.join(tmp, "salt-api-{}.sock".format(size))
+                server = serve_unix(simulator, path)
+                host, suffix = "unix://{}".format(path), "/unix"
+            else:
+                server = serve(simulator)
+                host = "http://127.0.0.1:{}".format(server.server_port)
+                suffix = ""
+            secrets = {
+                "SALTMASTER_HOST": host,
+                "SALTMASTER_USER": "bench",
+                "SALTMASTER_PASSWORD": "bench"
+            }
+            try:
+                for name in args.scenarios.split(","):
+                    key = "{}@{}{}".format(name, size, suffix)
+                    results[key] = measure(
+                        SCENARIOS[name], simulator, secrets, configuration,
+                        memory=not args.no_memory)
+                    print("{:<32} {}".format(key, json.dumps(results[key])))
+            finally:
+                server.shutdown()
+                server.server_close()
+                if transport == "unix":
+                    os.unlink(path)
+    os.rmdir(tmp)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance,
+                   args.min_seconds):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
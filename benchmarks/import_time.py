@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""
+Measure the import time of chaossaltstack with `python -X importtime`.
+
+    $ python benchmarks/import_time.py --max-ms 50
+
+Each module is imported in a fresh interpreter, several times, and the best
+cumulative time is kept. The time spent in chaoslib itself is reported
+separately since the chaostoolkit runner has always loaded it already. Exits
+with a non-zero status when the extension exceeds the given budget or pulls
+a transport dependency at import time.
+"""
+import argparse
+import subprocess
+import sys
+from typing import Dict, Tuple
+
+MODULES = ("chaossaltstack", "chaossaltstack.machine.actions",
+           "chaossaltstack.machine.probes")
+HEAVY = ("requests", "urllib3", "chaoslib.discovery", "sqlite3", "numpy",
+         "logzero")
+
+
+def import_time(statement: str) -> Tuple[Dict[str, int], Dict[str, int]]:
+    """
+    Run `statement` in a fresh interpreter and return the self and the
+    cumulative import times, in microseconds, of every module it loaded.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    own, cumulative = dict(), dict()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        own[name.strip()] = int(self_us)
+        cumulative[name.strip()] = int(cumulative_us)
+    return own, cumulative
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-ms", type=float, default=None,
+                        help="budget for chaossaltstack, chaoslib excluded")
+    args = parser.parse_args()
+
+    failed = False
+    for module in MODULES:
+        best = None
+        for _ in range(args.repeat):
+            statement = "import chaoslib.exceptions, chaoslib.types; " \
+                        "import {}".format(module)
+            own, cumulative = import_time(statement)
+            total = cumulative[module] / 1000.0
+            best = total if best is None else min(best, total)
+        heavy = sorted(m for m in HEAVY if m in own)
+        print("{:<34} {:8.1f} ms  heavy imports: {}".format(
+            module, best, ", ".join(heavy) or "none"))
+        if heavy:
+            failed = True
+        if args.max_ms is not None and best > args.max_ms:
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+"""
+Stand-in salt-api server simulating a Salt Master with N virtual minions.
+
+It implements the subset of the rest_cherrypy API used by this extension:
+
+* `POST /login`
+* `POST /` with the `local`, `local_async` and `runner` clients
+* `GET /events`, a server-sent events stream of job returns
+
+Request bodies may be gzip encoded, and responses are compressed when the
+client accepts it and `--gzip` is set.
+
+It listens on TCP or, with `--socket`, on a Unix socket as a salt-api
+co-located with the runner would.
+
+Latency and failures can be injected to mimic a loaded master:
+
+    $ python benchmarks/saltapi.py --minions 1000 --latency 0.005 \\
+        --failure-rate 0.01 --port 8000
+"""
+import argparse
+import gzip
+import json
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from itertools import count
+from socketserver import ThreadingMixIn, UnixStreamServer
+from time import sleep, time
+from typing import Any, Dict, List
+
+__all__ = ["SaltApiSimulator", "serve", "serve_unix"]
+
+
+class SaltApiSimulator:
+    """
+    State of the simulated master: its minions, the jobs it published and
+    how many requests it served.
+    """
+    def __init__(self, minions: int = 10, latency: float = 0.0,
+                 jitter: float = 0.0, failure_rate: float = 0.0,
+                 windows_ratio: float = 0.0, seed: int = 42,
+                 gzip: bool = False):
+        self.minions = ["minion-{:05d}".format(i) for i in range(minions)]
+        self.known = set(self.minions)
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.gzip = gzip
+        self.random = random.Random(seed)
+        self.kernel = dict(
+            (m, "Windows" if self.random.random() < windows_ratio
+             else "Linux") for m in self.minions)
+        self.failing = set(
+            m for m in self.minions if self.random.random() < failure_rate)
+        self.jobs = dict()  # type: Dict[str, Dict[str, Any]]
+        self.requests = 0
+        self.requests_by_fun = dict()  # type: Dict[str, int]
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self._jids = count(20190830103239000000)
+        self._lock = threading.Lock()
+
+    def reset_counters(self):
+        with self._lock:
+            self.requests = self.bytes_received = self.bytes_sent = 0
+            self.requests_by_fun = dict()
+
+    def count(self, fun: str, received: int):
+        with self._lock:
+            self.requests += 1
+            self.bytes_received += received
+            self.requests_by_fun[fun] = self.requests_by_fun.get(fun, 0) + 1
+
+    def sent(self, size: int):
+        with self._lock:
+            self.bytes_sent += size
+
+    def delay(self):
+        if self.latency or self.jitter:
+            sleep(self.latency + self.random.random() * self.jitter)
+
+    def targets(self, low: Dict[str, Any]) -> List[str]:
+        tgt = low.get("tgt", [])
+        if isinstance(tgt, str):
+            tgt = tgt.split(",") if low.get("tgt_type") == "list" else \
+                (self.minions if tgt == "*" else [tgt])
+        return [m for m in tgt if m in self.known]
+
+    def execute(self, minion: str, fun: str, arg: Any) -> Any:
+        failed = minion in self.failing
+        if fun == "test.ping":
+            return not failed
+        if fun == "grains.get":
+            return {"kernel": self.kernel[minion], "id": minion}.get(
+                arg[0] if isinstance(arg, list) else arg, "")
+        if fun in ("cmd.run", "cmd.script"):
+            return "experiment simulated <{}> -> {}".format(
+                minion, "fail" if failed else "success")
+        return True
+
+    def local(self, low: Dict[str, Any]) -> Dict[str, Any]:
+        return dict(
+            (m, self.execute(m, low.get("fun"), low.get("arg")))
+            for m in self.targets(low))
+
+    def local_async(self, low: Dict[str, Any]) -> Dict[str, Any]:
+        minions = self.targets(low)
+        jid = str(next(self._jids))
+        with self._lock:
+            self.jobs[jid] = {
+                "minions": minions, "fun": low.get("fun"),
+                "arg": low.get("arg"), "started": time()
+            }
+        return {"jid": jid, "minions": minions}
+
+    def runner(self, low: Dict[str, Any]) -> Dict[str, Any]:
+        job = self.jobs.get(str(low.get("jid")))
+        if not job:
+            return {}
+        if low.get("fun") == "jobs.exit_success":
+            return dict((m, m not in self.failing) for m in job["minions"])
+        return dict(
+            (m, self.execute(m, job["fun"], job["arg"]))
+            for m in job["minions"])
+
+    def events(self):
+        """
+        Yield one salt event per minion return of the published jobs.
+        """
+        for jid, job in list(self.jobs.items()):
+            for m in job["minions"]:
+                yield {
+                    "tag": "salt/job/{}/ret/{}".format(jid, m),
+                    "data": {
+                        "jid": jid, "id": m, "fun": job["fun"],
+                        "success": m not in self.failing,
+                        "return": self.execute(m, job["fun"], job["arg"])
+                    }
+                }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    simulator = None  # type: SaltApiSimulator
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, payload: Any, status: int = 200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if self.simulator.gzip and \
+                "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.simulator.sent(len(body))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length)
+        body = gzip.decompress(raw) \
+            if self.headers.get("Content-Encoding") == "gzip" else raw
+        low = json.loads(body.decode("utf-8")) if body else {}
+        sim = self.simulator
+        path = self.path.rstrip("/")
+        sim.count("login" if path == "/login" else low.get("fun", ""),
+                  len(raw))
+        sim.delay()
+
+        if path == "/login":
+            self._reply({"return": [{
+                "token": "simulated", "expire": time() + 43200,
+                "start": time(), "user": low.get("username"),
+                "eauth": low.get("eauth"), "perms": [".*"]}]})
+            return
+        if path:
+            self._reply({"return": ["Not found"]}, status=404)
+            return
+
+        client = low.get("client")
+        if client == "local":
+            result = sim.local(low)
+        elif client == "local_async":
+            result = sim.local_async(low)
+        elif client == "runner":
+            result = sim.runner(low)
+        else:
+            self._reply({"return": ["Unsupported client"]}, status=400)
+            return
+        self._reply({"return": [result]})
+
+    def do_GET(self):
+        if self.path.split("?")[0].rstrip("/") != "/events":
+            self._reply({"return": ["Not found"]}, status=404)
+            return
+        self.simulator.count("events", 0)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for event in self.simulator.events():
+            chunk = "tag: {}\ndata: {}\n\n".format(
+                event["tag"], json.dumps(event))
+            self.wfile.write(chunk.encode("utf-8"))
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve(simulator: SaltApiSimulator, host: str = "127.0.0.1",
+          port: int = 0) -> HTTPServer:
+    """
+    Start serving `simulator` from a background thread and return the
+    server, its URL being `http://<host>:<server.server_port>`.
+    """
+    # headers and body are written separately, they must not wait for the
+    # delayed ACK of kept alive connections
+    handler = type("Handler", (_Handler,), {
+        "simulator": simulator, "disable_nagle_algorithm": True})
+    server = _Server((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+class _UnixServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+def serve_unix(simulator: SaltApiSimulator,
+               path: str) -> UnixStreamServer:
+    """
+    Same as `serve` but listen on the Unix socket at `path`, its URL being
+    `unix://<path>`.
+    """
+    handler = type("Handler", (_Handler,), {
+        "simulator": simulator, "address_string": lambda self: path})
+    server = _UnixServer(path, handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--socket", default=None,
+                        help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--minions", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds added to every request")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="random extra seconds added to every request")
+    parser.add_argument("--failure-rate", type=float, default=0.0,
+                        help="ratio of minions whose jobs fail")
+    parser.add_argument("--windows-ratio", type=float, default=0.0)
+    parser.add_argument("--gzip", action="store_true",
+                        help="compress responses when the client accepts it")
+    args = parser.parse_args()
+
+    simulator = SaltApiSimulator(
+        args.minions, args.latency, args.jitter, args.failure_rate,
+        args.windows_ratio, gzip=args.gzip)
+    if args.socket:
+        server = serve_unix(simulator, args.socket)
+        url = "unix://{}".format(args.socket)
+    else:
+        server = serve(simulator, args.host, args.port)
+        url = "http://{}:{}".format(args.host, server.server_port)
+    print("Simulating {} minions on {}".format(args.minions, url))
+    try:
+        while True:
+            sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+"""
+Measure the cost of `chaossaltstack.tracing.span()` compared to running the
+same block without it.
+
+    $ python benchmarks/tracing_overhead.py --max-overhead-ns 500
+
+Exits with a non-zero status when the overhead per span exceeds the given
+budget, so it can guard against regressions in CI.
+"""
+import argparse
+import sys
+import timeit
+
+from chaossaltstack import tracing
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--number", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-overhead-ns", type=float, default=None)
+    args = parser.parse_args()
+
+    enabled = tracing.get_tracer() is not None
+    baseline = min(timeit.repeat(
+        "pass", number=args.number, repeat=args.repeat))
+    traced = min(timeit.repeat(
+        "with span('bench', attributes): pass",
+        setup="from chaossaltstack.tracing import span\n"
+              "attributes = {'salt.fun': 'cmd.run'}",
+        number=args.number, repeat=args.repeat))
+
+    overhead = max(traced - baseline, 0) / args.number * 1e9
+    print("opentelemetry available: {}".format(enabled))
+    print("span overhead: {:.1f} ns per block".format(overhead))
+
+    if args.max_overhead_ns is not None and overhead > args.max_overhead_ns:
+        print("overhead above the {} ns budget".format(args.max_overhead_ns))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
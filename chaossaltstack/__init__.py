@@ -1,41 +1,89 @@
 # -*- coding: utf-8 -*-
+import atexit
+import gzip
 import json
 import os
 import os.path
+import threading
+from time import monotonic, time
 from typing import Any, Dict, List
 
-from chaoslib.discovery.discover import discover_actions, discover_probes, \
-    initialize_discovery_result
 from chaoslib.exceptions import FailedActivity
-from chaoslib.types import Discovery, DiscoveredActivities, Secrets
-from logzero import logger
-import requests
-from requests.packages.urllib3.exceptions import InsecureRequestWarning
+from chaoslib.types import Configuration, Discovery, DiscoveredActivities, \
+    Secrets
 
-__all__ = ["salt_api_client", "discover", "__version__"]
+from .metrics import record_request
+from .streaming import iter_return_items
+from .throttle import DISPATCH, POLL, Throttle, get_throttle
+from .tracing import span
+
+__all__ = ["salt_api_client", "saltstack_api_client", "get_settings",
+           "close_clients", "discover", "__version__"]
 __version__ = '0.1.0'
 
+# requests and its urllib3 internals are only imported on the first call to
+# salt-api, so that importing this package, and discovering its activities,
+# stays cheap
+_requests = None
+
+# one client per master, credentials and settings, shared by every activity
+# and thread of the process
+_clients = dict()  # type: Dict[tuple, salt_api_client]
+_clients_lock = threading.Lock()
+_clients_closed_at_exit = False
+
+# request bodies smaller than this are not worth compressing
+COMPRESSION_THRESHOLD = 1024
+# size of the chunks read from streamed responses
+STREAM_CHUNK_SIZE = 64 * 1024
+# a token this close to its expiry is renewed before it is used
+TOKEN_EXPIRY_MARGIN = 60
+
 
 class salt_api_client:
     """
     Offically supported by NETAPI MODULES
     https://docs.saltstack.com/en/latest/topics/netapi/index.html
     However, generally you need to avoid http request verify by verify=False
+
+    A client may be shared by several threads: the headers of each request
+    are built for it, the login token is obtained and renewed by one thread
+    at a time, and the connection pool is opened once.
     """
-    def __init__(self, configuration):
+    def __init__(self, configuration, throttle: Throttle = None,
+                 retries: int = 0, compress_requests: bool = False):
         self.url = configuration['url']
+        if self.url.startswith('unix://'):
+            # salt-api bound to a Unix socket on this host
+            from .transport import to_requests_url
+            self.url = to_requests_url(self.url)
+        # Default settings for Salt Master, never changed once built
+        self.headers = {
+            "Content-type": "application/json", "Accept-Encoding": "gzip"
+        }
+        # gzip request bodies, salt-api must be set up to decode them
+        self.compress_requests = bool(compress_requests)
+        self.params = {'client': 'local', 'fun': '', 'tgt': ''}
+        # Shared limits on in-flight requests and request rates
+        self.throttle = throttle or Throttle()
+        # Attempts made again when the connection to the master fails
+        self.retries = int(retries)
+        # Pooled connections, opened on the first request
+        self.session = None
+        self._session_lock = threading.Lock()
         # Use Token
         self.useToken = False
+        self.token = None
+        # when the token obtained by logging in expires, as a timestamp
+        self.token_expiry = None
+        self._token_lock = threading.Lock()
+        self.username = self.password = None
         if 'token' in configuration:
             self.useToken = True
             self.token = configuration['token']
-            self.headers['X-Auth-Token'] = self.token
         elif 'username' in configuration:
             self.username = configuration['username']
             self.password = configuration['password']
-        # Default settings for Salt Master
-        self.headers = {"Content-type": "application/json"}
-        self.params = {'client': 'local', 'fun': '', 'tgt': ''}
         # Use User/Pass
         self.login_url = self.url + "/login"
         self.login_params = {
@@ -43,7 +91,7 @@ class salt_api_client:
             'eauth': 'pam'
         }
 
-    def run_cmd(self, tgt, method: str, arg=None):
+    def run_cmd(self, tgt, method: str, arg=None, kwarg=None):
         """
            remote run commands，same with:
                salt 'client1' cmd.run 'ls -li'
@@ -59,16 +107,19 @@ class salt_api_client:
                 'client': 'local', 'fun': method, 'tgt': tgt,
                 'tgt_type': 'list'
             }
+        if kwarg:
+            params['kwarg'] = kwarg
 
-        # Refresh token for each execution
         self.__check_token__()
         result = self.__get_http_data__(self.url, params)
         return result
 
-    def async_run_cmd(self, tgt, method: str, arg=None):
+    def async_run_cmd(self, tgt, method: str, arg=None, kwarg=None):
         """
         remote run commands asynchronized，same with:
             salt --async 'client1' cmd.run 'ls -li'
+        Keyword arguments of the function, such as `template`, are given in
+        `kwarg`.
         """
         if arg:
             params = {
@@ -80,6 +131,8 @@ class salt_api_client:
                 'client': 'local_async', 'fun': method, 'tgt': tgt,
                 'tgt_type': 'list'
             }
+        if kwarg:
+            params['kwarg'] = kwarg
         self.__check_token__()
         jid = self.__get_http_data__(self.url, params)['jid']
         return jid
@@ -119,26 +172,227 @@ class salt_api_client:
         result = self.__get_http_data__(self.url, params)
         return result
 
+    def iter_run_cmd(self, tgt, method: str, arg=None, kwarg=None):
+        """
+        Same as `run_cmd` but yields the `(minion, result)` pairs while the
+        response is read, without holding the whole of it in memory.
+
+        `method` may also be a list of functions, `arg` then being the list
+        of their arguments, to call them all at once: the result of each
+        minion is then a dict keyed by function.
+        """
+        params = {
+            'client': 'local', 'fun': method, 'tgt': tgt, 'tgt_type': 'list'
+        }
+        if arg:
+            params['arg'] = arg
+        if kwarg:
+            params['kwarg'] = kwarg
+        self.__check_token__()
+        return self.__stream_http_data__(self.url, params)
+
+    def iter_async_cmd_result(self, jid: str):
+        """
+        Same as `get_async_cmd_result` but yields `(minion, result)` pairs.
+        """
+        params = {'client': 'runner', 'fun': 'jobs.lookup_jid', 'jid': jid}
+        self.__check_token__()
+        return self.__stream_http_data__(self.url, params)
+
+    def iter_async_cmd_exit_success(self, jid: str):
+        """
+        Same as `async_cmd_exit_success` but yields `(minion, bool)` pairs.
+        """
+        params = {'client': 'runner', 'fun': 'jobs.exit_success', 'jid': jid}
+        self.__check_token__()
+        return self.__stream_http_data__(self.url, params)
+
     ###########################################################################
     # Private methods
     ###########################################################################
-    def __get_http_data__(self, url: str, params: Dict[str, Any]):
-        send_data = json.dumps(params)
-        requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
-        request = requests.post(
-            url, data=send_data, headers=self.headers, verify=False)
-        response = request.json()
-        result = dict(response)
-        return result['return'][0]
+    def __get_http_data__(self, url: str, params: Dict[str, Any],
+                          replay: bool = True):
+        send_data, headers, event, attributes = self.__prepare__(params)
+        token = self.token
+        start = monotonic()
+        with span("salt-api", attributes) as http_span:
+            try:
+                budget = __request_budget__(params)
+                with self.throttle.slot(budget):
+                    request = self.__post__(
+                        url, send_data, headers, event, token,
+                        replayable=budget != DISPATCH)
+                event['status'] = request.status_code
+                event['received_raw_bytes'] = len(request.content)
+                # the length on the wire, compressed or not
+                event['received_bytes'] = int(request.headers.get(
+                    'Content-Length', event['received_raw_bytes']))
+            finally:
+                event['seconds'] = monotonic() - start
+                record_request(event)
+            http_span.set_attribute('http.status_code', request.status_code)
+            refused = self.__refused__(url, request, replay)
+            if not refused:
+                result = request.json()['return'][0]
+                if isinstance(result, dict) and 'jid' in result:
+                    http_span.set_attribute('salt.jid', str(result['jid']))
+        if refused:
+            # out of the throttle slot, which logging in takes again
+            self.__renew_token__(token)
+            return self.__get_http_data__(url, params, replay=False)
+        return result
+
+    def __stream_http_data__(self, url: str, params: Dict[str, Any],
+                             replay: bool = True):
+        send_data, headers, event, attributes = self.__prepare__(params)
+        if 'jid' in params:
+            attributes['salt.jid'] = str(params['jid'])
+        token = self.token
+        request = None
+        refused = False
+        start = monotonic()
+        with span("salt-api", attributes) as http_span:
+            try:
+                budget = __request_budget__(params)
+                with self.throttle.slot(budget):
+                    request = self.__post__(
+                        url, send_data, headers, event, token, stream=True,
+                        replayable=budget != DISPATCH)
+                    event['status'] = request.status_code
+                    http_span.set_attribute(
+                        'http.status_code', request.status_code)
+                    refused = self.__refused__(url, request, replay)
+                    if not refused:
+                        request.raise_for_status()
+                        for item in iter_return_items(
+                                self.__iter_chunks__(request, event)):
+                            yield item
+            finally:
+                if request is not None:
+                    request.close()
+                    event['received_bytes'] = int(request.headers.get(
+                        'Content-Length', event['received_raw_bytes']))
+                event['seconds'] = monotonic() - start
+                record_request(event)
+        if refused:
+            self.__renew_token__(token)
+            for item in self.__stream_http_data__(url, params, replay=False):
+                yield item
+
+    def __iter_chunks__(self, request, event: Dict[str, Any]):
+        for chunk in request.iter_content(STREAM_CHUNK_SIZE):
+            event['received_raw_bytes'] += len(chunk)
+            yield chunk
+
+    def __prepare__(self, params: Dict[str, Any]):
+        send_data = json.dumps(params).encode('utf-8')
+        fun = params.get('fun') or 'login'
+        if isinstance(fun, list):
+            # several functions called at once
+            fun = ",".join(fun)
+        event = {
+            'fun': fun,
+            'client': params.get('client'),
+            'sent_raw_bytes': len(send_data), 'received_raw_bytes': 0,
+            'received_bytes': 0, 'retries': 0, 'status': 'error'
+        }
+        headers = dict(self.headers)
+        if self.compress_requests and \
+                len(send_data) >= COMPRESSION_THRESHOLD:
+            send_data = gzip.compress(send_data)
+            headers['Content-Encoding'] = 'gzip'
+        event['sent_bytes'] = len(send_data)
+        attributes = {
+            'salt.client': event['client'] or 'login', 'salt.fun': event['fun']
+        }
+        if isinstance(params.get('tgt'), list):
+            attributes['salt.minions'] = len(params['tgt'])
+        return send_data, headers, event, attributes
+
+    def __post__(self, url: str, data: bytes, headers: Dict[str, str],
+                 event: Dict[str, Any], token: str = None,
+                 stream: bool = False, replayable: bool = True):
+        """
+        Send a request, again up to `retries` times when the connection
+        fails. A request publishing a job is only sent again when it never
+        reached the master, lest the job be published twice.
+        """
+        requests = __transport__()
+        session = self.__session__()
+        if token is not None and url != self.login_url:
+            headers['X-Auth-Token'] = token
+        while True:
+            try:
+                response = session.post(
+                    url, data=data, headers=headers, verify=False,
+                    stream=stream)
+            except requests.ConnectionError as x:
+                if event['retries'] >= self.retries or \
+                        not (replayable or __unsent__(x)):
+                    raise
+                event['retries'] += 1
+                __logger__().debug(
+                    "Retrying salt-api request to {}".format(url))
+                continue
+            return response
+
+    def __session__(self):
+        with self._session_lock:
+            if self.session is None:
+                from .transport import new_session
+                self.session = new_session(
+                    self.throttle.max_in_flight or 10)
+            return self.session
 
     def __obtain_token__(self):
-        self.token = self.__get_http_data__(
-            self.login_url, self.login_params).get('token')
-        self.headers['X-Auth-Token'] = self.token
+        result = self.__get_http_data__(self.login_url, self.login_params)
+        self.token_expiry = result.get('expire')
+        self.token = result.get('token')
 
     def __check_token__(self):
-        if self.useToken is not True:
-            self.__obtain_token__()
+        """
+        Log in, unless the token obtained before is still valid. Threads
+        finding it missing or about to expire wait for one of them to get
+        a new one.
+        """
+        if self.useToken is True:
+            return
+        with self._token_lock:
+            if self.token is None or (
+                    self.token_expiry is not None and
+                    time() >= self.token_expiry - TOKEN_EXPIRY_MARGIN):
+                self.__obtain_token__()
+
+    def __refused__(self, url: str, request, replay: bool) -> bool:
+        """
+        Tell whether the master refused the token of a request which may be
+        replayed once logged in again. Failing to log in is final.
+        """
+        if request.status_code != 401:
+            return False
+        if url == self.login_url:
+            raise FailedActivity(
+                "Cannot log in to {} as {}".format(self.url, self.username))
+        return replay and not self.useToken
+
+    def __renew_token__(self, token: str):
+        """
+        Log in again after the master refused `token`, revoked or expired
+        early, unless another thread already did.
+        """
+        with self._token_lock:
+            if self.token == token:
+                self.__obtain_token__()
+
+    def close(self):
+        """
+        Close the pooled connections to the master, opened again if the
+        client is used afterwards.
+        """
+        with self._session_lock:
+            session, self.session = self.session, None
+        if session is not None:
+            session.close()
 
 
 # TODO Not implemented
@@ -149,7 +403,65 @@ def is_saltmaster_local():
     return False
 
 
-def saltstack_api_client(secrets: Secrets = None) -> salt_api_client:
+def __transport__():
+    """
+    Import requests on first use and silence the warnings about unverified
+    HTTPS requests made to the master.
+    """
+    global _requests
+    if _requests is None:
+        import requests
+        from requests.packages.urllib3.exceptions import \
+            InsecureRequestWarning
+        requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
+        _requests = requests
+    return _requests
+
+
+def __unsent__(error: Exception) -> bool:
+    """
+    Tell whether a connection error happened while connecting to the master,
+    before any of the request was sent.
+    """
+    requests = __transport__()
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    reason = getattr(reason, 'reason', reason)
+    return isinstance(
+        reason, requests.packages.urllib3.exceptions.NewConnectionError)
+
+
+def __logger__():
+    from logzero import logger
+    return logger
+
+
+def __request_budget__(params: Dict[str, Any]) -> str:
+    """
+    Tell which rate budget a salt-api request draws from: runner calls poll
+    the job cache, local calls publish jobs to minions, anything else (such
+    as a login) is only bound by the in-flight cap.
+    """
+    client = params.get('client')
+    if client == 'runner':
+        return POLL
+    if client in ('local', 'local_async'):
+        return DISPATCH
+    return None
+
+
+def get_settings(configuration: Configuration = None) -> Dict[str, Any]:
+    """
+    Return the `saltstack` section of the experiment configuration.
+    """
+    configuration = configuration or {}
+    return configuration.get("saltstack") or {}
+
+
+def saltstack_api_client(secrets: Secrets = None,
+                         configuration: Configuration = None
+                         ) -> salt_api_client:
     """
     Create a SaltStack http(s) client from:
 
@@ -162,7 +474,9 @@ def saltstack_api_client(secrets: Secrets = None) -> salt_api_client:
 
     3. Key, only from Salt Master
 
-        * SALTMASTER_HOST: Salt Master API address
+        * SALTMASTER_HOST: Salt Master API address, either an http(s) URL
+          or `unix:///path/to/salt-api.sock` when salt-api listens on a Unix
+          socket of this host
 
         You can authenticate with user / password via:
         * SALTMASTER_USER: the user name
@@ -175,12 +489,50 @@ def saltstack_api_client(secrets: Secrets = None) -> salt_api_client:
 
         You may pass a secrets dictionary, in which case, values will be looked
         there before the environ.
+
+    Requests are throttled with the limits read from the `saltstack` section
+    of the configuration, shared by every client of the process:
+
+        * max_in_flight: maximum number of concurrent salt-api requests
+        * dispatch_rate: jobs published per second (`local`, `local_async`)
+        * poll_rate: job cache lookups per second (`runner`)
+        * rate_burst: number of requests allowed above the rates at once
+        * retries: attempts made again when the connection to the master
+          fails, defaults to 0. Jobs are only published again when the
+          master could not be reached at all
+        * compress_requests: gzip large request bodies, only when salt-api
+          is set up to decode them. Responses are always negotiated as gzip
+
+    4. Several masters
+
+        * SALTMASTERS: a list of masters, each given with the keys above
+          plus an optional `name` and `minions`, glob patterns of the
+          minions it manages. A `MultiMasterClient` is then returned, which
+          sends each call to the masters of the targeted minions at once
+          and merges their results. Each master gets its own throttle
+
+    With `chunk_size` in the `saltstack` section of the configuration, a
+    `ChunkedClient` is returned, which splits the minions targeted by each
+    call in chunks of that size, sent `max_in_flight` at most at once.
+
+    The client of a master is created once per process for given
+    credentials and settings, then shared by the activities and their
+    threads, along with its login token and connections. Its connections
+    are closed when the process exits, or by `close_clients()`.
     """
     env = os.environ
     secrets = secrets or {}
-
-    def lookup(k: str, d: str = None) -> str:
-        return secrets.get(k, env.get(k, d))
+    settings = get_settings(configuration)
+
+    if secrets.get("SALTMASTERS"):
+        from .multimaster import MultiMasterClient
+        masters = []
+        for master in secrets["SALTMASTERS"]:
+            client = __master_client__(
+                master, dict(), settings, own_throttle=True)
+            masters.append((master.get("name") or client.url, client,
+                            master.get("minions")))
+        return __chunked__(MultiMasterClient(masters), settings)
 
     if is_saltmaster_local():
 
@@ -188,31 +540,88 @@ def saltstack_api_client(secrets: Secrets = None) -> salt_api_client:
         configuration = dict()
         return salt_api_client(configuration)
 
-    else:
+    return __chunked__(__master_client__(secrets, env, settings), settings)
 
-        configuration = dict()
-        configuration['debug'] = True
-        configuration['url'] = lookup("SALTMASTER_HOST", "http://localhost")
-
-        if "SALTMASTER_USER" in env or "SALTMASTER_USER" in secrets:
-            configuration['username'] = lookup("SALTMASTER_USER", "")
-            configuration['password'] = lookup("SALTMASTER_PASSWORD", "")
-        elif "SALTMASTER_TOKEN" in env or "SALTMASTER_TOKEN" in secrets:
-            configuration['token'] = lookup("SALTMASTER_TOKEN")
-        else:
-            raise FailedActivity(
-                "configuration is not complete, either use user/pass "
-                "or a token! "
-            )
 
-    return salt_api_client(configuration)
+def __chunked__(client, settings: Dict[str, Any]):
+    """
+    Wrap the client so that it sends the minions in chunks of `chunk_size`,
+    when set.
+    """
+    if not settings.get("chunk_size"):
+        return client
+    from .chunking import ChunkedClient
+    return ChunkedClient(
+        client, settings["chunk_size"],
+        max_workers=int(settings.get("max_in_flight", 0) or 0) or 10)
+
+
+def __master_client__(secrets: Secrets, env: Dict[str, str],
+                      settings: Dict[str, Any],
+                      own_throttle: bool = False) -> salt_api_client:
+    """
+    Create the client of one master from its secrets, looked up in `env`
+    when missing. With `own_throttle`, the limits of the settings apply to
+    this master alone rather than to the whole process.
+    """
+    def lookup(k: str, d: str = None) -> str:
+        return secrets.get(k, env.get(k, d))
+
+    configuration = dict()
+    configuration['debug'] = True
+    configuration['url'] = lookup("SALTMASTER_HOST", "http://localhost")
+
+    if "SALTMASTER_USER" in env or "SALTMASTER_USER" in secrets:
+        configuration['username'] = lookup("SALTMASTER_USER", "")
+        configuration['password'] = lookup("SALTMASTER_PASSWORD", "")
+    elif "SALTMASTER_TOKEN" in env or "SALTMASTER_TOKEN" in secrets:
+        configuration['token'] = lookup("SALTMASTER_TOKEN")
+    else:
+        raise FailedActivity(
+            "configuration is not complete, either use user/pass "
+            "or a token! "
+        )
+
+    scope = configuration['url'] if own_throttle else None
+    throttle = get_throttle(settings, scope)
+    retries = int(settings.get("retries", 0) or 0)
+    compress_requests = bool(settings.get("compress_requests", False))
+    key = (configuration['url'], configuration.get('username'),
+           configuration.get('password'), configuration.get('token'),
+           throttle, retries, compress_requests)
+
+    global _clients_closed_at_exit
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = salt_api_client(
+                configuration, throttle=throttle, retries=retries,
+                compress_requests=compress_requests)
+            if not _clients_closed_at_exit:
+                atexit.register(close_clients)
+                _clients_closed_at_exit = True
+        return client
+
+
+def close_clients():
+    """
+    Close the connections of the clients shared by the process and forget
+    them, the next call to `saltstack_api_client()` creating new ones.
+    """
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
 
 
 def discover(discover_system: bool = True) -> Discovery:
     """
     Discover SaltStack capabilities offered by this extension.
     """
-    logger.info("Discovering capabilities from chaostoolkit-saltstack")
+    from chaoslib.discovery.discover import initialize_discovery_result
+
+    __logger__().info("Discovering capabilities from chaostoolkit-saltstack")
 
     discovery = initialize_discovery_result(
         "chaostoolkit-saltstack", __version__, "chaossaltstack")
@@ -225,9 +634,9 @@ def discover(discover_system: bool = True) -> Discovery:
 ###############################################################################
 def load_exported_activities() -> List[DiscoveredActivities]:
     """
-    Extract metadata from actions and probes exposed by this extension.
+    Extract metadata from actions and probes exposed by this extension,
+    from the manifest shipped with the package when it is up to date.
     """
-    activities = []
-    activities.extend(discover_actions("saltstack.machine.actions"))
-    activities.extend(discover_probes("saltstack.machine.probes"))
-    return activities
+    from .discovery import load_activities
+
+    return load_activities(__version__)
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Large lists of minions sent to salt-api in chunks.
+
+With the `chunk_size` setting of the `saltstack` configuration section,
+`saltstack_api_client()` returns a `ChunkedClient` wrapping the client of
+the master, or masters. Every call targeting more minions than `chunk_size`
+is split into one request per chunk, made `max_in_flight` at most at once,
+and what the chunks return is merged as it comes: no request body, nor any
+response, holds more than a chunk of minions. A job published in several
+chunks gets a JID listing the JID of each chunk, which any client, in this
+process or another one, can look up. `split_jid()` returns the JIDs of
+the jobs a JID stands for on the masters.
+
+`target_list()` reads the `instance_ids` given to the activities, a list,
+any other iterable, or the path of a file with one minion per line.
+"""
+import os.path
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Union
+
+from chaoslib.exceptions import FailedActivity
+
+from .fanout import call_all, stream_all
+from .multimaster import parse_master_jid
+
+__all__ = ["ChunkedClient", "target_list", "split_jid",
+           "CHUNKED_JID_PREFIX"]
+
+CHUNKED_JID_PREFIX = "chunks:"
+
+
+class ChunkedClient:
+    """
+    Facade over a client sending the minions targeted by each call in
+    chunks of `chunk_size`.
+    """
+    def __init__(self, client, chunk_size: int, max_workers: int = None):
+        if int(chunk_size) <= 0:
+            raise FailedActivity(
+                "chunk_size must be positive, got {}".format(chunk_size))
+        self.client = client
+        self.chunk_size = int(chunk_size)
+        self.max_workers = max_workers
+
+    def run_cmd(self, tgt, method: str, arg=None, kwarg=None):
+        return self.__merge__(call_all([
+            lambda t=chunk: self.client.run_cmd(t, method, arg, kwarg)
+            for chunk in self.__chunks__(tgt)], self.max_workers))
+
+    def async_run_cmd(self, tgt, method: str, arg=None, kwarg=None):
+        jids = call_all([
+            lambda t=chunk: self.client.async_run_cmd(t, method, arg, kwarg)
+            for chunk in self.__chunks__(tgt)], self.max_workers)
+        if len(jids) == 1:
+            return jids[0]
+        return CHUNKED_JID_PREFIX + ",".join(str(jid) for jid in jids)
+
+    def get_async_cmd_result(self, jid: str):
+        return self.__merge__(call_all([
+            lambda j=chunk_jid: self.client.get_async_cmd_result(j)
+            for chunk_jid in self.__jids__(jid)], self.max_workers))
+
+    def async_cmd_exit_success(self, jid: str):
+        return self.__merge__(call_all([
+            lambda j=chunk_jid: self.client.async_cmd_exit_success(j)
+            for chunk_jid in self.__jids__(jid)], self.max_workers))
+
+    def get_grains_get(self, tgt, item):
+        return self.__merge__(call_all([
+            lambda t=chunk: self.client.get_grains_get(t, item)
+            for chunk in self.__chunks__(tgt)], self.max_workers))
+
+    def iter_run_cmd(self, tgt, method: str, arg=None, kwarg=None):
+        return self.__stream__([
+            lambda t=chunk: self.client.iter_run_cmd(t, method, arg, kwarg)
+            for chunk in self.__chunks__(tgt)])
+
+    def iter_async_cmd_result(self, jid: str):
+        return self.__stream__([
+            lambda j=chunk_jid: self.client.iter_async_cmd_result(j)
+            for chunk_jid in self.__jids__(jid)])
+
+    def iter_async_cmd_exit_success(self, jid: str):
+        return self.__stream__([
+            lambda j=chunk_jid: self.client.iter_async_cmd_exit_success(j)
+            for chunk_jid in self.__jids__(jid)])
+
+    ###########################################################################
+    # Private methods
+    ###########################################################################
+    def __chunks__(self, tgt) -> List[Any]:
+        """
+        Split the targets in chunks, keeping a single minion, or no target
+        at all, as it is.
+        """
+        if tgt is None or isinstance(tgt, str):
+            return [tgt]
+        minions = iter(tgt)
+        chunks = []
+        while True:
+            chunk = list(islice(minions, self.chunk_size))
+            if not chunk:
+                break
+            chunks.append(chunk)
+        return chunks or [[]]
+
+    def __jids__(self, jid: str) -> List[str]:
+        jid = str(jid)
+        if jid.startswith(CHUNKED_JID_PREFIX):
+            return jid[len(CHUNKED_JID_PREFIX):].split(",")
+        return [jid]
+
+    def __merge__(self, results: List[Any]) -> Dict[str, Any]:
+        if len(results) == 1:
+            return results[0]
+        merged = dict()
+        for result in results:
+            if isinstance(result, dict):
+                merged.update(result)
+        return merged
+
+    def __stream__(self, calls) -> Iterator:
+        for _, item in stream_all(calls, self.max_workers):
+            yield item
+
+
+def split_jid(jid: str) -> List[str]:
+    """
+    Return the JIDs of the jobs published on the masters for a job, several
+    ones when it was published in chunks or on several masters.
+    """
+    jid = str(jid)
+    if jid.startswith(CHUNKED_JID_PREFIX):
+        return [master_job for chunk in
+                jid[len(CHUNKED_JID_PREFIX):].split(",")
+                for master_job in split_jid(chunk)]
+    jobs = parse_master_jid(jid)
+    if jobs is not None:
+        return [master_job for _, master_job in jobs]
+    return [jid]
+
+
+def target_list(instance_ids: Union[Iterable[str], str, None]
+                ) -> Union[List[str], str, None]:
+    """
+    Return the minions targeted by `instance_ids` as a list, read from a
+    file when it is the path of one, one minion per line, leaving out blank
+    lines and lines starting with `#`. Lists and single minions are
+    returned as they are.
+    """
+    if instance_ids is None or isinstance(instance_ids, list):
+        return instance_ids
+    if isinstance(instance_ids, str):
+        if not os.path.isfile(instance_ids):
+            return instance_ids
+        with open(instance_ids) as f:
+            return [line.strip() for line in f
+                    if line.strip() and not line.lstrip().startswith("#")]
+    return list(instance_ids)
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Metadata of the activities exported by this extension, served without
+importing them.
+
+The metadata is read, in order, from:
+
+1. the `activities.json` manifest shipped with the package, when it was
+   generated for the installed version
+2. a cache in the user cache directory, keyed by the package version and
+   the modification time of the activity modules
+3. introspection of the activity modules, whose result is then cached
+
+Regenerate the shipped manifest after changing any activity:
+
+    $ python -m chaossaltstack.discovery
+"""
+import json
+import os
+import os.path
+import sys
+from typing import Any, Dict, List
+
+from chaoslib.types import DiscoveredActivities
+
+__all__ = ["ACTIVITY_MODULES", "MANIFEST_PATH", "load_activities",
+           "introspect_activities", "write_manifest"]
+
+ACTIVITY_MODULES = {
+    "action": "chaossaltstack.machine.actions",
+    "probe": "chaossaltstack.machine.probes"
+}
+MANIFEST_PATH = os.path.join(os.path.dirname(__file__), "activities.json")
+
+
+def load_activities(version: str) -> List[DiscoveredActivities]:
+    """
+    Return the metadata of the exported activities for the given package
+    version, introspecting the modules only when no manifest matches.
+    """
+    manifest = _read(MANIFEST_PATH)
+    if manifest and manifest.get("version") == version:
+        return manifest["activities"]
+
+    cache_path = _cache_path(version)
+    cached = _read(cache_path)
+    if cached and cached.get("version") == version:
+        return cached["activities"]
+
+    activities = introspect_activities()
+    try:
+        _write(cache_path, version, activities)
+    except OSError:
+        pass
+    return activities
+
+
+def introspect_activities() -> List[DiscoveredActivities]:
+    """
+    Import the activity modules and extract their metadata.
+    """
+    from chaoslib.discovery.discover import discover_actions, discover_probes
+
+    activities = []
+    activities.extend(discover_actions(ACTIVITY_MODULES["action"]))
+    activities.extend(discover_probes(ACTIVITY_MODULES["probe"]))
+    return activities
+
+
+def write_manifest(version: str, path: str = MANIFEST_PATH):
+    """
+    Generate the manifest shipped with the package.
+    """
+    _write(path, version, introspect_activities())
+
+
+###############################################################################
+# Private functions
+###############################################################################
+def _read(path: str) -> Dict[str, Any]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write(path: str, version: str, activities: List[DiscoveredActivities]):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp, "w") as f:
+        json.dump({"version": version, "activities": activities}, f,
+                  indent=2, sort_keys=True)
+        f.write("\n")
+    os.replace(tmp, path)
+
+
+def _cache_path(version: str) -> str:
+    root = os.environ.get("XDG_CACHE_HOME") or \
+        os.path.join(os.path.expanduser("~"), ".cache")
+    modules = os.path.join(os.path.dirname(__file__), "machine")
+    stamp = max(
+        int(os.stat(os.path.join(modules, name)).st_mtime)
+        for name in ("actions.py", "probes.py"))
+    return os.path.join(
+        root, "chaostoolkit-saltstack",
+        "activities-{}-{}.json".format(version, stamp))
+
+
+if __name__ == "__main__":
+    from chaossaltstack import __version__
+
+    path = sys.argv[1] if len(sys.argv) > 1 else MANIFEST_PATH
+    write_manifest(__version__, path)
+    print("Wrote {}".format(path))
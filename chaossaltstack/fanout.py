@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Calls to salt-api made concurrently, for the clients which split a call in
+several, by master or by chunk of minions, and merge what they return.
+"""
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterator, List, Tuple
+
+from .metrics import bind
+from .tracing import bind_context
+
+__all__ = ["call_all", "stream_all", "STREAM_QUEUE_SIZE"]
+
+# items read ahead of the consumer of the merged streams, beyond which the
+# streams wait for it
+STREAM_QUEUE_SIZE = 1024
+
+_END = object()
+
+
+class _Failed:
+    __slots__ = ("error",)
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def call_all(calls: List[Callable[[], Any]],
+             max_workers: int = None) -> List[Any]:
+    """
+    Make the calls, `max_workers` of them at most at once, and return what
+    each returned, in the order of the calls.
+    """
+    if len(calls) <= 1:
+        return [call() for call in calls]
+    workers = min(len(calls), max_workers or len(calls))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(bind(bind_context(call))) for call in calls]
+        return [future.result() for future in futures]
+
+
+def stream_all(calls: List[Callable[[], Iterator]],
+               max_workers: int = None) -> Iterator[Tuple[int, Any]]:
+    """
+    Consume the iterators returned by the calls, `max_workers` of them at
+    most at once, and yield their items as they come along with the index
+    of their call. No more than `STREAM_QUEUE_SIZE` items are held waiting
+    for the consumer.
+    """
+    if len(calls) == 1:
+        for item in calls[0]():
+            yield 0, item
+        return
+
+    items = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+    stopped = threading.Event()
+
+    def put(item) -> bool:
+        # give up once the consumer is gone
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def pump(index: int, call: Callable[[], Iterator]):
+        iterator = None
+        try:
+            iterator = call()
+            for item in iterator:
+                if not put((index, item)):
+                    break
+        except BaseException as x:
+            put((index, _Failed(x)))
+        finally:
+            if hasattr(iterator, "close"):
+                iterator.close()
+            put((index, _END))
+
+    workers = min(len(calls), max_workers or len(calls)) or 1
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for index, call in enumerate(calls):
+            pool.submit(bind(bind_context(pump)), index, call)
+        running = len(calls)
+        while running:
+            index, item = items.get()
+            if item is _END:
+                running -= 1
+            elif isinstance(item, _Failed):
+                raise item.error
+            else:
+                yield index, item
+    finally:
+        # the calls still running stop at their next item
+        stopped.set()
+        pool.shutdown(wait=False)
@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+Local record of the salt jobs published by the actions.
+
+When the `job_store` setting of the `saltstack` configuration section names
+a SQLite database, every action records its run, and each job it publishes
+(JID, minion, parameters, timestamps), as soon as it is published, then the
+result of each job once collected. A runner that crashed in the middle of an
+experiment can thus reattach to the jobs still in flight to collect or kill
+them, with the configuration and secrets of the experiment, which may set
+the `SALTMASTERS` of the run, or else the `SALTMASTER_*` environment
+variables:
+
+    $ python -m chaossaltstack.jobstore chaos.db pending
+    $ python -m chaossaltstack.jobstore chaos.db collect \\
+        --settings experiment.json
+    $ python -m chaossaltstack.jobstore chaos.db kill \\
+        --settings experiment.json
+
+The store is indexed by run, minion and action, for analysis of past runs:
+
+    $ python -m chaossaltstack.jobstore chaos.db summary
+"""
+import json
+import threading
+from collections import OrderedDict
+from time import time
+from typing import Any, Dict, List
+
+from chaoslib.types import Configuration, Secrets
+
+__all__ = ["JobStore", "get_job_store", "collect_jobs", "kill_jobs"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    action TEXT NOT NULL,
+    parameters TEXT,
+    started REAL NOT NULL,
+    ended REAL,
+    status TEXT NOT NULL DEFAULT 'running'
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    jid TEXT NOT NULL,
+    minion TEXT NOT NULL,
+    action TEXT NOT NULL,
+    parameters TEXT,
+    dispatched REAL NOT NULL,
+    scheduled REAL,
+    collected REAL,
+    success INTEGER,
+    result TEXT,
+    PRIMARY KEY (jid, minion)
+);
+CREATE INDEX IF NOT EXISTS jobs_run ON jobs (run_id);
+CREATE INDEX IF NOT EXISTS jobs_minion ON jobs (minion, dispatched);
+CREATE INDEX IF NOT EXISTS jobs_action ON jobs (action, dispatched);
+CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (jid) WHERE collected IS NULL;
+"""
+
+_stores = {}  # type: Dict[str, JobStore]
+_stores_lock = threading.Lock()
+
+
+class JobStore:
+    """
+    SQLite database of runs and jobs, safe to share between threads.
+
+    Every write is committed right away so that nothing is lost when the
+    process dies, in write-ahead logging mode to keep that cheap.
+    """
+    def __init__(self, path: str):
+        # imported here, only activities configured with a store need it
+        import sqlite3
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(_SCHEMA)
+
+    def start_run(self, action: str, parameters: Dict[str, Any] = None
+                  ) -> int:
+        """
+        Record the start of an action and return its run id.
+        """
+        return self._write(
+            "INSERT INTO runs (action, parameters, started) VALUES (?, ?, ?)",
+            (action, _dumps(parameters), time())).lastrowid
+
+    def end_run(self, run_id: int, status: str = "completed"):
+        """
+        Record the end of a run, unless it already ended.
+        """
+        self._write(
+            "UPDATE runs SET ended = ?, status = ? "
+            "WHERE id = ? AND ended IS NULL", (time(), status, run_id))
+
+    def record_dispatch(self, run_id: int, action: str, minion: str,
+                        jid: str, parameters: Dict[str, Any] = None,
+                        scheduled: float = None):
+        self._write(
+            "INSERT OR REPLACE INTO jobs (run_id, jid, minion, action, "
+            "parameters, dispatched, scheduled) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (run_id, str(jid), minion, action, _dumps(parameters), time(),
+             scheduled))
+
+    def record_result(self, jid: str, minion: str, success: bool,
+                      result: Any):
+        self._write(
+            "UPDATE jobs SET collected = ?, success = ?, result = ? "
+            "WHERE jid = ? AND minion = ?",
+            (time(), int(bool(success)), _dumps(result), str(jid), minion))
+
+    def pending(self, run_id: int = None) -> List[Dict[str, Any]]:
+        """
+        Return the jobs whose result was never collected.
+        """
+        query = "SELECT * FROM jobs WHERE collected IS NULL"
+        args = ()
+        if run_id is not None:
+            query += " AND run_id = ?"
+            args = (run_id,)
+        return self._read(query + " ORDER BY dispatched", args)
+
+    def jobs(self, run_id: int = None, minion: str = None,
+             action: str = None, since: float = None,
+             failed: bool = None) -> List[Dict[str, Any]]:
+        """
+        Return the jobs matching all the given criteria.
+        """
+        clauses, args = [], []
+        for column, value in (("run_id", run_id), ("minion", minion),
+                              ("action", action)):
+            if value is not None:
+                clauses.append("{} = ?".format(column))
+                args.append(value)
+        if since is not None:
+            clauses.append("dispatched >= ?")
+            args.append(since)
+        if failed is not None:
+            clauses.append("success = ?")
+            args.append(0 if failed else 1)
+        query = "SELECT * FROM jobs"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        return self._read(query + " ORDER BY dispatched", args)
+
+    def summary(self, since: float = None) -> List[Dict[str, Any]]:
+        """
+        Count the jobs, failures and pending jobs of each action, with the
+        mean and max seconds from dispatch to collection.
+        """
+        return self._read(
+            "SELECT action, COUNT(*) AS jobs, "
+            "SUM(success = 0) AS failures, "
+            "SUM(collected IS NULL) AS pending, "
+            "AVG(collected - dispatched) AS mean_seconds, "
+            "MAX(collected - dispatched) AS max_seconds "
+            "FROM jobs WHERE dispatched >= ? GROUP BY action ORDER BY action",
+            (since or 0,))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _write(self, query: str, args: tuple):
+        with self._lock:
+            cursor = self._db.execute(query, args)
+            self._db.commit()
+            return cursor
+
+    def _read(self, query: str, args) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute(query, tuple(args)).fetchall()
+        return [dict(row) for row in rows]
+
+
+def get_job_store(settings: Dict[str, Any] = None) -> JobStore:
+    """
+    Return the process-wide store at the `job_store` path of the given
+    `saltstack` configuration settings, `None` when it is not set.
+    """
+    path = (settings or {}).get("job_store")
+    if not path:
+        return None
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = JobStore(path)
+        return store
+
+
+def collect_jobs(store: JobStore, run_id: int = None,
+                 secrets: Secrets = None,
+                 configuration: Configuration = None) -> Dict[str, Any]:
+    """
+    Look the pending jobs up on the Salt Master and record the results of
+    those which returned, ending the runs left with no pending job. Returns
+    the results collected, by minion.
+    """
+    from . import saltstack_api_client
+    from .chunking import split_jid
+
+    client = saltstack_api_client(secrets, configuration)
+    pending = store.pending(run_id)
+    collected = dict()
+    for jid, minions in _by_jid(pending).items():
+        # a job published in chunks or on several masters is looked up on
+        # each, its results recorded under the JID it was stored with
+        for master_job in split_jid(jid):
+            statuses = dict(client.iter_async_cmd_exit_success(master_job))
+            for minion, result in client.iter_async_cmd_result(master_job):
+                if minion not in minions:
+                    continue
+                success = statuses.get(minion, False) and \
+                    'fail' not in str(result)
+                store.record_result(jid, minion, success, result)
+                collected[minion] = result
+    _end_runs(store, pending, "completed")
+    return collected
+
+
+def kill_jobs(store: JobStore, run_id: int = None, secrets: Secrets = None,
+              configuration: Configuration = None) -> Dict[str, Any]:
+    """
+    Kill the pending jobs on their minions with `saltutil.kill_job`, each
+    of the jobs published in chunks or on several masters separately, and
+    record them as failed with a `killed` result, ending their runs.
+    Returns what each minion answered, by JID as published on the masters.
+    """
+    from . import saltstack_api_client
+    from .chunking import split_jid
+
+    client = saltstack_api_client(secrets, configuration)
+    pending = store.pending(run_id)
+    killed = dict()
+    for jid, minions in _by_jid(pending).items():
+        for master_job in split_jid(jid):
+            killed[master_job] = client.run_cmd(
+                sorted(minions), 'saltutil.kill_job', master_job)
+        for minion in minions:
+            store.record_result(jid, minion, False, "killed")
+    _end_runs(store, pending, "killed")
+    return killed
+
+
+###############################################################################
+# Private functions
+###############################################################################
+def _dumps(value: Any) -> str:
+    return None if value is None else json.dumps(value, default=str)
+
+
+def _by_jid(jobs: List[Dict[str, Any]]):
+    by_jid = OrderedDict()
+    for job in jobs:
+        by_jid.setdefault(job["jid"], set()).add(job["minion"])
+    return by_jid
+
+
+def _end_runs(store: JobStore, jobs: List[Dict[str, Any]], status: str):
+    """
+    End the runs of the given jobs which have no pending job left.
+    """
+    for run_id in sorted(set(job["run_id"] for job in jobs)):
+        if not store.pending(run_id):
+            store.end_run(run_id, status)
+
+
+def _load_settings(path: str):
+    """
+    Read the `configuration` and `secrets` of a JSON file, such as the
+    experiment itself, resolved as the experiment would resolve them. The
+    activities get the `saltstack` scope of the secrets.
+    """
+    from chaoslib.configuration import load_configuration
+    from chaoslib.secret import load_secrets
+
+    with open(path) as f:
+        document = json.load(f)
+    configuration = load_configuration(document.get("configuration") or {})
+    secrets = load_secrets(document.get("secrets") or {}, configuration)
+    return configuration, secrets.get("saltstack")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m chaossaltstack.jobstore")
+    parser.add_argument("db")
+    parser.add_argument("command",
+                        choices=["pending", "collect", "kill", "summary"])
+    parser.add_argument("run_id", nargs="?", type=int)
+    parser.add_argument(
+        "--settings", metavar="JSON",
+        help="file with the configuration and secrets to reach the masters, "
+             "the experiment for instance")
+    args = parser.parse_args()
+    config, secret = _load_settings(args.settings) if args.settings \
+        else (None, None)
+    job_store = JobStore(args.db)
+    if args.command == "pending":
+        output = job_store.pending(args.run_id)
+    elif args.command == "collect":
+        output = collect_jobs(job_store, args.run_id, secret, config)
+    elif args.command == "kill":
+        output = kill_jobs(job_store, args.run_id, secret, config)
+    else:
+        output = job_store.summary()
+    print(json.dumps(output, indent=2, default=str))
@@ -1,27 +1,58 @@
 # -*- coding: utf-8 -*-
+import hashlib
 import os
 import json
-from time import sleep
-from typing import List
+import re
+from collections import OrderedDict
+from time import sleep, time
+from typing import Any, Callable, Dict, Iterator, List, Tuple
 
 from chaoslib.exceptions import FailedActivity
 from chaoslib.types import Configuration, Secrets
-from logzero import logger
 
-from .. import saltstack_api_client
+from .. import __logger__, get_settings, saltstack_api_client
+from ..chunking import target_list
+from ..jobstore import get_job_store
+from ..metrics import activity_metrics, configure_metrics, phase, \
+    record_script
+from ..tracing import span, traced
 from ..types import SaltStackResponse
 from .constants import OS_LINUX, OS_WINDOWS
+from .detached import ExperimentRun, register, remaining
+from .schedule import parse_timing, plan_schedule, schedule_script
+from .sampler import parse_samples, sample_script
 from .constants import BURN_CPU, FILL_DISK, NETWORK_UTIL, \
-    BURN_IO, KILLALL_PROCESSES, KILL_PROCESS
+    BURN_IO, KILLALL_PROCESSES, KILL_PROCESS, COMPOSITE, ROLLBACK
+from .composite import FAULTS, fault_parameters, parse_faults, \
+    render_composite
+from .preflight import check_mode, missing_commands, requirements
+from .parallel import parallel_specs, run_specs
+from .parameters import burn_cpu_parameters, burn_io_parameters, \
+    fill_disk_parameters, network_advanced_parameters, \
+    network_loss_parameters, network_corruption_parameters, \
+    network_latency_parameters, killall_processes_parameters, \
+    kill_process_parameters
+from .status import check_result_mode, log_command, new_log_token, \
+    status_script
 
 
 __all__ = ["burn_cpu", "fill_disk", "network_latency", "burn_io",
            "network_loss", "network_corruption", "network_advanced",
-           "killall_processes", "kill_process"]
+           "killall_processes", "kill_process", "run_faults", "rollback",
+           "run_parallel"]
 
+# stands for the minion id in scripts rendered by the minions
+JINJA_MINION_ID = "__chaossaltstack_minion_id__"
 
+# what the rollback script reports for each thing it cleaned
+_CLEANED = re.compile(r"^chaossaltstack-cleaned (.+)$", re.MULTILINE)
+
+
+@traced
 def burn_cpu(instance_ids: List[str] = None,
              execution_duration: str = "60",
+             utilisation: int = 100,
+             detached: bool = False,
              configuration: Configuration = None,
              secrets: Secrets = None) -> SaltStackResponse:
     """
@@ -35,31 +66,41 @@ def burn_cpu(instance_ids: List[str] = None,
     execution_duration : str, optional
         Duration of the stress test (in seconds) that generates high CPU usage.
         Defaults to 60 seconds.
+    utilisation : int, optional
+        Percentage of each processor to use, from 1 to 100. Defaults to 100.
+    detached : bool, optional
+        Publish the jobs and return right away with a handle, for the
+        `await_detached` probe to collect their results later. Defaults to
+        False.
     configuration : Configuration
         Chaostoolkit Configuration
     secrets : Secrets
         Chaostoolkit Secrets
     """
 
-    logger.debug(
+    __logger__().debug(
         "Start burn_cpu: configuration='{}', instance_ids='{}'".format(
             configuration, instance_ids))
 
     param = dict()
     param["duration"] = execution_duration
+    param.update(burn_cpu_parameters(utilisation))
 
     return __default_salt_experiment__(instance_ids=instance_ids,
                                        execution_duration=execution_duration,
                                        param=param,
                                        experiment_type=BURN_CPU,
                                        configuration=configuration,
-                                       secrets=secrets
+                                       secrets=secrets,
+                                       detached=detached
                                        )
 
 
+@traced
 def fill_disk(instance_ids: List[str] = None,
               execution_duration: str = "120",
               size: str = "1000",
+              detached: bool = False,
               configuration: Configuration = None,
               secrets: Secrets = None) -> SaltStackResponse:
     """
@@ -74,31 +115,38 @@ def fill_disk(instance_ids: List[str] = None,
         Lifetime of the file created. Defaults to 120 seconds.
     size : str
         Size of the file created on the disk. Defaults to 1GB.
+    detached : bool, optional
+        Publish the jobs and return right away with a handle, for the
+        `await_detached` probe to collect their results later. Defaults to
+        False.
     configuration : Configuration
         Chaostoolkit Configuration
     secrets : Secrets
         Chaostoolkit Secrets
     """
 
-    logger.debug(
+    __logger__().debug(
         "Start fill_disk: configuration='{}', instance_ids='{}'".format(
             configuration, instance_ids))
 
     param = dict()
     param["execution_duration"] = execution_duration
-    param["size"] = size
+    param.update(fill_disk_parameters(size))
 
     return __default_salt_experiment__(instance_ids=instance_ids,
                                        execution_duration=execution_duration,
                                        param=param,
                                        experiment_type=FILL_DISK,
                                        configuration=configuration,
-                                       secrets=secrets
+                                       secrets=secrets,
+                                       detached=detached
                                        )
 
 
+@traced
 def burn_io(instance_ids: List[str] = None,
             execution_duration: str = "60",
+            detached: bool = False,
             configuration: Configuration = None,
             secrets: Secrets = None) -> SaltStackResponse:
     """
@@ -111,32 +159,40 @@ def burn_io(instance_ids: List[str] = None,
         the subscription will be selected as potential chaos candidates.
     execution_duration : str, optional
         Lifetime of the file created. Defaults to 120 seconds.
+    detached : bool, optional
+        Publish the jobs and return right away with a handle, for the
+        `await_detached` probe to collect their results later. Defaults to
+        False.
     configuration : Configuration
         Chaostoolkit Configuration
     secrets : Secrets
         Chaostoolkit Secrets
     """
 
-    logger.debug(
+    __logger__().debug(
         "Start burn_io: configuration='{}', instance_ids='{}'".format(
             configuration, instance_ids))
 
     param = dict()
     param["duration"] = execution_duration
+    param.update(burn_io_parameters())
 
     return __default_salt_experiment__(instance_ids=instance_ids,
                                        execution_duration=execution_duration,
                                        param=param,
                                        experiment_type=BURN_IO,
                                        configuration=configuration,
-                                       secrets=secrets
+                                       secrets=secrets,
+                                       detached=detached
                                        )
 
 
+@traced
 def network_advanced(instance_ids: List[str] = None,
                      execution_duration: str = "60",
                      command: str = "",
                      device: str = "eth0",
+                     detached: bool = False,
                      configuration: Configuration = None,
                      secrets: Secrets = None) -> SaltStackResponse:
     """
@@ -152,34 +208,40 @@ def network_advanced(instance_ids: List[str] = None,
         Lifetime of the file created. Defaults to 60 seconds.
     command : str
         the tc command, e.g.  loss 15%
+    detached : bool, optional
+        Publish the jobs and return right away with a handle, for the
+        `await_detached` probe to collect their results later. Defaults to
+        False.
     configuration : Configuration
         Chaostoolkit Configuration
     secrets : Secrets
         Chaostoolkit Secrets
     """
 
-    logger.debug(
+    __logger__().debug(
         "Start network_advanced: configuration='{}', instance_ids='{}'".format(
             configuration, instance_ids))
 
     param = dict()
     param["duration"] = execution_duration
-    param["param"] = command
-    param["device"] = device
+    param.update(network_advanced_parameters(command, device))
 
     return __default_salt_experiment__(instance_ids=instance_ids,
                                        execution_duration=execution_duration,
                                        param=param,
                                        experiment_type=NETWORK_UTIL,
                                        configuration=configuration,
-                                       secrets=secrets
+                                       secrets=secrets,
+                                       detached=detached
                                        )
 
 
+@traced
 def network_loss(instance_ids: List[str] = None,
                  execution_duration: str = "60",
                  loss_ratio: str = "5%",
                  device: str = "eth0",
+                 detached: bool = False,
                  configuration: Configuration = None,
                  secrets: Secrets = None) -> SaltStackResponse:
     """
@@ -195,34 +257,40 @@ def network_loss(instance_ids: List[str] = None,
         Lifetime of the file created. Defaults to 60 seconds.
     loss_ratio : str:
         loss_ratio = "30%"
+    detached : bool, optional
+        Publish the jobs and return right away with a handle, for the
+        `await_detached` probe to collect their results later. Defaults to
+        False.
     configuration : Configuration
         Chaostoolkit Configuration
     secrets : Secrets
         Chaostoolkit Secrets
     """
 
-    logger.debug(
+    __logger__().debug(
         "Start network_advanced: configuration='{}', instance_ids='{}'".format(
             configuration, instance_ids))
 
     param = dict()
     param["duration"] = execution_duration
-    param["param"] = "loss " + loss_ratio
-    param["device"] = device
+    param.update(network_loss_parameters(loss_ratio, device))
     
     return __default_salt_experiment__(instance_ids=instance_ids,
                                        execution_duration=execution_duration,
                                        param=param,
                                        experiment_type=NETWORK_UTIL,
                                        configuration=configuration,
-                                       secrets=secrets
+                                       secrets=secrets,
+                                       detached=detached
                                        )
 
 
+@traced
 def network_corruption(instance_ids: List[str] = None,
                        execution_duration: str = "60",
                        corruption_ratio: str = "5%",
                        device: str = "eth0",
+                       detached: bool = False,
                        configuration: Configuration = None,
                        secrets: Secrets = None) -> SaltStackResponse:
     """
@@ -238,20 +306,23 @@ def network_corruption(instance_ids: List[str] = None,
         Lifetime of the file created. Defaults to 60 seconds.
     corruption_ratio : str:
         corruption_ratio = "30%"
+    detached : bool, optional
+        Publish the jobs and return right away with a handle, for the
+        `await_detached` probe to collect their results later. Defaults to
+        False.
     configuration : Configuration
         Chaostoolkit Configuration
     secrets : Secrets
         Chaostoolkit Secrets
     """
 
-    logger.debug(
+    __logger__().debug(
         "Start network_corruption: configuration='{}', "
         "instance_ids='{}'".format(configuration, instance_ids))
 
     param = dict()
     param["duration"] = execution_duration
-    param["param"] = "corrupt " + corruption_ratio
-    param["device"] = device
+    param.update(network_corruption_parameters(corruption_ratio, device))
 
 
     return __default_salt_experiment__(instance_ids=instance_ids,
@@ -259,16 +330,19 @@ def network_corruption(instance_ids: List[str] = None,
                                        param=param,
                                        experiment_type=NETWORK_UTIL,
                                        configuration=configuration,
-                                       secrets=secrets
+                                       secrets=secrets,
+                                       detached=detached
                                        )
 
 
+@traced
 def network_latency(instance_ids: List[str] = None,
                     execution_duration: str = "60",
                     delay: str = "1000ms",
                     variance: str = "500ms",
                     ratio: str = "",
                     device: str = "eth0",
+                    detached: bool = False,
                     configuration: Configuration = None,
                     secrets: Secrets = None) -> SaltStackResponse:
     """
@@ -288,32 +362,38 @@ def network_latency(instance_ids: List[str] = None,
     ratio: str = "5%", optional
         the specific ratio of how many Variance of the delay in ms.
         Defaults to "".
+    detached : bool, optional
+        Publish the jobs and return right away with a handle, for the
+        `await_detached` probe to collect their results later. Defaults to
+        False.
     configuration : Configuration
         Chaostoolkit Configuration
     secrets : Secrets
         Chaostoolkit Secrets
     """
-    logger.debug(
+    __logger__().debug(
         "Start network_latency: configuration='{}', instance_ids='{}'".format(
             configuration, instance_ids))
 
     param = dict()
     param["duration"] = execution_duration
-    param["param"] = "delay " + delay + " " + variance + " " + ratio
-    param["device"] = device
+    param.update(network_latency_parameters(delay, variance, ratio, device))
 
     return __default_salt_experiment__(instance_ids=instance_ids,
                                        execution_duration=execution_duration,
                                        param=param,
                                        experiment_type=NETWORK_UTIL,
                                        configuration=configuration,
-                                       secrets=secrets
+                                       secrets=secrets,
+                                       detached=detached
                                        )
 
 
+@traced
 def killall_processes(instance_ids: List[str] = None,
                       execution_duration: str = "60",
                       process_name: str = None,
+                      detached: bool = False,
                       configuration: Configuration = None,
                       signal: str = "",
                       secrets: Secrets = None) -> SaltStackResponse:
@@ -335,32 +415,38 @@ def killall_processes(instance_ids: List[str] = None,
         Name of the process to be killed
     signal : str , default to ""
         The signal of killall command, e.g. use -9 to force kill
+    detached : bool, optional
+        Publish the jobs and return right away with a handle, for the
+        `await_detached` probe to collect their results later. Defaults to
+        False.
     configuration : Configuration
         Chaostoolkit Configuration
     secrets : Secrets
         Chaostoolkit Secrets
     """
-    logger.debug(
+    __logger__().debug(
         "Start network_latency: configuration='{}', instance_ids='{}'".format(
             configuration, instance_ids))
 
     param = dict()
     param["duration"] = execution_duration
-    param["process_name"] = process_name
-    param["signal"] = signal
+    param.update(killall_processes_parameters(process_name, signal))
 
     return __default_salt_experiment__(instance_ids=instance_ids,
                                        execution_duration=execution_duration,
                                        param=param,
                                        experiment_type=KILLALL_PROCESSES,
                                        configuration=configuration,
-                                       secrets=secrets
+                                       secrets=secrets,
+                                       detached=detached
                                        )
 
 
+@traced
 def kill_process(instance_ids: List[str] = None,
                  execution_duration: str = "60",
                  process: str = None,
+                 detached: bool = False,
                  configuration: Configuration = None,
                  signal: str = "",
                  secrets: Secrets = None) -> SaltStackResponse:
@@ -383,29 +469,214 @@ def kill_process(instance_ids: List[str] = None,
         pid or process that kill command accepts
     signal : str , default to ""
         The signal of kill command, use kill -l for help
+    detached : bool, optional
+        Publish the jobs and return right away with a handle, for the
+        `await_detached` probe to collect their results later. Defaults to
+        False.
     configuration : Configuration
         Chaostoolkit Configuration
     secrets : Secrets
         Chaostoolkit Secrets
     """
-    logger.debug(
+    __logger__().debug(
         "Start network_latency: configuration='{}', instance_ids='{}'".format(
             configuration, instance_ids))
 
     param = dict()
     param["duration"] = execution_duration
-    param["process_name"] = process
-    param["signal"] = signal
+    param.update(kill_process_parameters(process, signal))
 
     return __default_salt_experiment__(instance_ids=instance_ids,
                                        execution_duration=execution_duration,
                                        param=param,
                                        experiment_type=KILL_PROCESS,
                                        configuration=configuration,
-                                       secrets=secrets
+                                       secrets=secrets,
+                                       detached=detached
+                                       )
+
+
+@traced
+def run_faults(faults: List[Dict[str, Any]],
+               instance_ids: List[str] = None,
+               execution_duration: str = "60",
+               detached: bool = False,
+               configuration: Configuration = None,
+               secrets: Secrets = None) -> SaltStackResponse:
+    """
+    Inject several faults together, with a single job per machine running
+    them concurrently for the same duration.
+
+    Parameters
+    ----------
+    faults : List[Dict[str, Any]]
+        The faults to inject, each naming one of the other actions of this
+        module and its arguments, for instance
+        `{"action": "network_latency", "arguments": {"delay": "300ms"}}`.
+        `execution_duration` is shared by all of them.
+    instance_ids : List[str]
+        Filter the virtual machines. If the filter is omitted all machines in
+        the subscription will be selected as potential chaos candidates.
+    execution_duration : str, optional
+        Duration of the faults (in seconds). Defaults to 60 seconds.
+    detached : bool, optional
+        Publish the jobs and return right away with a handle, for the
+        `await_detached` probe to collect their results later. Defaults to
+        False.
+    configuration : Configuration
+        Chaostoolkit Configuration
+    secrets : Secrets
+        Chaostoolkit Secrets
+
+    The faults still running when the job ends or is killed are stopped and
+    what they changed is reverted. The result of each fault on each machine
+    is returned under the `_faults` key.
+    """
+    __logger__().debug(
+        "Start run_faults: configuration='{}', instance_ids='{}'".format(
+            configuration, instance_ids))
+
+    specs = fault_parameters(faults)
+    settings = get_settings(configuration)
+
+    def render(os_type: str, param: Dict[str, str]) -> str:
+        scripts, parameters = [], []
+        for _, script, fault_param in specs:
+            fault_param = dict(fault_param)
+            fault_param["duration"] = param["duration"]
+            fault_param["instance_id"] = param["instance_id"]
+            scripts.append((script, __construct_script_content__(
+                script, os_type, fault_param,
+                minify=settings.get("minify_scripts", False))))
+            parameters.append(fault_param)
+        return render_composite(scripts, os_type, parameters)
+
+    param = dict()
+    param["duration"] = execution_duration
+    param["faults"] = [name for name, _, _ in specs]
+
+    return __default_salt_experiment__(instance_ids=instance_ids,
+                                       execution_duration=execution_duration,
+                                       param=param,
+                                       experiment_type=COMPOSITE,
+                                       configuration=configuration,
+                                       secrets=secrets,
+                                       detached=detached,
+                                       render=render,
+                                       faults=param["faults"]
                                        )
 
 
+@traced
+def rollback(instance_ids: List[str] = None,
+             configuration: Configuration = None,
+             secrets: Secrets = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Revert what the faults of this module may have left behind, whether
+    their jobs completed, failed or were killed: stop the fault processes
+    still running, delete the netem and tbf root qdiscs and the files
+    written by `burn_io` and `fill_disk`. Safe to run any number of times,
+    with a single call per OS to all the machines.
+
+    Parameters
+    ----------
+    instance_ids : List[str]
+        Filter the virtual machines. If the filter is omitted all machines in
+        the subscription will be selected as potential chaos candidates.
+    configuration : Configuration
+        Chaostoolkit Configuration
+    secrets : Secrets
+        Chaostoolkit Secrets
+
+    Returns, for each machine, whether the rollback ran (`success`) and
+    what it `cleaned`, empty when there was nothing left to clean.
+    """
+    __logger__().debug(
+        "Start rollback: configuration='{}', instance_ids='{}'".format(
+            configuration, instance_ids))
+
+    settings = get_settings(configuration)
+    with activity_metrics(ROLLBACK) as metrics:
+        try:
+            configure_metrics(settings)
+            instance_ids = target_list(instance_ids)
+            client = saltstack_api_client(secrets, configuration)
+            with phase("resolve"), span("chaossaltstack.resolve") as s:
+                machines = client.get_grains_get(instance_ids, 'kernel')
+                s.set_attribute("salt.minions", len(machines))
+
+            if len(machines) <= 0:
+                raise FailedActivity(
+                    "Cannot find any machines {}".format(instance_ids))
+
+            by_os = OrderedDict()
+            for k, os_type in machines.items():
+                by_os.setdefault(os_type, []).append(k)
+
+            response = OrderedDict(
+                (k, {"success": False, "cleaned": []}) for k in machines)
+            with phase("dispatch"), span("chaossaltstack.dispatch"):
+                for os_type, minions in by_os.items():
+                    script_content = __construct_script_content__(
+                        ROLLBACK, os_type, {},
+                        minify=settings.get("minify_scripts", False))
+                    kwarg = {'shell': 'powershell'} \
+                        if os_type == OS_WINDOWS else None
+                    for k, result in client.iter_run_cmd(
+                            minions, 'cmd.run', script_content,
+                            kwarg=kwarg):
+                        if k in response and isinstance(result, str):
+                            response[k] = {
+                                "success": "rollback -> success" in result,
+                                "cleaned": _CLEANED.findall(result)
+                            }
+        except Exception as x:
+            raise FailedActivity(
+                "failed issuing a execute of shell script via salt API " +
+                str(x)
+            )
+    if settings.get("metrics_summary"):
+        response["_metrics"] = metrics.summary()
+    return response
+
+
+@traced
+def run_parallel(actions: List[Dict[str, Any]],
+                 configuration: Configuration = None,
+                 secrets: Secrets = None) -> Dict[str, SaltStackResponse]:
+    """
+    Run several actions of this module at the same time, each on its own
+    group of machines, for instance latency on the caches while the CPUs of
+    the application nodes burn.
+
+    Parameters
+    ----------
+    actions : List[Dict[str, Any]]
+        The actions to run, each naming one of the other actions of this
+        module, the machines it targets and its arguments, for instance
+        `{"action": "burn_cpu", "instance_ids": ["app-1", "app-2"],
+        "arguments": {"execution_duration": "60"}}`. A `name` tells apart
+        several specs of the same action. The `instance_ids` of the specs
+        must be disjoint.
+    configuration : Configuration
+        Chaostoolkit Configuration
+    secrets : Secrets
+        Chaostoolkit Secrets
+
+    The actions share the client of the process, and so the limits on
+    salt-api requests of the configuration. Returns the result of each
+    action by name once they are all done, and fails if any of them did.
+    """
+    __logger__().debug(
+        "Start run_parallel: configuration='{}', actions='{}'".format(
+            configuration, [a.get("action") for a in actions or []]))
+
+    specs = parallel_specs(actions, dict(
+        (name, globals()[name]) for name in __all__
+        if name != "run_parallel"))
+    return run_specs(specs, configuration, secrets)
+
+
 ###############################################################################
 # Private helper functions
 ###############################################################################
@@ -414,58 +685,299 @@ def __default_salt_experiment__(instance_ids: List[str] = None,
                                 param: dict = None,
                                 experiment_type: str = None,
                                 configuration: Configuration = None,
-                                secrets: Secrets = None
+                                secrets: Secrets = None,
+                                detached: bool = False,
+                                render: Callable[[str, Dict[str, str]],
+                                                 str] = None,
+                                faults: List[str] = None
                                 ) -> SaltStackResponse:
-    response = dict()
-    try:
-        client = saltstack_api_client(secrets)
-        machines = client.get_grains_get(instance_ids, 'kernel')
+    settings = get_settings(configuration)
+    run = None
+    with activity_metrics(experiment_type) as metrics:
+        try:
+            configure_metrics(settings)
+            instance_ids = target_list(instance_ids)
+            client = saltstack_api_client(secrets, configuration)
+            run = ExperimentRun(experiment_type, client, param,
+                                get_job_store(settings))
+            run.faults = faults
+            with phase("resolve"), span("chaossaltstack.resolve") as s:
+                machines = client.get_grains_get(instance_ids, 'kernel')
+                s.set_attribute("salt.minions", len(machines))
+
+            if len(machines) <= 0:
+                raise FailedActivity(
+                    "Cannot find any machines {}".format(instance_ids))
+
+            if settings.get("preflight"):
+                machines = __preflight__(
+                    run, client, machines, experiment_type, settings)
+
+            # Publish the jobs in the order they are scheduled to start
+            schedule = run.schedule = plan_schedule(
+                settings, list(machines), int(execution_duration))
+            if schedule is not None:
+                machines = OrderedDict((k, machines[k]) for k in schedule)
+            late = 0.0
+
+            template = settings.get("template")
+            if template not in (None, "jinja"):
+                raise FailedActivity(
+                    "Unsupported template '{}'".format(template))
+            if settings.get("sample_interval"):
+                run.sample_interval = float(settings["sample_interval"])
+            if check_result_mode(
+                    settings.get("result_mode", "full")) == "status":
+                run.log_token = new_log_token()
+
+            with phase("dispatch"), span("chaossaltstack.dispatch") as s:
+                # Minions given the same script share a single job
+                payloads = OrderedDict()
+                scripts = dict()
+                for k, v in machines.items():
+                    os_type = run.os_types[k] = v
+                    param["instance_id"] = JINJA_MINION_ID \
+                        if template else k
+                    if schedule is not None and "duration" in param:
+                        param["duration"] = str(schedule[k][1])
+                    key = (os_type, json.dumps(param, sort_keys=True))
+                    script_content = scripts.get(key)
+                    if script_content is None:
+                        if render is not None:
+                            script_content = render(os_type, param)
+                        else:
+                            script_content = __construct_script_content__(
+                                experiment_type, os_type, param,
+                                minify=settings.get("minify_scripts", False))
+                        if run.log_token is not None:
+                            script_content = status_script(
+                                script_content, os_type, run.log_token)
+                        scripts[key] = script_content
+                    if schedule is not None:
+                        script_content = schedule_script(
+                            script_content, os_type, schedule[k][0])
+                    if run.sample_interval is not None:
+                        script_content = sample_script(
+                            script_content, os_type, run.sample_interval)
+                    if template:
+                        script_content = __jinja_script__(script_content)
+                    digest = hashlib.sha256(
+                        (os_type + script_content).encode("utf-8")
+                    ).hexdigest()
+                    payload = payloads.setdefault(
+                        digest, (script_content, os_type, OrderedDict()))
+                    payload[2][k] = dict(param)
+
+                for script_content, os_type, minions in payloads.values():
+                    # Do async cmd and get jid
+                    __logger__().debug("{0} of machines: {1}".format(
+                        experiment_type, ", ".join(minions)))
+                    salt_method = 'cmd.run'
+                    kwarg = dict()
+                    if template:
+                        kwarg['template'] = template
+                    if os_type == OS_WINDOWS:
+                        kwarg['shell'] = 'powershell'
+                    target = list(minions)
+                    if len(minions) == 1 and not template:
+                        target = target[0]
+                    if kwarg:
+                        jid = client.async_run_cmd(
+                            target, salt_method, script_content, kwarg=kwarg)
+                    else:
+                        jid = client.async_run_cmd(
+                            target, salt_method, script_content)
+                    for k, minion_param in minions.items():
+                        if schedule is not None:
+                            late = max(late, time() - schedule[k][0])
+                        run.dispatched(k, jid, minion_param)
+                if s.is_recording():
+                    s.set_attribute("salt.minions", len(run.jids))
+                    s.set_attribute(
+                        "salt.jids", sorted(set(run.jids.values())))
+            __logger__().debug("SaltStack return jids:\n{}".format(
+                json.dumps(run.jids)))
+            run.deadline = time() + int(execution_duration)
+            if schedule is not None:
+                if late > 1:
+                    __logger__().warning(
+                        "Jobs were published up to {:.1f}s after their "
+                        "scheduled start, raise start_margin".format(late))
+                run.deadline = max(
+                    start + length for start, length in schedule.values())
+
+            if detached:
+                response = register(run)
+            else:
+                response = __complete_experiment__(run)
+        except Exception as x:
+            if run is not None:
+                run.end("failed")
+            raise FailedActivity(
+                "failed issuing a execute of shell script via salt API " +
+                str(x)
+            )
+    if settings.get("metrics_summary"):
+        response["_metrics"] = metrics.summary()
+    return response
 
-        jids = dict()
 
-        if len(machines) <= 0:
-            raise FailedActivity(
-                "Cannot find any machines {}".format(instance_ids))
-
-        for k, v in machines.items():
-            name = k
-            os_type = v
-            param["instance_id"] = k
-            script_content = __construct_script_content__(
-                experiment_type, os_type, param)
-
-            # Do async cmd and get jid
-            logger.debug("{0} of machine: {1}".format(experiment_type, name))
-            salt_method = 'cmd.run'
-            jid = client.async_run_cmd(name, salt_method, script_content)
-            jids[k] = jid
-        logger.debug("SaltStack return jids:\n{}".format(json.dumps(jids)))
-        # Wait the duration as well
-        sleep(int(execution_duration))
-
-        # Check result
-        for k, v in jids.items():
-            res = client.async_cmd_exit_success(v)[k]
-            result = client.get_async_cmd_result(v)[k]
+def __preflight__(run: ExperimentRun, client, machines: Dict[str, str],
+                  action: str, settings: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Check that the Linux machines have the commands the action needs, and
+    leave out those which do not, or fail, depending on `preflight`.
+    """
+    mode = check_mode(settings["preflight"])
+    needed = requirements(
+        action, [FAULTS[name][0] for name in run.faults or []],
+        scheduled=any(settings.get(k) for k in (
+            "synchronized_start", "stagger_window", "recovery_window")),
+        sampled=bool(settings.get("sample_interval")))
+    linux = [k for k, v in machines.items() if v == OS_LINUX]
+    if not needed or not linux:
+        return machines
+
+    with phase("preflight"), span("chaossaltstack.preflight") as s:
+        s.set_attribute("salt.minions", len(linux))
+        missing = missing_commands(
+            client, linux, needed, settings.get("preflight_ttl"))
+    if not missing:
+        return machines
+
+    report = "; ".join(
+        "{}: {}".format(k, ", ".join(v)) for k, v in sorted(missing.items()))
+    if mode == "fail":
+        raise FailedActivity(
+            "Missing commands for {} on {}".format(action, report))
+    __logger__().warning(
+        "Leaving out of {} the machines missing commands, {}".format(
+            action, report))
+    run.excluded = missing
+    machines = OrderedDict(
+        (k, v) for k, v in machines.items() if k not in missing)
+    if not machines:
+        raise FailedActivity(
+            "No machine has the commands needed by {}".format(action))
+    return machines
+
+
+def __complete_experiment__(run: ExperimentRun) -> SaltStackResponse:
+    """
+    Wait for the jobs of the run to be done, then collect their results.
+    """
+    response = dict()
+    # Wait the duration as well
+    with phase("wait"), span("chaossaltstack.wait") as s:
+        wait = remaining(run)
+        s.set_attribute("chaossaltstack.duration", wait)
+        sleep(wait)
+
+    # Check result
+    with phase("collect"), span("chaossaltstack.collect") as s:
+        s.set_attribute("salt.minions", len(run.jids))
+        failed = []
+        for k, res, result in __collect_results__(run.client, run.jids):
+            run.collected(k, res, result)
+            response[k] = "Machine {0} : {1} - Console: {2}".format(
+                k, res, result)
+            if not res:
+                failed.append(k)
+        if run.log_token is not None and failed:
+            response["_logs"] = __fetch_logs__(run, failed)
+    if run.faults is not None:
+        response["_faults"] = dict(
+            (k, parse_faults(response[k], run.faults)) for k in run.jids)
+    if run.schedule is not None:
+        response["_timing"] = __timing_report__(run.schedule, response)
+    if run.excluded:
+        response["_preflight"] = {"excluded": run.excluded}
+    if run.sample_interval is not None:
+        samples = dict(
+            (k, parse_samples(response[k])) for k in run.jids)
+        response["_samples"] = dict(
+            (k, v) for k, v in samples.items() if v is not None)
+    run.end()
+    return response
+
+
+def __fetch_logs__(run: ExperimentRun, minions: List[str]
+                   ) -> Dict[str, str]:
+    """
+    Fetch the full output the scripts of the given minions wrote to their
+    log, with a single call per OS.
+    """
+    by_os = OrderedDict()
+    for k in minions:
+        by_os.setdefault(run.os_types[k], []).append(k)
+    logs = dict()
+    for os_type, targets in by_os.items():
+        kwarg = {'shell': 'powershell'} if os_type == OS_WINDOWS else None
+        for k, log in run.client.iter_run_cmd(
+                targets, 'cmd.run', log_command(os_type, run.log_token),
+                kwarg=kwarg):
+            if k in targets:
+                logs[k] = log
+    return logs
+
+
+def __collect_results__(client, jids: Dict[str, str]
+                        ) -> Iterator[Tuple[str, bool, Any]]:
+    """
+    Yield the success and the result of each minion, looking each job up
+    once and consuming the minion returns as they are parsed from the
+    response.
+    """
+    minions_by_jid = OrderedDict()
+    for k, jid in jids.items():
+        minions_by_jid.setdefault(jid, set()).add(k)
+
+    for jid, minions in minions_by_jid.items():
+        statuses = dict(
+            (k, v) for k, v in client.iter_async_cmd_exit_success(jid)
+            if k in minions)
+        missing = set(minions)
+        for k, result in client.iter_async_cmd_result(jid):
+            if k not in minions:
+                continue
+            missing.discard(k)
+            res = statuses.get(k, False)
             if 'fail' in result:
                 res = False
-            response_item = "Machine {0} : {1} - Console: {2}".format(
-                k, res, result)
-            response[k] = response_item
-        return response
-    except Exception as x:
-        raise FailedActivity(
-            "failed issuing a execute of shell script via salt API " + str(x)
-        )
+            yield k, res, result
+        if missing:
+            raise FailedActivity("No result returned by {}".format(
+                ", ".join(sorted(missing))))
 
 
-def __construct_script_content__(action, os_type, parameters):
+def __timing_report__(schedule: Dict[str, Tuple[float, int]],
+                      response: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Gather the scheduled and actual start and stop times printed by the
+    scripts, and how far apart they are across minions.
+    """
+    minions = dict()
+    for k, (start, length) in schedule.items():
+        timing = parse_timing(response.get(k, ""))
+        timing["scheduled"] = start
+        timing["duration"] = length
+        minions[k] = timing
+    report = {"start_at": min(start for start, _ in schedule.values()),
+              "minions": minions}
+    for event, key in (("started", "start_skew"), ("stopped", "stop_skew")):
+        times = [t[event] for t in minions.values() if event in t]
+        report[key] = max(times) - min(times) if times else None
+    return report
+
+
+def __construct_script_content__(action, os_type, parameters,
+                                 minify: bool = False):
 
     if os_type == OS_WINDOWS:
         script_name = action+".ps1"
-        # TODO in ps1
         cmd_param = '\n'.join(
-            ['='.join([k, "'"+v+"'"]) for k, v in parameters.items()])
+            ["$" + k + " = '" + v.replace("'", "''") + "'"
+             for k, v in parameters.items()])
     elif os_type == OS_LINUX:
         script_name = action+".sh"
         cmd_param = '\n'.join(
@@ -480,4 +992,28 @@ def __construct_script_content__(action, os_type, parameters):
         script_content = file.read()
     # merge duration
     script_content = cmd_param + "\n" + script_content
+    raw_size = len(script_content)
+    if minify:
+        script_content = __minify_script__(script_content)
+    record_script(script_name, raw_size, len(script_content))
     return script_content
+
+
+def __jinja_script__(script_content: str) -> str:
+    """
+    Keep the script from being interpreted by the jinja renderer of the
+    minion, except for the minion id.
+    """
+    return "{% raw %}" + script_content.replace(
+        JINJA_MINION_ID, "{% endraw %}{{ grains['id'] }}{% raw %}") + \
+        "{% endraw %}"
+
+
+def __minify_script__(script_content: str) -> str:
+    """
+    Drop blank lines and lines holding only a comment, the same in shell and
+    PowerShell scripts. Lines within here-documents are stripped as well.
+    """
+    return '\n'.join(
+        line for line in script_content.splitlines()
+        if line.strip() and not line.lstrip().startswith('#'))
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Several faults injected together by a single job per minion.
+
+The scripts of the faults are combined into one script per OS which runs
+them concurrently and waits for all of them. Whatever happens, including
+the job being killed, a joint cleanup stops the processes of the faults still
+running and reverts what they may have left behind. The output
+of each fault is printed between markers which `parse_faults()` reads back.
+"""
+import re
+from typing import Any, Dict, List, Tuple
+
+from chaoslib.exceptions import FailedActivity
+
+from .constants import OS_LINUX, OS_WINDOWS, BURN_CPU, BURN_IO, FILL_DISK, \
+    NETWORK_UTIL, KILLALL_PROCESSES, KILL_PROCESS
+from .parameters import burn_cpu_parameters, burn_io_parameters, \
+    fill_disk_parameters, network_advanced_parameters, \
+    network_loss_parameters, network_corruption_parameters, \
+    network_latency_parameters, killall_processes_parameters, \
+    kill_process_parameters
+
+__all__ = ["FAULTS", "fault_parameters", "render_composite", "parse_faults",
+           "FAULT_MARKER"]
+
+FAULT_MARKER = "chaossaltstack-fault"
+
+# script and script parameters of each fault, built and validated as the
+# action of the same name does
+FAULTS = {
+    "burn_cpu": (BURN_CPU, burn_cpu_parameters),
+    "burn_io": (BURN_IO, burn_io_parameters),
+    "fill_disk": (FILL_DISK, fill_disk_parameters),
+    "network_advanced": (NETWORK_UTIL, network_advanced_parameters),
+    "network_loss": (NETWORK_UTIL, network_loss_parameters),
+    "network_corruption": (NETWORK_UTIL, network_corruption_parameters),
+    "network_latency": (NETWORK_UTIL, network_latency_parameters),
+    "killall_processes": (KILLALL_PROCESSES, killall_processes_parameters),
+    "kill_process": (KILL_PROCESS, kill_process_parameters),
+}  # type: Dict[str, tuple]
+
+# scripts writing, then deleting, the same file
+_BURN_FILE = (BURN_IO, FILL_DISK)
+
+# what a Linux fault may leave behind when it is stopped half way
+_LINUX_CLEANUP = {
+    NETWORK_UTIL: "tc qdisc del dev '{device}' root >/dev/null 2>&1",
+    BURN_IO: "rm -f /root/burn /tmp/loop.sh",
+    FILL_DISK: "rm -f /root/burn",
+}
+
+_LINUX_HEADER = """chaos_dir=$(mktemp -d)
+chaos_pids=""
+chaos_kill_tree() {{
+    for c in $(pgrep -P $1); do chaos_kill_tree $c; done
+    kill $1 2>/dev/null
+    kill -CONT $1 2>/dev/null
+}}
+chaos_cleanup() {{
+    for p in $chaos_pids; do chaos_kill_tree $p; done
+    wait
+{cleanup}
+    rm -rf "$chaos_dir"
+}}
+trap chaos_cleanup 0
+trap 'exit 143' INT TERM
+"""
+_LINUX_FAULT = """(
+{script}
+) > "$chaos_dir/{index}" 2>&1 &
+chaos_pids="$chaos_pids $!"
+"""
+_LINUX_FOOTER = """chaos_status=0
+i=0
+for p in $chaos_pids; do
+    i=$((i + 1))
+    wait $p
+    rc=$?
+    [ $rc -eq 0 ] || chaos_status=$rc
+    echo "{marker} $i begin"
+    cat "$chaos_dir/$i"
+    echo "{marker} $i end exit=$rc"
+done
+exit $chaos_status"""
+
+_WINDOWS_HEADER = """$chaos_jobs = @()
+try {
+"""
+_WINDOWS_FAULT = "    $chaos_jobs += Start-Job -ScriptBlock " \
+    """([scriptblock]::Create(@'
+{script}
+'@))
+"""
+_WINDOWS_FOOTER = """    Wait-Job -Job $chaos_jobs | Out-Null
+    for ($i = 0; $i -lt $chaos_jobs.Count; $i++) {{
+        Write-Output "{marker} $($i + 1) begin"
+        Receive-Job -Job $chaos_jobs[$i] 2>&1
+        $rc = [int]($chaos_jobs[$i].State -ne 'Completed')
+        Write-Output "{marker} $($i + 1) end exit=$rc"
+    }}
+}} finally {{
+    $chaos_jobs | Stop-Job -PassThru | Remove-Job -Force
+}}"""
+
+_FAULT = re.compile(
+    r"{0} (\d+) begin\n(.*?)\n?{0} \1 end exit=(\d+)".format(FAULT_MARKER),
+    re.DOTALL)
+
+
+def fault_parameters(faults: List[Dict[str, Any]]
+                     ) -> List[Tuple[str, str, Dict[str, str]]]:
+    """
+    Validate fault specs, such as
+    `{"action": "network_latency", "arguments": {"delay": "300ms"}}`, and
+    return the name, the script and the script parameters of each.
+    """
+    if not faults:
+        raise FailedActivity("No fault to inject")
+    result = []
+    devices = set()
+    burn_file = None
+    for fault in faults:
+        name = fault.get("action")
+        if name not in FAULTS:
+            raise FailedActivity(
+                "Unknown fault '{}', expected one of {}".format(
+                    name, ", ".join(sorted(FAULTS))))
+        script, build = FAULTS[name]
+        try:
+            param = build(**(fault.get("arguments") or {}))
+        except TypeError as x:
+            raise FailedActivity("Invalid arguments for {}: {}".format(
+                name, str(x)))
+        if script == NETWORK_UTIL:
+            # a device has a single root qdisc
+            if param["device"] in devices:
+                raise FailedActivity(
+                    "Only one network fault per device, {} has several"
+                    .format(param["device"]))
+            devices.add(param["device"])
+        if script in _BURN_FILE:
+            # the cleanup of one would delete the file of the other
+            if burn_file is not None:
+                raise FailedActivity(
+                    "{} and {} both write /root/burn, they cannot be "
+                    "combined".format(burn_file, name))
+            burn_file = name
+        result.append((name, script, param))
+    return result
+
+
+def render_composite(scripts: List[Tuple[str, str]], os_type: str,
+                     parameters: List[Dict[str, str]] = None) -> str:
+    """
+    Combine `(script name, script content)` pairs into one script running
+    them concurrently. `parameters` are those of each script, used to
+    revert what a fault interrupted may have left behind.
+    """
+    parameters = parameters or [{} for _ in scripts]
+    if os_type == OS_LINUX:
+        cleanup = []
+        for (name, _), param in zip(scripts, parameters):
+            if name in _LINUX_CLEANUP:
+                cleanup.append(
+                    "    " + _LINUX_CLEANUP[name].format(**param))
+        return _LINUX_HEADER.format(cleanup="\n".join(cleanup) or "    :") + \
+            "".join(_LINUX_FAULT.format(script=content, index=i + 1)
+                    for i, (_, content) in enumerate(scripts)) + \
+            _LINUX_FOOTER.format(marker=FAULT_MARKER)
+    if os_type == OS_WINDOWS:
+        return _WINDOWS_HEADER + \
+            "".join(_WINDOWS_FAULT.format(script=content)
+                    for _, content in scripts) + \
+            _WINDOWS_FOOTER.format(marker=FAULT_MARKER)
+    raise FailedActivity(
+        "Cannot combine scripts on OS: {}".format(os_type))
+
+
+def parse_faults(console: str, names: List[str]) -> List[Dict[str, Any]]:
+    """
+    Split the console output of a combined script into the result of each
+    fault, in the order they were given. Faults without any output did not
+    complete.
+    """
+    found = dict(
+        (int(index), (output, int(code)))
+        for index, output, code in _FAULT.findall(console))
+    results = []
+    for i, name in enumerate(names):
+        output, code = found.get(i + 1, ("", None))
+        results.append({
+            "action": name, "exit": code, "console": output,
+            "success": code == 0 and 'fail' not in output
+        })
+    return results
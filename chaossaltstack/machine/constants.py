@@ -9,3 +9,5 @@ FILL_DISK = "fill_disk"
 NETWORK_UTIL = "network_advanced"
 KILLALL_PROCESSES = "killall_processes"
 KILL_PROCESS = "kill_process"
+COMPOSITE = "composite"
+ROLLBACK = "rollback"
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Actions running in the background of the experiment.
+
+An action called with `detached=True` publishes its jobs and returns right
+away with a handle, instead of blocking the runner for the whole
+`execution_duration`. The jobs it left running are kept in a registry of the
+process, so that later probes can report their progress or await and collect
+their results while other activities run meanwhile.
+"""
+import threading
+from collections import OrderedDict
+from itertools import count
+from time import time
+from typing import Any, Dict, List
+
+from chaoslib.exceptions import FailedActivity
+
+from ..jobstore import JobStore
+
+__all__ = ["ExperimentRun", "register", "find", "release", "remaining"]
+
+_runs = OrderedDict()  # type: Dict[str, ExperimentRun]
+_runs_lock = threading.Lock()
+_handles = count(1)
+
+
+class ExperimentRun:
+    """
+    Jobs published by an action, from their dispatch to their collection.
+    """
+    def __init__(self, action: str, client, parameters: Dict[str, Any] = None,
+                 store: JobStore = None):
+        self.action = action
+        self.client = client
+        self.store = store
+        self.run_id = store.start_run(action, parameters) \
+            if store is not None else None
+        self.jids = OrderedDict()  # type: Dict[str, str]
+        # (start_at, duration) of each minion when the starts are scheduled
+        self.schedule = None  # type: Dict[str, tuple]
+        self.deadline = None  # type: float
+        # names of the faults combined by a composite action
+        self.faults = None  # type: List[str]
+        # seconds between two samples of the minion counters, if sampled
+        self.sample_interval = None  # type: float
+        # commands missing on the minions left out by the preflight check
+        self.excluded = None  # type: Dict[str, List[str]]
+        # OS of each minion
+        self.os_types = dict()  # type: Dict[str, str]
+        # names the minion-side logs in status-only result mode
+        self.log_token = None  # type: str
+        self.handle = None  # type: str
+
+    def dispatched(self, minion: str, jid: str,
+                   parameters: Dict[str, Any] = None):
+        self.jids[minion] = jid
+        if self.store is not None:
+            scheduled = self.schedule[minion][0] if self.schedule else None
+            self.store.record_dispatch(self.run_id, self.action, minion, jid,
+                                       parameters, scheduled)
+
+    def collected(self, minion: str, success: bool, result: Any):
+        if self.store is not None:
+            self.store.record_result(
+                self.jids[minion], minion, success, result)
+
+    def end(self, status: str = "completed"):
+        if self.store is not None:
+            self.store.end_run(self.run_id, status)
+
+    def to_handle(self) -> Dict[str, Any]:
+        """
+        What a detached action returns: enough to find its jobs again.
+        """
+        return {
+            "handle": self.handle, "action": self.action,
+            "jids": dict(self.jids), "deadline": self.deadline
+        }
+
+
+def register(run: ExperimentRun) -> Dict[str, Any]:
+    """
+    Keep a detached run until it is released and return its handle.
+    """
+    with _runs_lock:
+        run.handle = "{}-{}".format(run.action, next(_handles))
+        _runs[run.handle] = run
+    return run.to_handle()
+
+
+def find(handle: str = None) -> List[ExperimentRun]:
+    """
+    Return the detached run with the given handle, or all of them, oldest
+    first, when no handle is given.
+    """
+    with _runs_lock:
+        if handle is None:
+            return list(_runs.values())
+        if handle not in _runs:
+            raise FailedActivity(
+                "No detached activity with handle {}".format(handle))
+        return [_runs[handle]]
+
+
+def release(run: ExperimentRun):
+    with _runs_lock:
+        _runs.pop(run.handle, None)
+
+
+def remaining(run: ExperimentRun) -> float:
+    """
+    Seconds left until the jobs of the run are expected to be done.
+    """
+    return max(0.0, run.deadline - time())
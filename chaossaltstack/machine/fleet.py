@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Node metrics of a whole fleet, reduced to a few aggregates.
+
+The salt functions behind the requested metrics are called together, in a
+single `local` call to all the targets, and each value is appended to one
+column of doubles per metric as the response is streamed, rather than kept
+in a dict per minion. The columns are then aggregated in one pass each: with
+NumPy, when it is installed, as arrays sharing the memory of the columns,
+otherwise in plain Python.
+"""
+import math
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List
+
+from chaoslib.exceptions import FailedActivity
+
+__all__ = ["METRICS", "DEFAULT_PERCENTILES", "FleetColumns",
+           "salt_functions", "get_numpy"]
+
+DEFAULT_PERCENTILES = (50, 90, 99)
+
+_UNSET = object()
+_numpy = _UNSET
+
+
+def _kb(meminfo: Dict[str, Any], key: str) -> float:
+    value = meminfo[key]
+    return float(value["value"] if isinstance(value, dict) else value)
+
+
+def _mem_used_percent(meminfo: Dict[str, Any]) -> float:
+    return 100.0 * (1.0 - _kb(meminfo, "MemAvailable") /
+                    _kb(meminfo, "MemTotal"))
+
+
+def _disk_used_percent(usage: Dict[str, Any]) -> float:
+    # the fullest filesystem of the minion
+    return max(float(str(fs["capacity"]).rstrip("%"))
+               for fs in usage.values())
+
+
+# salt function and how to read the value of each metric out of its result
+METRICS = OrderedDict([
+    ("load1", ("status.loadavg", lambda r: float(r["1-min"]))),
+    ("load5", ("status.loadavg", lambda r: float(r["5-min"]))),
+    ("load15", ("status.loadavg", lambda r: float(r["15-min"]))),
+    ("mem_used_percent", ("status.meminfo", _mem_used_percent)),
+    ("mem_available_kb",
+     ("status.meminfo", lambda r: _kb(r, "MemAvailable"))),
+    ("disk_used_percent", ("disk.usage", _disk_used_percent)),
+])  # type: Dict[str, tuple]
+
+
+def get_numpy():
+    """
+    Return the `numpy` module, `None` when it is not installed. The import
+    is attempted only once.
+    """
+    global _numpy
+    if _numpy is _UNSET:
+        try:
+            import numpy
+        except ImportError:
+            _numpy = None
+        else:
+            _numpy = numpy
+    return _numpy
+
+
+def salt_functions(metrics: List[str]) -> List[str]:
+    """
+    Return the salt functions to call, once each, for the given metrics.
+    """
+    unknown = [m for m in metrics if m not in METRICS]
+    if unknown:
+        raise FailedActivity(
+            "Unknown metrics {}, expected some of {}".format(
+                ", ".join(unknown), ", ".join(METRICS)))
+    return list(OrderedDict.fromkeys(METRICS[m][0] for m in metrics))
+
+
+class FleetColumns:
+    """
+    One column of doubles per metric, one row per minion. A value the
+    minion could not provide is stored as NaN and left out of the
+    aggregates.
+    """
+    def __init__(self, metrics: List[str]):
+        self.metrics = list(metrics)
+        self.minions = []  # type: List[str]
+        self.columns = OrderedDict(
+            (m, array('d')) for m in self.metrics)  # type: Dict[str, array]
+
+    def add(self, minion: str, results: Dict[str, Any]):
+        """
+        Append the row of a minion from the results of the salt functions,
+        keyed by function name.
+        """
+        self.minions.append(minion)
+        for metric, column in self.columns.items():
+            function, read = METRICS[metric]
+            try:
+                column.append(read(results[function]))
+            except (KeyError, TypeError, ValueError, ZeroDivisionError,
+                    AttributeError):
+                column.append(math.nan)
+
+    def aggregate(self, percentiles: Iterable[float] = DEFAULT_PERCENTILES
+                  ) -> Dict[str, Dict[str, Any]]:
+        """
+        Return the `count` of minions which provided each metric, its `min`,
+        `max`, `mean` and percentiles, such as `p90`, over those minions,
+        and the minion with the highest value as `max_minion`.
+        """
+        percentiles = [float(p) for p in percentiles]
+        numpy = get_numpy()
+        aggregate = _numpy_aggregate if numpy else _python_aggregate
+        return OrderedDict(
+            (metric, aggregate(column, self.minions, percentiles))
+            for metric, column in self.columns.items())
+
+
+###############################################################################
+# Private functions
+###############################################################################
+def _stats(count: int, low: float, high: float, mean: float,
+           values: List[float], percentiles: List[float],
+           minion: str) -> Dict[str, Any]:
+    stats = OrderedDict([
+        ("count", count), ("min", low), ("max", high), ("mean", mean)])
+    for p, value in zip(percentiles, values):
+        stats["p{:g}".format(p)] = value
+    stats["max_minion"] = minion
+    return stats
+
+
+def _empty(percentiles: List[float]) -> Dict[str, Any]:
+    return _stats(0, None, None, None, [None] * len(percentiles),
+                  percentiles, None)
+
+
+def _numpy_aggregate(column: array, minions: List[str],
+                     percentiles: List[float]) -> Dict[str, Any]:
+    numpy = get_numpy()
+    # a view of the column, not a copy
+    values = numpy.frombuffer(column, dtype=numpy.float64)
+    valid = ~numpy.isnan(values)
+    count = int(numpy.count_nonzero(valid))
+    if count == 0:
+        return _empty(percentiles)
+    present = values[valid]
+    highest = int(numpy.nanargmax(values))
+    computed = numpy.percentile(present, percentiles) \
+        if percentiles else []
+    return _stats(count, float(present.min()), float(present.max()),
+                  float(present.mean()), [float(v) for v in computed],
+                  percentiles, minions[highest])
+
+
+def _python_aggregate(column: array, minions: List[str],
+                      percentiles: List[float]) -> Dict[str, Any]:
+    present = sorted(
+        (v, i) for i, v in enumerate(column) if not math.isnan(v))
+    count = len(present)
+    if count == 0:
+        return _empty(percentiles)
+    values = [v for v, _ in present]
+    highest = max(present, key=lambda p: (p[0], -p[1]))[1]
+    return _stats(count, values[0], values[-1], math.fsum(values) / count,
+                  [_percentile(values, p) for p in percentiles],
+                  percentiles, minions[highest])
+
+
+def _percentile(values: List[float], p: float) -> float:
+    """
+    Percentile of sorted values, interpolated linearly between the closest
+    ranks as NumPy does by default.
+    """
+    rank = (len(values) - 1) * p / 100.0
+    low = int(math.floor(rank))
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
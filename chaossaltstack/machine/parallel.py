@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Several actions run at the same time on disjoint groups of minions.
+
+Each spec names one of the actions of this package, the minions it targets
+and its arguments, for instance
+`{"action": "burn_cpu", "instance_ids": ["app-1"], "arguments": {}}`. The
+actions are run concurrently, each in a thread of its own, and share the
+client of the process along with its throttle, so that the limits of the
+`saltstack` configuration section apply to all of them at once, and their
+spans are children of the span of the calling activity. Two specs
+may not target the same minion: their scripts, and the cleanup of one,
+would interfere with the other.
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+from chaoslib.exceptions import FailedActivity
+from chaoslib.types import Configuration, Secrets
+
+from ..chunking import target_list
+from ..metrics import bind
+from ..tracing import bind_context
+
+__all__ = ["parallel_specs", "run_specs"]
+
+
+def parallel_specs(specs: List[Dict[str, Any]],
+                   actions: Dict[str, Callable]
+                   ) -> List[Tuple[str, Callable, List[str], Dict[str, Any]]]:
+    """
+    Validate the specs against the available `actions` and return the name,
+    the action, the minions and the arguments of each. The name of a spec
+    is its `name`, or else its action.
+    """
+    if not specs:
+        raise FailedActivity("No action to run")
+    result = []
+    owners = dict()  # type: Dict[str, str]
+    for spec in specs:
+        action = spec.get("action")
+        if action not in actions:
+            raise FailedActivity(
+                "Unknown action '{}', expected one of {}".format(
+                    action, ", ".join(sorted(actions))))
+        name = spec.get("name") or action
+        if any(name == n for n, _, _, _ in result):
+            raise FailedActivity(
+                "Several specs are named '{}', give them a distinct "
+                "name".format(name))
+        instance_ids = spec.get("instance_ids")
+        if not instance_ids:
+            raise FailedActivity(
+                "The instance_ids of '{}' must be given".format(name))
+        instance_ids = target_list(instance_ids)
+        if isinstance(instance_ids, str):
+            instance_ids = [instance_ids]
+        for k in instance_ids:
+            if owners.setdefault(k, name) != name:
+                raise FailedActivity(
+                    "'{}' and '{}' both target {}, their instance_ids must "
+                    "be disjoint".format(owners[k], name, k))
+        arguments = dict(spec.get("arguments") or {})
+        for reserved in ("instance_ids", "configuration", "secrets"):
+            if reserved in arguments:
+                raise FailedActivity(
+                    "'{}' cannot be given in the arguments of '{}'".format(
+                        reserved, name))
+        result.append((name, actions[action], instance_ids, arguments))
+    return result
+
+
+def run_specs(specs: List[Tuple[str, Callable, List[str], Dict[str, Any]]],
+              configuration: Configuration = None,
+              secrets: Secrets = None) -> Dict[str, Any]:
+    """
+    Run the actions of validated specs concurrently and return the result
+    of each by name, once they are all done. The actions which failed are
+    reported together.
+    """
+    def run(action: Callable, instance_ids: List[str],
+            arguments: Dict[str, Any]):
+        return action(instance_ids=instance_ids, configuration=configuration,
+                      secrets=secrets, **arguments)
+
+    with ThreadPoolExecutor(max_workers=len(specs)) as pool:
+        futures = [
+            (name, pool.submit(bind(bind_context(run)), action,
+                               instance_ids, arguments))
+            for name, action, instance_ids, arguments in specs]
+
+    results = OrderedDict()
+    failures = []
+    for name, future in futures:
+        try:
+            results[name] = future.result()
+        except Exception as x:
+            failures.append("{}: {}".format(name, str(x)))
+    if failures:
+        raise FailedActivity(
+            "{} of {} actions failed, {}".format(
+                len(failures), len(specs), "; ".join(failures)))
+    return results
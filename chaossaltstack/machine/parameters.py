@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Script parameters of the fault actions.
+
+Each function validates the arguments of the action of the same name and
+builds the parameters its script is given, besides `duration` and
+`instance_id`. They are used both by the action and by `run_faults` for the
+same fault, so that a fault gets the same parameters, and the same checks,
+whichever way it is injected.
+"""
+from typing import Dict
+
+from chaoslib.exceptions import FailedActivity
+
+__all__ = ["burn_cpu_parameters", "burn_io_parameters",
+           "fill_disk_parameters", "network_advanced_parameters",
+           "network_loss_parameters", "network_corruption_parameters",
+           "network_latency_parameters", "killall_processes_parameters",
+           "kill_process_parameters"]
+
+
+def burn_cpu_parameters(utilisation: int = 100) -> Dict[str, str]:
+    if not 0 < int(utilisation) <= 100:
+        raise FailedActivity(
+            "utilisation must be from 1 to 100, got {}".format(utilisation))
+    return {"utilisation": str(int(utilisation))}
+
+
+def burn_io_parameters() -> Dict[str, str]:
+    return {}
+
+
+def fill_disk_parameters(size: str = "1000") -> Dict[str, str]:
+    return {"size": size}
+
+
+def network_advanced_parameters(command: str = "",
+                                device: str = "eth0") -> Dict[str, str]:
+    return {"param": command, "device": device}
+
+
+def network_loss_parameters(loss_ratio: str = "5%",
+                            device: str = "eth0") -> Dict[str, str]:
+    return {"param": "loss " + loss_ratio, "device": device}
+
+
+def network_corruption_parameters(corruption_ratio: str = "5%",
+                                  device: str = "eth0") -> Dict[str, str]:
+    return {"param": "corrupt " + corruption_ratio, "device": device}
+
+
+def network_latency_parameters(delay: str = "1000ms",
+                               variance: str = "500ms", ratio: str = "",
+                               device: str = "eth0") -> Dict[str, str]:
+    return {"param": "delay " + delay + " " + variance + " " + ratio,
+            "device": device}
+
+
+def killall_processes_parameters(process_name: str = None,
+                                 signal: str = "") -> Dict[str, str]:
+    return {"process_name": process_name, "signal": signal}
+
+
+def kill_process_parameters(process: str = None,
+                            signal: str = "") -> Dict[str, str]:
+    return {"process_name": process, "signal": signal}
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Which commands the minions have, checked before faults are dispatched.
+
+With the `preflight` setting of the `saltstack` configuration section, the
+actions first make sure their Linux targets have the commands their scripts
+need. The presence of every command any action may need is checked at once,
+with a single `command -v` loop per minion published as one job to all of
+them, and kept in a process-wide matrix for `preflight_ttl` seconds. Other
+actions targeting the same minions within that time use the matrix without
+asking them again.
+
+Depending on `preflight`, the minions lacking a command are left out of the
+action (`filter`) or fail it (`fail`), rather than wasting a whole
+`execution_duration` on a script that cannot work.
+"""
+import threading
+from time import time
+from typing import Dict, FrozenSet, Iterable, List, Set
+
+from chaoslib.exceptions import FailedActivity
+
+from .constants import BURN_CPU, BURN_IO, COMPOSITE, FILL_DISK, \
+    KILLALL_PROCESSES, KILL_PROCESS, NETWORK_UTIL
+
+__all__ = ["REQUIREMENTS", "COMMANDS", "DEFAULT_PREFLIGHT_TTL", "MODES",
+           "requirements", "capabilities", "missing_commands",
+           "clear_capabilities", "check_mode"]
+
+DEFAULT_PREFLIGHT_TTL = 300
+MODES = ("filter", "fail")
+
+# commands each script needs on Linux, besides the shell builtins
+REQUIREMENTS = {
+    BURN_CPU: ("awk", "sleep"),
+    BURN_IO: ("dd", "timeout", "sudo"),
+    FILL_DISK: ("dd", "nohup", "sleep"),
+    NETWORK_UTIL: ("tc", "grep", "sleep"),
+    KILLALL_PROCESSES: ("killall", "sleep"),
+    KILL_PROCESS: ("sleep",),
+    # joint cleanup of the combined faults
+    COMPOSITE: ("mktemp", "pgrep"),
+}  # type: Dict[str, Iterable[str]]
+# needed by the start scheduling and the sampling wrappers
+_SCHEDULE = ("awk", "date", "sleep")
+_SAMPLER = ("awk", "mktemp", "sleep")
+
+# every command checked at once
+COMMANDS = tuple(sorted(set(
+    command for commands in list(REQUIREMENTS.values()) +
+    [_SCHEDULE, _SAMPLER] for command in commands)))
+
+_CHECK = "for c in {}; do command -v $c >/dev/null 2>&1 && echo $c; done; " \
+         "echo preflight-done".format(" ".join(COMMANDS))
+
+_matrix = dict()  # type: Dict[str, tuple]
+_matrix_lock = threading.Lock()
+
+
+def requirements(action: str, scripts: Iterable[str] = (),
+                 scheduled: bool = False, sampled: bool = False
+                 ) -> Set[str]:
+    """
+    Return the commands needed by an action running the given `scripts`,
+    its own script when there are none.
+    """
+    needed = set()
+    for script in list(scripts) or [action]:
+        needed.update(REQUIREMENTS.get(script, ()))
+    if action == COMPOSITE:
+        needed.update(REQUIREMENTS[COMPOSITE])
+    if needed and scheduled:
+        needed.update(_SCHEDULE)
+    if needed and sampled:
+        needed.update(_SAMPLER)
+    return needed
+
+
+def capabilities(client, minions: List[str], ttl: float = None
+                 ) -> Dict[str, FrozenSet[str]]:
+    """
+    Return the commands available on each minion, asking, with a single
+    job, only those not checked in the last `ttl` seconds. Minions which do
+    not answer are left out.
+    """
+    ttl = DEFAULT_PREFLIGHT_TTL if ttl is None else float(ttl)
+    now = time()
+    found = dict()
+    with _matrix_lock:
+        for k in minions:
+            entry = _matrix.get(k)
+            if entry is not None and now - entry[0] < ttl:
+                found[k] = entry[1]
+    stale = [k for k in minions if k not in found]
+    if stale:
+        checked = dict()
+        for k, result in client.iter_run_cmd(stale, 'cmd.run', _CHECK):
+            if isinstance(result, str) and "preflight-done" in result:
+                checked[k] = frozenset(
+                    line.strip() for line in result.splitlines()
+                    if line.strip() in COMMANDS)
+        with _matrix_lock:
+            for k, commands in checked.items():
+                _matrix[k] = (now, commands)
+        found.update(checked)
+    return found
+
+
+def missing_commands(client, minions: List[str], needed: Set[str],
+                     ttl: float = None) -> Dict[str, List[str]]:
+    """
+    Return the commands missing on each of the minions lacking some, all of
+    them for the minions which did not answer.
+    """
+    available = capabilities(client, minions, ttl)
+    missing = dict()
+    for k in minions:
+        lacking = sorted(needed - available.get(k, frozenset()))
+        if lacking:
+            missing[k] = lacking
+    return missing
+
+
+def clear_capabilities():
+    """
+    Forget the commands found on every minion.
+    """
+    with _matrix_lock:
+        _matrix.clear()
+
+
+def check_mode(mode: str) -> str:
+    """
+    Return the `preflight` mode if it is a known one.
+    """
+    if mode not in MODES:
+        raise FailedActivity(
+            "Unknown preflight '{}', expected one of {}".format(
+                mode, ", ".join(MODES)))
+    return mode
@@ -1,17 +1,27 @@
 # -*- coding: utf-8 -*-
-from typing import List
+from collections import OrderedDict
+from typing import Any, Dict, List
 
 from chaoslib.types import Configuration, Secrets
 from chaoslib.exceptions import FailedActivity
 
 
-from .. import saltstack_api_client
+from .. import get_settings, saltstack_api_client
+from ..chunking import target_list
+from ..metrics import activity_metrics
+from ..tracing import traced
 from ..types import SaltStackResponse
-from .actions import __default_salt_experiment__
+from .actions import __complete_experiment__, __default_salt_experiment__
+from .detached import find, release, remaining
+from .fleet import DEFAULT_PERCENTILES, METRICS, FleetColumns, salt_functions
+from .preflight import COMMANDS, capabilities
 
-__all__ = ["is_minion_online", "is_iproute_tc_installed", "grep_process_exist"]
+__all__ = ["is_minion_online", "is_iproute_tc_installed", "grep_process_exist",
+           "await_detached", "detached_progress", "fleet_metrics",
+           "capability_matrix"]
 
 
+@traced
 def grep_process_exist(instance_ids: List[str],
                        process_name: str,
                        configuration: Configuration = None,
@@ -43,6 +53,7 @@ def grep_process_exist(instance_ids: List[str],
                                        secrets=secrets)
 
 
+@traced
 def is_minion_online(instance_ids: List[str],
                      configuration: Configuration = None,
                      secrets: Secrets = None):
@@ -60,19 +71,14 @@ def is_minion_online(instance_ids: List[str],
                 'client3':'Not a Salt Minion' }
     """
     try:
-        client = saltstack_api_client(secrets)
-        machines = client.run_cmd(instance_ids, 'test.ping')
+        instance_ids = target_list(instance_ids)
+        client = saltstack_api_client(secrets, configuration)
+        result = dict((k, "Not a Salt Minion") for k in instance_ids)
 
-        result = dict()
-
-        for k in instance_ids:
-            if k not in machines:
-                result[k] = "Not a Salt Minion"
-            else:
-                if machines[k] is False:
-                    result[k] = "Offline"
-                else:
-                    result[k] = "Online"
+        # consume the minions one by one as the response is parsed
+        for k, v in client.iter_run_cmd(instance_ids, 'test.ping'):
+            if k in result:
+                result[k] = "Offline" if v is False else "Online"
 
         return result
 
@@ -84,6 +90,7 @@ def is_minion_online(instance_ids: List[str],
         )
 
 
+@traced
 def is_iproute_tc_installed(instance_ids: List[str],
                             configuration: Configuration = None,
                             secrets: Secrets = None):
@@ -106,19 +113,14 @@ def is_iproute_tc_installed(instance_ids: List[str],
             -nm | -nam[es] | { -cf | -conf } path }'}
     """  # noqa: E501
     try:
-        client = saltstack_api_client(secrets)
-        machines = client.run_cmd(instance_ids, 'cmd.run', 'tc -help')
-
-        result = dict()
+        instance_ids = target_list(instance_ids)
+        client = saltstack_api_client(secrets, configuration)
+        result = dict((k, "Not a Salt Minion") for k in instance_ids)
 
-        for k in instance_ids:
-            if k not in machines:
-                result[k] = "Not a Salt Minion"
-            else:
-                if machines[k].startswith("Usage: tc"):
-                    result[k] = "Installed"
-                else:
-                    result[k] = "Not Installed"
+        for k, v in client.iter_run_cmd(instance_ids, 'cmd.run', 'tc -help'):
+            if k in result:
+                result[k] = "Installed" if v.startswith("Usage: tc") \
+                    else "Not Installed"
 
         return result
 
@@ -128,3 +130,186 @@ def is_iproute_tc_installed(instance_ids: List[str],
                 str(x)
             )
         )
+
+
+@traced
+def await_detached(handle: str = None,
+                   configuration: Configuration = None,
+                   secrets: Secrets = None) -> Dict[str, SaltStackResponse]:
+    """
+    Wait for the jobs of actions run with `detached=True` to be done, then
+    collect their results.
+
+    Parameters
+    ----------
+    handle : str, optional
+        The `handle` returned by the detached action. All the detached
+        actions still pending are awaited when omitted.
+    configuration : Configuration
+        Chaostoolkit Configuration
+    secrets : Secrets
+        Chaostoolkit Secrets
+
+    Returns the result each action would have returned had it not been
+    detached, keyed by handle.
+    """
+    results = dict()
+    for run in sorted(find(handle), key=lambda r: r.deadline):
+        with activity_metrics(run.action):
+            try:
+                results[run.handle] = __complete_experiment__(run)
+            except Exception as x:
+                run.end("failed")
+                raise FailedActivity(
+                    "failed collecting the results of {} via salt API "
+                    "{}".format(run.handle, str(x)))
+            finally:
+                release(run)
+    return results
+
+
+@traced
+def detached_progress(handle: str = None,
+                      configuration: Configuration = None,
+                      secrets: Secrets = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Report, without waiting, how far the jobs of actions run with
+    `detached=True` are.
+
+    Parameters
+    ----------
+    handle : str, optional
+        The `handle` returned by the detached action. All the detached
+        actions still pending are reported when omitted.
+    configuration : Configuration
+        Chaostoolkit Configuration
+    secrets : Secrets
+        Chaostoolkit Secrets
+
+    Returns, keyed by handle, the number of `minions` targeted, how many
+    `returned` already and how many `succeeded`, along with the `deadline`
+    and the seconds `remaining` until then.
+    """
+    progress = dict()
+    try:
+        for run in find(handle):
+            returned = succeeded = 0
+            for jid in OrderedDict.fromkeys(run.jids.values()):
+                for k, v in run.client.iter_async_cmd_exit_success(jid):
+                    if run.jids.get(k) == jid:
+                        returned += 1
+                        succeeded += 1 if v is True else 0
+            progress[run.handle] = {
+                "action": run.action, "minions": len(run.jids),
+                "returned": returned, "succeeded": succeeded,
+                "deadline": run.deadline, "remaining": remaining(run)
+            }
+    except FailedActivity:
+        raise
+    except Exception as x:
+        raise FailedActivity(
+            "failed issuing a execute of shell script via salt API {}".format(
+                str(x)
+            )
+        )
+    return progress
+
+
+@traced
+def fleet_metrics(instance_ids: List[str],
+                  metrics: List[str] = None,
+                  percentiles: List[float] = None,
+                  configuration: Configuration = None,
+                  secrets: Secrets = None) -> Dict[str, Any]:
+    """
+    Collect node metrics from all the minions in a single call and reduce
+    them to fleet-wide aggregates.
+
+    Parameters
+    ----------
+    instance_ids : List[str]
+        The minions to collect the metrics of
+    metrics : List[str], optional
+        Which metrics to collect, all of them when omitted: `load1`, `load5`,
+        `load15` (`status.loadavg`), `mem_used_percent`, `mem_available_kb`
+        (`status.meminfo`) and `disk_used_percent`, of the fullest
+        filesystem (`disk.usage`)
+    percentiles : List[float], optional
+        Percentiles to compute, 50, 90 and 99 by default
+    configuration : Configuration
+        Chaostoolkit Configuration
+    secrets : Secrets
+        Chaostoolkit Secrets
+
+    Returns the number of `minions` targeted and of those which `responded`,
+    and for each metric the `count` of minions which provided it, its `min`,
+    `max`, `mean`, percentiles such as `p90` and the `max_minion` with the
+    highest value, for instance:
+        {"minions": 3000, "responded": 2998, "metrics": {"load1": {
+            "count": 2998, "min": 0.1, "max": 7.9, "mean": 1.2, "p50": 0.9,
+            "p90": 2.5, "p99": 6.1, "max_minion": "web-0421"}}}
+    """
+    metrics = list(metrics or METRICS)
+    percentiles = DEFAULT_PERCENTILES if percentiles is None else percentiles
+    if any(not 0 <= float(p) <= 100 for p in percentiles):
+        raise FailedActivity(
+            "Percentiles must be between 0 and 100: {}".format(percentiles))
+    functions = salt_functions(metrics)
+    columns = FleetColumns(metrics)
+    try:
+        instance_ids = target_list(instance_ids)
+        client = saltstack_api_client(secrets, configuration)
+        targets = set(instance_ids)
+        for k, v in client.iter_run_cmd(
+                instance_ids, functions, [[] for _ in functions]):
+            if k in targets:
+                columns.add(k, v if isinstance(v, dict) else {})
+    except Exception as x:
+        raise FailedActivity(
+            "failed issuing a execute of shell script via salt API {}".format(
+                str(x)
+            )
+        )
+    return {
+        "minions": len(instance_ids), "responded": len(columns.minions),
+        "metrics": columns.aggregate(percentiles)
+    }
+
+
+@traced
+def capability_matrix(instance_ids: List[str],
+                      configuration: Configuration = None,
+                      secrets: Secrets = None) -> Dict[str, Dict[str, bool]]:
+    """
+    Tell which of the commands needed by the actions each Linux minion has,
+    as checked before dispatch with the `preflight` setting.
+
+    Parameters
+    ----------
+    instance_ids : List[str]
+        The minions to check
+    configuration : Configuration
+        Chaostoolkit Configuration
+    secrets : Secrets
+        Chaostoolkit Secrets
+
+    The minions checked less than `preflight_ttl` seconds ago, 300 by
+    default, are not asked again. Returns, for each minion which answered,
+    whether each command is available, for instance
+        {"CLIENT1": {"tc": true, "killall": false, ...}}
+    """
+    settings = get_settings(configuration)
+    try:
+        instance_ids = target_list(instance_ids)
+        client = saltstack_api_client(secrets, configuration)
+        found = capabilities(
+            client, instance_ids, settings.get("preflight_ttl"))
+    except Exception as x:
+        raise FailedActivity(
+            "failed issuing a execute of shell script via salt API {}".format(
+                str(x)
+            )
+        )
+    return dict(
+        (k, dict((c, c in commands) for c in COMMANDS))
+        for k, commands in found.items())
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Node counters sampled on the minions while their fault runs.
+
+A script wrapped with `sample_script()` starts a sampler in the background
+which appends the CPU, memory, disk and network counters of `/proc` to a
+file on the minion every `sample_interval` seconds. Once the script is
+done, the samples are printed on a single line, each one as the difference
+with the previous one, and read back by `parse_samples()` from the console
+output of the job. Observing the effect of a fault thus costs no request to
+the master besides collecting the result of the job.
+
+Only Linux minions are sampled.
+"""
+import re
+from typing import Any, Dict, List
+
+from chaoslib.exceptions import FailedActivity
+
+from .constants import OS_LINUX
+
+__all__ = ["sample_script", "parse_samples", "SAMPLE_FIELDS",
+           "SAMPLES_MARKER"]
+
+SAMPLES_MARKER = "chaossaltstack-samples"
+# raw counters of each sample, uptime in hundredths of a second, CPU in
+# jiffies, disk in sectors of 512 bytes, network in bytes
+SAMPLE_FIELDS = ("uptime", "cpu_busy", "cpu_total", "mem_available_kb",
+                 "disk_read_sectors", "disk_write_sectors", "net_rx_bytes",
+                 "net_tx_bytes")
+
+_SAMPLES = re.compile(r"{} ([-0-9,;]+)".format(SAMPLES_MARKER))
+
+_SAMPLE = r"""chaos_sample() {
+    awk 'FILENAME == "/proc/uptime" { t = $1 * 100 }
+    FILENAME == "/proc/stat" && $1 == "cpu" {
+        for (i = 2; i <= 9; i++) total += $i
+        busy = total - $5 - $6
+    }
+    FILENAME == "/proc/meminfo" && $1 == "MemAvailable:" { mem = $2 }
+    FILENAME == "/proc/diskstats" && $3 ~ /^([shv]d[a-z]+|xvd[a-z]+|nvme[0-9]+n[0-9]+|mmcblk[0-9]+)$/ {
+        rd += $6; wr += $10
+    }
+    FILENAME == "/proc/net/dev" && FNR > 2 {
+        sub(/^ */, ""); split($0, f, ":")
+        if (f[1] != "lo") { split(f[2], c, " "); rx += c[1]; tx += c[9] }
+    }
+    END {
+        printf "%.0f %.0f %.0f %.0f %.0f %.0f %.0f %.0f\n", t, busy, total,
+            mem, rd, wr, rx, tx
+    }' /proc/uptime /proc/stat /proc/meminfo /proc/diskstats /proc/net/dev
+}
+"""  # noqa: E501
+
+_LINUX_PRELUDE = _SAMPLE + """chaos_samples=$(mktemp)
+chaos_sample >> "$chaos_samples"
+(
+    while sleep {interval}; do chaos_sample >> "$chaos_samples"; done
+) >/dev/null 2>&1 &
+chaos_sampler=$!
+trap 'kill $chaos_sampler 2>/dev/null; rm -f "$chaos_samples"' 0
+trap 'exit 143' INT TERM
+(
+"""
+_LINUX_EPILOGUE = """
+)
+chaos_ret=$?
+kill $chaos_sampler 2>/dev/null
+chaos_sample >> "$chaos_samples"
+awk 'BEGIN { printf "{marker} " }
+{
+    if (NR > 1) printf ";"
+    for (i = 1; i <= NF; i++) {
+        printf "%s%.0f", (i > 1) ? "," : "", (NR > 1) ? $i - p[i] : $i
+        p[i] = $i
+    }
+}
+END { print "" }' "$chaos_samples"
+exit $chaos_ret"""
+
+
+def sample_script(script_content: str, os_type: str,
+                  interval: float) -> str:
+    """
+    Wrap a fault script so that the counters of the minion are sampled every
+    `interval` seconds while it runs, and printed once it is done. Scripts
+    for other OS than Linux are returned as they are.
+    """
+    if os_type != OS_LINUX:
+        return script_content
+    if interval <= 0:
+        raise FailedActivity(
+            "sample_interval must be positive, got {}".format(interval))
+    return _LINUX_PRELUDE.replace("{interval}", "{:g}".format(interval)) + \
+        script_content + \
+        _LINUX_EPILOGUE.replace("{marker}", SAMPLES_MARKER)
+
+
+def parse_samples(console: str) -> Dict[str, List[Any]]:
+    """
+    Decode the samples printed by a sampled script into series, `None` when
+    there are none. Every series has a value per interval between two
+    samples: `time` in seconds since the first sample, `cpu_percent` busy
+    over the interval, `mem_available_kb` at its end, and the kilobytes
+    read and written by the disks (`disk_read_kb`, `disk_write_kb`) and
+    received and sent on the network (`net_rx_kb`, `net_tx_kb`) during the
+    interval.
+    """
+    found = _SAMPLES.search(console)
+    if found is None:
+        return None
+    rows = [[int(v) for v in row.split(",")]
+            for row in found.group(1).split(";")]
+    rows = [row for row in rows if len(row) == len(SAMPLE_FIELDS)]
+    series = dict((name, []) for name in (
+        "time", "cpu_percent", "mem_available_kb", "disk_read_kb",
+        "disk_write_kb", "net_rx_kb", "net_tx_kb"))
+    if not rows:
+        return series
+    elapsed = 0
+    available = rows[0][3]
+    for uptime, busy, total, memory, read, write, rx, tx in rows[1:]:
+        elapsed += uptime
+        available += memory
+        series["time"].append(elapsed / 100.0)
+        series["cpu_percent"].append(
+            round(100.0 * busy / total, 1) if total > 0 else None)
+        series["mem_available_kb"].append(available)
+        series["disk_read_kb"].append(read // 2)
+        series["disk_write_kb"].append(write // 2)
+        series["net_rx_kb"].append(round(rx / 1024.0, 1))
+        series["net_tx_kb"].append(round(tx / 1024.0, 1))
+    return series
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+When the fault scripts start on the minions.
+
+By default each minion starts its script as soon as its job is published, so
+that with many minions the fault window is smeared over the whole dispatch.
+A script wrapped with `schedule_script()` instead waits, on the minion, for
+a wall-clock start time and reports when it actually started and stopped,
+which `parse_timing()` reads back from the console output.
+
+`plan_schedule()` decides those start times from the `saltstack`
+configuration section: the same for every minion with `synchronized_start`,
+or spread over `stagger_window` seconds following a `stagger_profile`, so
+that the services under test do not all fail, nor recover, at once. The
+schedule is computed upfront and enforced by the minions themselves, the
+runner does not need a timer per minion.
+
+Minion clocks are expected to be kept in sync, with NTP for instance.
+"""
+import math
+import random
+import re
+from collections import OrderedDict
+from time import time
+from typing import Any, Dict, List, Tuple
+
+from chaoslib.exceptions import FailedActivity
+
+from .constants import OS_LINUX, OS_WINDOWS
+
+__all__ = ["plan_schedule", "stagger_offsets", "schedule_script",
+           "parse_timing", "DEFAULT_START_MARGIN", "PROFILES",
+           "TIMING_MARKER"]
+
+# seconds given to the dispatch before a synchronized start
+DEFAULT_START_MARGIN = 10
+PROFILES = ("linear", "exponential", "random")
+TIMING_MARKER = "chaossaltstack-timing"
+
+_TIMING = re.compile(
+    r"{} (started|stopped)=(\d+(?:\.\d+)?)".format(TIMING_MARKER))
+
+_LINUX_PRELUDE = """start_at='{start_at:.3f}'
+now=$(date +%s.%N)
+case "$now" in *N) now=$(date +%s);; esac
+sleep $(awk "BEGIN {{ d = $start_at - $now; print (d > 0) ? d : 0 }}")
+echo "{marker} started=$(date +%s.%N)"
+(
+"""
+_LINUX_EPILOGUE = """
+)
+ret=$?
+echo "{marker} stopped=$(date +%s.%N)"
+exit $ret"""
+
+_WINDOWS_PRELUDE = """$start_at = [double]'{start_at:.3f}'
+function Get-EpochTime {{
+    [DateTimeOffset]::UtcNow.ToUnixTimeMilliseconds() / 1000
+}}
+$delay = $start_at - (Get-EpochTime)
+if ($delay -gt 0) {{ Start-Sleep -Milliseconds ([int]($delay * 1000)) }}
+Write-Output ("{marker} started={{0:F3}}" -f (Get-EpochTime))
+& {{
+"""
+_WINDOWS_EPILOGUE = """
+}}
+Write-Output ("{marker} stopped={{0:F3}}" -f (Get-EpochTime))"""
+
+
+def plan_schedule(settings: Dict[str, Any], minions: List[str],
+                  duration: int) -> Dict[str, Tuple[float, int]]:
+    """
+    Return the `(start_at, duration)` of each minion, earliest first, or
+    `None` when the scripts should start as soon as they are received.
+
+    With `stagger_window`, the starts are spread over that many seconds
+    following `stagger_profile`:
+
+    * `linear`: evenly
+    * `exponential`: in waves doubling in size, 1, 2, 4, 8... minions
+    * `random`: uniformly at random, reproducible with `stagger_seed`
+
+    Each fault lasts `duration`, so the ends are spread like the starts. With
+    `recovery_window`, the durations are also lengthened by offsets from 0 to
+    that many seconds, following the same profile, which spreads the ends
+    over up to `recovery_window` more seconds than the starts. A fault then
+    lasts up to `recovery_window` seconds longer than `duration`.
+    """
+    window = float(settings.get("stagger_window") or 0)
+    recovery = float(settings.get("recovery_window") or 0)
+    synchronized = bool(settings.get("synchronized_start"))
+    if not (synchronized or window or recovery):
+        return None
+
+    profile = settings.get("stagger_profile", "linear")
+    rng = random.Random(settings.get("stagger_seed"))
+    margin = float(settings.get(
+        "start_margin", DEFAULT_START_MARGIN if synchronized else 0))
+    start_at = time() + margin
+    starts = stagger_offsets(len(minions), window, profile, rng)
+    extra = stagger_offsets(len(minions), recovery, profile, rng)
+
+    plan = sorted(
+        (start_at + offset, minion, duration + int(round(more)))
+        for minion, offset, more in zip(minions, starts, extra))
+    return OrderedDict(
+        (minion, (start, length)) for start, minion, length in plan)
+
+
+def stagger_offsets(count: int, window: float, profile: str = "linear",
+                    rng: random.Random = None) -> List[float]:
+    """
+    Spread `count` offsets from 0 to `window` seconds following `profile`.
+    """
+    if profile not in PROFILES:
+        raise FailedActivity(
+            "Unknown stagger_profile '{}', expected one of {}".format(
+                profile, ", ".join(PROFILES)))
+    if count <= 1 or window <= 0:
+        return [0.0] * count
+    if profile == "random":
+        rng = rng or random.Random()
+        return [rng.uniform(0, window) for _ in range(count)]
+    if profile == "exponential":
+        waves = int(math.log2(count))
+        if waves == 0:
+            return [0.0] * count
+        return [window * int(math.log2(i + 1)) / waves
+                for i in range(count)]
+    return [window * i / (count - 1) for i in range(count)]
+
+
+def schedule_script(script_content: str, os_type: str,
+                    start_at: float) -> str:
+    """
+    Wrap a fault script so that it starts at the `start_at` epoch time,
+    right away when that time has passed already, and prints its actual
+    start and stop times.
+    """
+    if os_type == OS_LINUX:
+        prelude, epilogue = _LINUX_PRELUDE, _LINUX_EPILOGUE
+    elif os_type == OS_WINDOWS:
+        prelude, epilogue = _WINDOWS_PRELUDE, _WINDOWS_EPILOGUE
+    else:
+        raise FailedActivity(
+            "Cannot schedule scripts on OS: {}".format(os_type))
+    return prelude.format(start_at=start_at, marker=TIMING_MARKER) + \
+        script_content + epilogue.format(marker=TIMING_MARKER)
+
+
+def parse_timing(console: str) -> Dict[str, float]:
+    """
+    Read the `started` and `stopped` epoch times printed by a scheduled
+    script, either may be missing when the script did not get that far.
+    """
+    return dict(
+        (event, float(value)) for event, value in _TIMING.findall(console))
@@ -1,18 +1,45 @@
-Param([parameter(mandatory=$true)] [int]$duration)
+# Script for BurnCPU Chaos Monkey
+# $duration (seconds) and $utilisation (percentage of each processor) are
+# set by the lines prepended to this script.
 
-$CPUs = (Get-WMIObject win32_processor | Measure-Object NumberofLogicalProcessors -sum).sum
-Write-Output "Stressing $Cpus CPUs for $duration seconds."
+$cpus = (Get-CimInstance Win32_Processor | Measure-Object NumberOfLogicalProcessors -Sum).Sum
+Write-Output "Stressing $instance_id $cpus CPUs at $utilisation% for $duration seconds."
 
-ForEach ($Number in 1..$CPUs){
-    Start-Job -ScriptBlock{
-        param ($duration)
-        $stopwatch =  [system.diagnostics.stopwatch]::StartNew()
-        $result = 1;
-        while ($stopwatch.Elapsed.TotalSeconds -lt $duration) {
-            $result = $result * $number
-        }
-    } -Arg $duration
+# one thread per processor within this process, rather than a process each
+$burn = {
+    param ([int]$duration, [int]$utilisation)
+    # busy for $utilisation% of every 100ms slice
+    $busy = $utilisation
+    $total = [Diagnostics.Stopwatch]::StartNew()
+    $slice = New-Object Diagnostics.Stopwatch
+    while ($total.Elapsed.TotalSeconds -lt $duration) {
+        $slice.Restart()
+        while ($slice.ElapsedMilliseconds -lt $busy) { }
+        if ($busy -lt 100) { [Threading.Thread]::Sleep(100 - $busy) }
+    }
+}
+$pool = [RunspaceFactory]::CreateRunspacePool(1, $cpus)
+$pool.Open()
+$threads = foreach ($i in 1..$cpus) {
+    $shell = [PowerShell]::Create()
+    $shell.RunspacePool = $pool
+    [void]$shell.AddScript($burn).AddArgument([int]$duration).AddArgument([int]$utilisation)
+    @{ Shell = $shell; Handle = $shell.BeginInvoke() }
+}
 
+$ret = 0
+try {
+    foreach ($thread in $threads) { [void]$thread.Shell.EndInvoke($thread.Handle) }
+} catch {
+    $ret = 1
+} finally {
+    foreach ($thread in $threads) { $thread.Shell.Dispose() }
+    $pool.Close()
 }
+Write-Output "Stressing $cpus CPUs for $duration seconds. Done"
 
-Get-Job | Wait-Job
\ No newline at end of file
+if ($ret -eq 0) {
+    Write-Output "experiment strees_cpu <$instance_id> -> success"
+} else {
+    Write-Output "experiment strees_cpu <$instance_id> -> fail"
+}
@@ -2,7 +2,7 @@
 cpus=$(cat /proc/cpuinfo | awk "/^processor/{print $3}" | wc -l)
 pids=""
 echo "Stressing $instance_id $cpus CPUs for $duration seconds."
-trap 'for p in $pids; do kill $p; done' 0
+trap 'for p in $pids; do kill $p; kill -CONT $p; done' 0
 
 for i in $cpus
 do
@@ -10,7 +10,21 @@ do
         do :
         done & pids="$pids $!";
 done
-sleep $duration
+if [ "${utilisation:-100}" -lt 100 ]; then
+    # let the loops run $utilisation% of every 100ms
+    on=$(awk "BEGIN { print $utilisation / 1000 }")
+    off=$(awk "BEGIN { print (100 - $utilisation) / 1000 }")
+    slices=$((duration * 10))
+    while [ $slices -gt 0 ]; do
+        kill -STOP $pids
+        sleep $off
+        kill -CONT $pids
+        sleep $on
+        slices=$((slices - 1))
+    done
+else
+    sleep $duration
+fi
 echo "Stressing $cpus CPUs for $duration seconds. Done"
 
 ret=$?
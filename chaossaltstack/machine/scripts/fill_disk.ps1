@@ -1,13 +1,11 @@
 #Script for FillDisk Chaos Monkey
-
-
-Param([parameter(mandatory=$true)] [int]$duration,
-[parameter(mandatory=$true)] [int]$size)
+# $duration (seconds) and $size (MB) are set by the lines prepended to this
+# script.
 
 Write-Host "Filling disk with $size MB of random data for $duration seconds."
 
-$Msize = $size*1024000
+$Msize = [int]$size*1024000
 
 fsutil file createnew C:/burn $Msize
-Start-Sleep -s $duration
-rm C:/burn
\ No newline at end of file
+Start-Sleep -s ([int]$duration)
+rm C:/burn
@@ -0,0 +1,32 @@
+# Script reverting what chaossaltstack faults may have left behind, safe to
+# run any number of times.
+# The patterns are bracketed so that they do not match the command line of
+# this very script, which holds their text.
+
+$processes = Get-CimInstance Win32_Process
+foreach ($pattern in @('[c]haossaltstack-fault', '[S]tressing .* CPUs for', '[F]illing disk with')) {
+    $ids = @($processes | Where-Object {
+        $_.CommandLine -match $pattern -and $_.ProcessId -ne $PID
+    } | ForEach-Object { $_.ProcessId })
+    if ($ids.Count -gt 0) {
+        # the background jobs of combined faults are child processes
+        $processes | Where-Object { $ids -contains $_.ParentProcessId } |
+            ForEach-Object { Stop-Process -Id $_.ProcessId -Force -ErrorAction SilentlyContinue }
+        $ids | ForEach-Object { Stop-Process -Id $_ -Force -ErrorAction SilentlyContinue }
+        Write-Output ("chaossaltstack-cleaned processes {0} matching {1}" -f ($ids -join ','), $pattern)
+    }
+}
+
+if (Test-Path C:/burn) {
+    Remove-Item -Force C:/burn
+    Write-Output "chaossaltstack-cleaned file C:/burn"
+}
+
+# the logs of status-only results
+Get-ChildItem -Path C:/Windows/Temp -Filter 'chaossaltstack-*.log' -ErrorAction SilentlyContinue |
+    ForEach-Object {
+        Remove-Item -Force $_.FullName
+        Write-Output ("chaossaltstack-cleaned file {0}" -f $_.FullName)
+    }
+
+Write-Output "experiment rollback -> success"
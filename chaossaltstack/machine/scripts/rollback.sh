@@ -0,0 +1,34 @@
+# Script reverting what chaossaltstack faults may have left behind, safe to
+# run any number of times.
+# The patterns are bracketed so that they do not match the command line of
+# this very script, which holds their text.
+
+for pattern in '[c]haossaltstack-fault' '[S]tressing .* CPUs for' \
+    '[e]xperiment burnio' '[e]xperiment fill_disk' \
+    '[e]xperiment network_latency' '[e]xperiment kill' \
+    '[/]tmp/loop.sh' 'of=/root/bur[n]'; do
+    pids=$(pgrep -f "$pattern")
+    if [ -n "$pids" ]; then
+        kill $pids 2>/dev/null
+        # stopped by a partial CPU burn, they must resume to terminate
+        kill -CONT $pids 2>/dev/null
+        echo "chaossaltstack-cleaned processes $(echo $pids | tr ' ' ',') matching $pattern"
+    fi
+done
+
+for dev in $(tc qdisc show 2>/dev/null | awk '($2 == "netem" || $2 == "tbf") && $6 == "root" { print $5 }'); do
+    if tc qdisc del dev "$dev" root 2>/dev/null; then
+        echo "chaossaltstack-cleaned qdisc root of $dev"
+    fi
+done
+
+# split as well so as not to match the loop pattern above
+loop=/tmp/loop
+# along with the logs of status-only results
+for file in /root/burn $loop.sh /tmp/chaossaltstack-*.log; do
+    if [ -e "$file" ] && rm -f "$file"; then
+        echo "chaossaltstack-cleaned file $file"
+    fi
+done
+
+echo "experiment rollback -> success"
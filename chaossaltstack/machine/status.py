@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Status-only job results.
+
+With the `result_mode` setting of the `saltstack` configuration section set
+to `status`, a script wrapped with `status_script()` writes its output to a
+log file on the minion and prints only its final line, the status of the
+fault, along with the lines reporting a failure and the markers of the
+other wrappers. The job cache of the master, and the responses the runner
+collects, then hold a line or two per minion however verbose the scripts
+are. The log of a script which succeeded is deleted right away. The full
+log of the minions which failed is fetched, then deleted, afterwards with
+`log_command()`, and only theirs.
+"""
+import uuid
+
+from chaoslib.exceptions import FailedActivity
+
+from .constants import OS_LINUX, OS_WINDOWS
+
+__all__ = ["RESULT_MODES", "check_result_mode", "new_log_token",
+           "status_script", "log_path", "log_command"]
+
+RESULT_MODES = ("full", "status")
+
+_LINUX_PRELUDE = """chaos_log='{path}'
+(
+"""
+# the lines kept are printed in order, the final one whatever it holds, and
+# the log is kept only when the script failed
+_LINUX_EPILOGUE = """
+) > "$chaos_log" 2>&1
+chaos_ret=$?
+awk '{{ if (NR > 1 && keep) print prev; prev = $0
+       keep = /^chaossaltstack-|fail/; if (/fail/) failed = 1 }}
+     END {{ if (NR) print prev; exit failed }}' "$chaos_log" &&
+    [ $chaos_ret -eq 0 ] && rm -f "$chaos_log"
+exit $chaos_ret"""
+
+_WINDOWS_PRELUDE = """$chaos_log = '{path}'
+& {{
+"""
+_WINDOWS_EPILOGUE = """
+}} *>&1 | Out-File -FilePath $chaos_log -Encoding utf8
+$chaos_lines = @(Get-Content $chaos_log)
+$chaos_failed = $false
+for ($i = 0; $i -lt $chaos_lines.Count; $i++) {{
+    if ($chaos_lines[$i] -match 'fail') {{ $chaos_failed = $true }}
+    if ($i -eq $chaos_lines.Count - 1 -or
+            $chaos_lines[$i] -match '^chaossaltstack-|fail') {{
+        Write-Output $chaos_lines[$i]
+    }}
+}}
+if (-not $chaos_failed) {{ Remove-Item -Force $chaos_log }}"""
+
+_LOG_PATHS = {
+    OS_LINUX: "/tmp/chaossaltstack-{token}.log",
+    OS_WINDOWS: "C:/Windows/Temp/chaossaltstack-{token}.log",
+}
+
+
+def check_result_mode(mode: str) -> str:
+    """
+    Return the `result_mode` if it is a known one.
+    """
+    if mode not in RESULT_MODES:
+        raise FailedActivity(
+            "Unknown result_mode '{}', expected one of {}".format(
+                mode, ", ".join(RESULT_MODES)))
+    return mode
+
+
+def new_log_token() -> str:
+    """
+    Return a name for the logs of the jobs of one action, the same on every
+    minion so that their scripts remain identical.
+    """
+    return uuid.uuid4().hex[:16]
+
+
+def log_path(os_type: str, token: str) -> str:
+    if os_type not in _LOG_PATHS:
+        raise FailedActivity(
+            "Cannot keep logs on OS: {}".format(os_type))
+    return _LOG_PATHS[os_type].format(token=token)
+
+
+def status_script(script_content: str, os_type: str, token: str) -> str:
+    """
+    Wrap a fault script so that its output goes to a log file on the minion
+    and only its status is printed.
+    """
+    path = log_path(os_type, token)
+    if os_type == OS_LINUX:
+        prelude, epilogue = _LINUX_PRELUDE, _LINUX_EPILOGUE
+    else:
+        prelude, epilogue = _WINDOWS_PRELUDE, _WINDOWS_EPILOGUE
+    return prelude.format(path=path) + script_content + epilogue.format()
+
+
+def log_command(os_type: str, token: str) -> str:
+    """
+    Return the command printing the full log of a wrapped script, then
+    deleting it.
+    """
+    path = log_path(os_type, token)
+    if os_type == OS_LINUX:
+        return "cat '{0}'; rm -f '{0}'".format(path)
+    return "Get-Content '{0}'; Remove-Item -Force '{0}'".format(path)
@@ -0,0 +1,398 @@
+# -*- coding: utf-8 -*-
+"""
+Timing instrumentation of salt-api interactions and activity phases.
+
+Every request made by `salt_api_client` and every phase of an activity
+(target resolution, dispatch, wait and result collection) is reported to the
+metrics hooks registered in the process, as well as to the collector of the
+activity currently running in the calling thread.
+
+A hook is any object implementing the `MetricsHook` interface, either added
+with `add_metrics_hook()` or named in the `saltstack` configuration section:
+
+    * metrics_hook: dotted path of a `MetricsHook` class to instantiate
+    * metrics_textfile: path of a Prometheus text file to export to
+    * metrics_summary: attach a per-activity summary to action results
+"""
+import importlib
+import os
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from time import monotonic
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+__all__ = ["MetricsHook", "Histogram", "Collector",
+           "PrometheusTextfileExporter", "add_metrics_hook",
+           "remove_metrics_hook", "configure_metrics", "record_request",
+           "record_script", "phase", "activity_metrics", "bind"]
+
+# upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0)
+
+_hooks = []  # type: List[MetricsHook]
+_configured = dict()  # type: Dict[Tuple[str, str], MetricsHook]
+_hooks_lock = threading.Lock()
+_local = threading.local()
+
+
+class MetricsHook:
+    """
+    Receives metrics events. Implementations must be thread-safe, events may
+    be emitted concurrently.
+    """
+    def observe_request(self, event: Dict[str, Any]):
+        """
+        Called once per salt-api request with the following keys:
+
+        * fun: the salt function, or `login`
+        * client: the salt-api client (`local`, `local_async`, `runner`)
+        * seconds: wall time of the request, retries included
+        * sent_bytes / received_bytes: size of the HTTP bodies on the wire
+        * sent_raw_bytes / received_raw_bytes: size of the same bodies
+          before compression
+        * retries: number of attempts beyond the first one
+        * status: the HTTP status code, or `error`
+        """
+
+    def observe_phase(self, activity: str, name: str, seconds: float):
+        """
+        Called when an activity completes one of its phases.
+        """
+
+    def observe_script(self, name: str, raw_bytes: int, sent_bytes: int):
+        """
+        Called when a script is rendered, with its size before and after
+        minification.
+        """
+
+    def flush(self):
+        """
+        Called when an activity completes.
+        """
+
+
+class Histogram:
+    """
+    Cumulative histogram with fixed bucket boundaries, as Prometheus does.
+    """
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> Iterator[Tuple[str, int]]:
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            yield ("+Inf" if bound == float("inf") else repr(bound)), total
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate a quantile by linear interpolation within its bucket.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        lower = 0.0
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            if seen + count >= rank and count:
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return self.buckets[-1]
+
+
+class Collector(MetricsHook):
+    """
+    Aggregates events per salt function and per activity phase.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = dict()  # type: Dict[str, Histogram]
+        self.sent_bytes = dict()  # type: Dict[str, int]
+        self.received_bytes = dict()  # type: Dict[str, int]
+        self.sent_raw_bytes = dict()  # type: Dict[str, int]
+        self.received_raw_bytes = dict()  # type: Dict[str, int]
+        self.scripts = dict()  # type: Dict[str, List[int]]
+        self.retries = dict()  # type: Dict[str, int]
+        self.errors = dict()  # type: Dict[str, int]
+        self.phases = dict()  # type: Dict[Tuple[str, str], float]
+
+    def observe_request(self, event: Dict[str, Any]):
+        fun = event["fun"]
+        with self._lock:
+            if fun not in self.latency:
+                self.latency[fun] = Histogram()
+                self.sent_bytes[fun] = self.received_bytes[fun] = 0
+                self.sent_raw_bytes[fun] = self.received_raw_bytes[fun] = 0
+                self.retries[fun] = self.errors[fun] = 0
+            self.latency[fun].observe(event["seconds"])
+            self.sent_bytes[fun] += event.get("sent_bytes", 0)
+            self.received_bytes[fun] += event.get("received_bytes", 0)
+            self.sent_raw_bytes[fun] += event.get(
+                "sent_raw_bytes", event.get("sent_bytes", 0))
+            self.received_raw_bytes[fun] += event.get(
+                "received_raw_bytes", event.get("received_bytes", 0))
+            self.retries[fun] += event.get("retries", 0)
+            if event.get("status") == "error":
+                self.errors[fun] += 1
+
+    def observe_phase(self, activity: str, name: str, seconds: float):
+        with self._lock:
+            key = (activity, name)
+            self.phases[key] = self.phases.get(key, 0.0) + seconds
+
+    def observe_script(self, name: str, raw_bytes: int, sent_bytes: int):
+        with self._lock:
+            counts = self.scripts.setdefault(name, [0, 0, 0])
+            counts[0] += 1
+            counts[1] += raw_bytes
+            counts[2] += sent_bytes
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Compact, JSON serializable view of what was collected.
+        """
+        with self._lock:
+            requests = dict()
+            for fun, histogram in self.latency.items():
+                requests[fun] = {
+                    "count": histogram.count,
+                    "seconds": round(histogram.sum, 6),
+                    "p50": round(histogram.quantile(0.5), 6),
+                    "p95": round(histogram.quantile(0.95), 6),
+                    "sent_bytes": self.sent_bytes[fun],
+                    "received_bytes": self.received_bytes[fun],
+                    "sent_raw_bytes": self.sent_raw_bytes[fun],
+                    "received_raw_bytes": self.received_raw_bytes[fun],
+                    "retries": self.retries[fun],
+                    "errors": self.errors[fun]
+                }
+            phases = dict()
+            for (_, name), seconds in self.phases.items():
+                phases[name] = round(phases.get(name, 0.0) + seconds, 6)
+            scripts = dict(
+                (name, {"count": c[0], "raw_bytes": c[1], "sent_bytes": c[2]})
+                for name, c in self.scripts.items())
+            return {"requests": requests, "phases": phases,
+                    "scripts": scripts}
+
+
+class PrometheusTextfileExporter(Collector):
+    """
+    Writes the process-wide metrics in the Prometheus text exposition
+    format, e.g. for the node_exporter textfile collector, every time an
+    activity completes.
+    """
+    def __init__(self, path: str):
+        Collector.__init__(self)
+        self.path = path
+
+    def render(self) -> str:
+        lines = [
+            "# HELP chaossaltstack_request_seconds salt-api request latency",
+            "# TYPE chaossaltstack_request_seconds histogram"
+        ]
+        with self._lock:
+            for fun, histogram in sorted(self.latency.items()):
+                for le, count in histogram.cumulative():
+                    lines.append(
+                        'chaossaltstack_request_seconds_bucket'
+                        '{{fun="{}",le="{}"}} {}'.format(fun, le, count))
+                lines.append('chaossaltstack_request_seconds_sum'
+                             '{{fun="{}"}} {}'.format(fun, histogram.sum))
+                lines.append('chaossaltstack_request_seconds_count'
+                             '{{fun="{}"}} {}'.format(fun, histogram.count))
+            for name, values, help_ in (
+                    ("sent_bytes", self.sent_bytes, "request body bytes"),
+                    ("received_bytes", self.received_bytes,
+                     "response body bytes"),
+                    ("sent_raw_bytes", self.sent_raw_bytes,
+                     "request body bytes before compression"),
+                    ("received_raw_bytes", self.received_raw_bytes,
+                     "response body bytes after decompression"),
+                    ("retries", self.retries, "salt-api request retries"),
+                    ("errors", self.errors, "failed salt-api requests")):
+                metric = "chaossaltstack_request_{}_total".format(name)
+                lines.append("# HELP {} {}".format(metric, help_))
+                lines.append("# TYPE {} counter".format(metric))
+                for fun, value in sorted(values.items()):
+                    lines.append(
+                        '{}{{fun="{}"}} {}'.format(metric, fun, value))
+            lines.append("# HELP chaossaltstack_phase_seconds_total "
+                         "wall time spent per activity phase")
+            lines.append("# TYPE chaossaltstack_phase_seconds_total counter")
+            for (activity, name), seconds in sorted(self.phases.items()):
+                lines.append(
+                    'chaossaltstack_phase_seconds_total'
+                    '{{activity="{}",phase="{}"}} {}'.format(
+                        activity, name, seconds))
+            lines.append("# HELP chaossaltstack_script_bytes_total "
+                         "size of the scripts sent, before and after "
+                         "minification")
+            lines.append("# TYPE chaossaltstack_script_bytes_total counter")
+            for name, counts in sorted(self.scripts.items()):
+                for stage, value in (("raw", counts[1]), ("sent", counts[2])):
+                    lines.append(
+                        'chaossaltstack_script_bytes_total'
+                        '{{script="{}",stage="{}"}} {}'.format(
+                            name, stage, value))
+        return "\n".join(lines) + "\n"
+
+    def flush(self):
+        # write then rename so collectors never read a partial file
+        tmp = "{}.{}.tmp".format(self.path, os.getpid())
+        with open(tmp, "w") as f:
+            f.write(self.render())
+        os.replace(tmp, self.path)
+
+
+def add_metrics_hook(hook: MetricsHook):
+    with _hooks_lock:
+        if hook not in _hooks:
+            _hooks.append(hook)
+
+
+def remove_metrics_hook(hook: MetricsHook):
+    with _hooks_lock:
+        if hook in _hooks:
+            _hooks.remove(hook)
+
+
+def configure_metrics(settings: Dict[str, Any] = None):
+    """
+    Install the hooks named in the `saltstack` configuration settings, once
+    per process.
+    """
+    settings = settings or {}
+    wanted = []
+    if settings.get("metrics_textfile"):
+        wanted.append(("textfile", settings["metrics_textfile"]))
+    if settings.get("metrics_hook"):
+        wanted.append(("hook", settings["metrics_hook"]))
+
+    for key in wanted:
+        with _hooks_lock:
+            if key in _configured:
+                continue
+        kind, value = key
+        if kind == "textfile":
+            hook = PrometheusTextfileExporter(value)
+        else:
+            module, _, name = value.rpartition(".")
+            hook = getattr(importlib.import_module(module), name)()
+        with _hooks_lock:
+            _configured.setdefault(key, hook)
+        add_metrics_hook(_configured[key])
+
+
+def record_request(event: Dict[str, Any]):
+    """
+    Report one salt-api request to the hooks and the current activity.
+    """
+    for hook in _current_hooks():
+        try:
+            hook.observe_request(event)
+        except Exception:
+            _hook_failed()
+
+
+def record_script(name: str, raw_bytes: int, sent_bytes: int):
+    """
+    Report the size of a rendered script before and after minification.
+    """
+    for hook in _current_hooks():
+        try:
+            hook.observe_script(name, raw_bytes, sent_bytes)
+        except Exception:
+            _hook_failed()
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """
+    Time the enclosed block as a phase of the current activity.
+    """
+    start = monotonic()
+    try:
+        yield
+    finally:
+        seconds = monotonic() - start
+        activity = getattr(_local, "activity", None) or "-"
+        for hook in _current_hooks():
+            try:
+                hook.observe_phase(activity, name, seconds)
+            except Exception:
+                _hook_failed()
+
+
+@contextmanager
+def activity_metrics(activity: str) -> Iterator[Collector]:
+    """
+    Collect the metrics of one activity run by the calling thread, flushing
+    the registered hooks once it completes.
+    """
+    previous = getattr(_local, "collector", None), \
+        getattr(_local, "activity", None)
+    collector = Collector()
+    _local.collector, _local.activity = collector, activity
+    try:
+        yield collector
+    finally:
+        _local.collector, _local.activity = previous
+        for hook in list(_hooks):
+            try:
+                hook.flush()
+            except Exception:
+                _hook_failed()
+
+
+def bind(func: Callable) -> Callable:
+    """
+    Wrap `func` so it reports to the current activity when called from
+    another thread, such as an executor worker.
+    """
+    collector = getattr(_local, "collector", None)
+    activity = getattr(_local, "activity", None)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        previous = getattr(_local, "collector", None), \
+            getattr(_local, "activity", None)
+        _local.collector, _local.activity = collector, activity
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.collector, _local.activity = previous
+    return wrapper
+
+
+###############################################################################
+# Private functions
+###############################################################################
+def _hook_failed():
+    # logzero is imported here only, keeping this module cheap to import
+    from logzero import logger
+    logger.debug("metrics hook failed", exc_info=True)
+
+
+def _current_hooks() -> List[MetricsHook]:
+    hooks = list(_hooks)
+    collector = getattr(_local, "collector", None)
+    if collector is not None:
+        hooks.append(collector)
+    return hooks
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Several Salt Masters driven as one.
+
+When the `saltstack` secrets hold `SALTMASTERS`, a list of masters each
+given with the same keys as a single one (`SALTMASTER_HOST`, then
+`SALTMASTER_USER` and `SALTMASTER_PASSWORD` or `SALTMASTER_TOKEN`), along
+with an optional `name` and `minions` glob patterns, `saltstack_api_client()`
+returns a `MultiMasterClient` instead of a `salt_api_client`.
+
+It offers the same methods and sends each call to the masters of the
+targeted minions, all of them at once, merging what they return. A minion is
+routed to the masters whose `minions` patterns match it, or else to the
+masters without patterns. Once a master answers for a minion, the minion is
+routed to that master only: as every action first resolves its targets,
+the masters discover their minions on the first call. A job published on
+several masters is given a JID listing the master and the JID of each, such
+as `multi:eu=20190830103239148771;us=20190830103239150012`, which any
+client of the same masters, in this process or another one, can look up.
+"""
+import threading
+from collections import OrderedDict
+from fnmatch import fnmatchcase
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+from urllib.parse import quote, unquote
+
+from chaoslib.exceptions import FailedActivity
+
+from .fanout import call_all, stream_all
+
+__all__ = ["MultiMasterClient", "MULTI_JID_PREFIX", "master_jid",
+           "parse_master_jid"]
+
+MULTI_JID_PREFIX = "multi:"
+
+
+class MultiMasterClient:
+    """
+    Facade over one `salt_api_client` per master.
+    """
+    def __init__(self, masters: List[Tuple[str, Any, List[str]]]):
+        # name -> (client, minion patterns)
+        self.masters = OrderedDict(
+            (name, (client, list(patterns or [])))
+            for name, client, patterns in masters)
+        self.routes = dict()  # type: Dict[str, str]
+        self._lock = threading.Lock()
+
+    def run_cmd(self, tgt, method: str, arg=None, kwarg=None):
+        return self.__merge__(self.__fan_out__(
+            tgt, lambda c, t: c.run_cmd(t, method, arg, kwarg)))
+
+    def async_run_cmd(self, tgt, method: str, arg=None, kwarg=None):
+        jids = self.__fan_out__(
+            tgt, lambda c, t: c.async_run_cmd(t, method, arg, kwarg))
+        if not jids:
+            raise FailedActivity("No Salt Master for {}".format(tgt))
+        if len(jids) == 1:
+            return str(jids[0][1])
+        return master_jid(jids)
+
+    def get_async_cmd_result(self, jid: str):
+        return self.__merge__(self.__fan_out_job__(
+            jid, lambda c, j: c.get_async_cmd_result(j)))
+
+    def async_cmd_exit_success(self, jid: str):
+        return self.__merge__(self.__fan_out_job__(
+            jid, lambda c, j: c.async_cmd_exit_success(j)))
+
+    def get_grains_get(self, tgt, item):
+        return self.__merge__(self.__fan_out__(
+            tgt, lambda c, t: c.get_grains_get(t, item)))
+
+    def iter_run_cmd(self, tgt, method: str, arg=None, kwarg=None):
+        return self.__stream__([
+            (name, lambda c=client, t=targets: c.iter_run_cmd(
+                t, method, arg, kwarg))
+            for name, (client, targets) in self.__route__(tgt).items()])
+
+    def iter_async_cmd_result(self, jid: str):
+        return self.__stream__([
+            (name, lambda c=client, j=master_jid: c.iter_async_cmd_result(j))
+            for name, client, master_jid in self.__job__(jid)])
+
+    def iter_async_cmd_exit_success(self, jid: str):
+        return self.__stream__([
+            (name, lambda c=client, j=master_jid:
+                c.iter_async_cmd_exit_success(j))
+            for name, client, master_jid in self.__job__(jid)])
+
+    ###########################################################################
+    # Private methods
+    ###########################################################################
+    def __route__(self, tgt) -> Dict[str, Tuple[Any, Any]]:
+        """
+        Split the targets by master, keeping a single minion as a string.
+        """
+        minions = [tgt] if isinstance(tgt, str) else list(tgt)
+        routed = OrderedDict()
+        with self._lock:
+            for k in minions:
+                names = [self.routes[k]] if k in self.routes \
+                    else self.__candidates__(k)
+                for name in names:
+                    routed.setdefault(name, []).append(k)
+        return OrderedDict(
+            (name, (self.masters[name][0],
+                    targets[0] if isinstance(tgt, str) else targets))
+            for name, targets in routed.items())
+
+    def __candidates__(self, minion: str) -> List[str]:
+        matching = [
+            name for name, (_, patterns) in self.masters.items()
+            if any(fnmatchcase(minion, p) for p in patterns)]
+        return matching or [
+            name for name, (_, patterns) in self.masters.items()
+            if not patterns]
+
+    def __job__(self, jid: str) -> List[Tuple[str, Any, str]]:
+        jobs = parse_master_jid(jid)
+        if jobs is None:
+            # published on a single master, which may be any of them
+            jobs = [(name, str(jid)) for name in self.masters]
+        unknown = [name for name, _ in jobs if name not in self.masters]
+        if unknown:
+            raise FailedActivity(
+                "No Salt Master named {} for job {}".format(
+                    ", ".join(unknown), jid))
+        return [(name, self.masters[name][0], j) for name, j in jobs]
+
+    def __fan_out__(self, tgt, call: Callable[[Any, Any], Any]
+                    ) -> List[Tuple[str, Any]]:
+        routed = self.__route__(tgt)
+        return self.__run__([
+            (name, lambda c=client, t=targets: call(c, t))
+            for name, (client, targets) in routed.items()])
+
+    def __fan_out_job__(self, jid: str, call: Callable[[Any, str], Any]
+                        ) -> List[Tuple[str, Any]]:
+        return self.__run__([
+            (name, lambda c=client, j=master_jid: call(c, j))
+            for name, client, master_jid in self.__job__(jid)])
+
+    def __run__(self, calls: List[Tuple[str, Callable[[], Any]]]
+                ) -> List[Tuple[str, Any]]:
+        """
+        Make the calls to the masters concurrently and return what each
+        returned, in the order of the calls.
+        """
+        results = call_all([call for _, call in calls])
+        return [(name, result) for (name, _), result in zip(calls, results)]
+
+    def __merge__(self, results: List[Tuple[str, Any]]) -> Dict[str, Any]:
+        merged = dict()
+        for name, result in results:
+            if isinstance(result, dict):
+                self.__learn__(name, result)
+                merged.update(result)
+        return merged
+
+    def __learn__(self, name: str, minions):
+        with self._lock:
+            for k in minions:
+                self.routes.setdefault(k, name)
+
+    def __stream__(self, calls: List[Tuple[str, Callable[[], Iterator]]]
+                   ) -> Iterator[Tuple[str, Any]]:
+        """
+        Yield the `(minion, value)` pairs streamed by every master as they
+        come.
+        """
+        for index, item in stream_all([call for _, call in calls]):
+            self.__learn__(calls[index][0], [item[0]])
+            yield item
+
+
+def master_jid(jids: List[Tuple[str, Any]]) -> str:
+    """
+    Return the JID of a job published on several masters, given the name of
+    each master and the JID of its job.
+    """
+    return MULTI_JID_PREFIX + ";".join(
+        "{}={}".format(quote(name, safe=""), jid) for name, jid in jids)
+
+
+def parse_master_jid(jid: str) -> List[Tuple[str, str]]:
+    """
+    Return the name of each master and the JID of its job from the JID of a
+    job published on several masters, `None` for any other JID.
+    """
+    jid = str(jid)
+    if not jid.startswith(MULTI_JID_PREFIX):
+        return None
+    jobs = []
+    for part in jid[len(MULTI_JID_PREFIX):].split(";"):
+        name, _, master_job = part.rpartition("=")
+        jobs.append((unquote(name), master_job))
+    return jobs
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental parsing of salt-api responses.
+
+salt-api answers `{"return": [{"minion1": ..., "minion2": ...}]}`. Parsing
+such a document with `json.loads()` over thousands of minions holds the raw
+body, the whole decoded document and any copy made of it at once. Instead,
+`iter_return_items()` reads the body chunk by chunk and yields the
+`(minion, value)` pairs of the first `return` element one after the other,
+keeping only the value being decoded in memory.
+"""
+import codecs
+import json
+from typing import Any, Iterable, Iterator, Tuple
+
+__all__ = ["iter_return_items"]
+
+_WHITESPACE = " \t\n\r"
+_decoder = json.JSONDecoder()
+
+
+class _Reader:
+    """
+    Text buffer over an iterable of byte chunks.
+    """
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.exhausted = False
+
+    def fill(self) -> bool:
+        """
+        Append the next chunk to the buffer, dropping what was consumed.
+        Returns `False` once the body is exhausted.
+        """
+        if self.exhausted:
+            return False
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self.exhausted = True
+            text = self._decoder.decode(b"", final=True)
+        else:
+            text = self._decoder.decode(chunk)
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """
+        Return the next non-whitespace character without consuming it.
+        """
+        while True:
+            while self.pos < len(self.buffer) and \
+                    self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                raise ValueError("unexpected end of salt-api response")
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError("expected '{}' in salt-api response at '{}'"
+                             .format(char, self.buffer[self.pos:][:20]))
+        self.pos += 1
+
+    def value(self) -> Any:
+        """
+        Decode the next JSON value, reading more chunks until it is complete.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                if not self.fill():
+                    raise
+                continue
+            # a number at the very end of the buffer may be truncated
+            if end < len(self.buffer) or self.exhausted or \
+                    not self.fill():
+                self.pos = end
+                return value
+
+
+def iter_return_items(chunks: Iterable[bytes]) -> Iterator[Tuple[str, Any]]:
+    """
+    Yield the `(minion, value)` pairs of the first element of the `return`
+    array of a salt-api response read from `chunks`.
+    """
+    reader = _Reader(chunks)
+    reader.expect("{")
+    while True:
+        if reader.peek() == "}":
+            return
+        key = reader.value()
+        reader.expect(":")
+        if key != "return":
+            reader.value()
+        else:
+            reader.expect("[")
+            if reader.peek() == "]":
+                return
+            if reader.peek() != "{":
+                raise ValueError(
+                    "salt-api returned {}".format(reader.value()))
+            reader.expect("{")
+            while reader.peek() != "}":
+                minion = reader.value()
+                reader.expect(":")
+                yield minion, reader.value()
+                if reader.peek() == ",":
+                    reader.pos += 1
+            return
+        if reader.peek() == ",":
+            reader.pos += 1
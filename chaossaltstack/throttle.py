@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Client-side limits protecting the Salt Master from our own requests.
+
+Two kinds of limits are applied to every salt-api call:
+
+* a global cap on the number of requests in flight at any one time
+* a requests-per-second token bucket, with separate budgets for dispatches
+  (`local`/`local_async` calls) and polls (`runner` calls such as
+  `jobs.lookup_jid`)
+
+Limits are shared by every client of the process configured with the same
+values, so parallel activities draw from the same budget.
+"""
+import threading
+from contextlib import contextmanager
+from time import monotonic, sleep
+from typing import Any, Dict, Iterator
+
+__all__ = ["TokenBucket", "Throttle", "get_throttle", "DISPATCH", "POLL"]
+
+DISPATCH = "dispatch"
+POLL = "poll"
+
+_throttles = {}  # type: Dict[tuple, Throttle]
+_throttles_lock = threading.Lock()
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled at `rate` tokens per second, holding at
+    most `burst` tokens. Callers reserve a token and then sleep, outside of
+    the lock, for as long as the bucket is in debt.
+    """
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = float(rate)
+        self.burst = float(burst) if burst else max(self.rate, 1.0)
+        self._tokens = self.burst
+        self._stamp = monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """
+        Take one token, blocking until it is available. Returns the number
+        of seconds spent waiting.
+        """
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            sleep(wait)
+        return wait
+
+
+class Throttle:
+    """
+    Combination of an in-flight cap and per budget token buckets. A limit of
+    `0` disables it.
+    """
+    def __init__(self, max_in_flight: int = 0, dispatch_rate: float = 0,
+                 poll_rate: float = 0, burst: float = 0):
+        self.max_in_flight = int(max_in_flight)
+        self._in_flight = threading.BoundedSemaphore(self.max_in_flight) \
+            if self.max_in_flight > 0 else None
+        self._buckets = dict()
+        if dispatch_rate:
+            self._buckets[DISPATCH] = TokenBucket(dispatch_rate, burst)
+        if poll_rate:
+            self._buckets[POLL] = TokenBucket(poll_rate, burst)
+
+    @property
+    def enabled(self) -> bool:
+        return self._in_flight is not None or bool(self._buckets)
+
+    @contextmanager
+    def slot(self, budget: str = None) -> Iterator[float]:
+        """
+        Hold one request slot for the duration of the block. `budget` selects
+        the token bucket to draw from, `None` only counts against the
+        in-flight cap. Yields the seconds spent waiting for the slot.
+        """
+        waited = 0.0
+        bucket = self._buckets.get(budget)
+        if bucket is not None:
+            waited += bucket.acquire()
+        if self._in_flight is None:
+            yield waited
+            return
+        start = monotonic()
+        self._in_flight.acquire()
+        try:
+            yield waited + monotonic() - start
+        finally:
+            self._in_flight.release()
+
+
+def get_throttle(settings: Dict[str, Any] = None,
+                 scope: str = None) -> Throttle:
+    """
+    Return the process-wide throttle matching the `max_in_flight`,
+    `dispatch_rate`, `poll_rate` and `rate_burst` values of the given
+    `saltstack` configuration settings. Each `scope`, such as the URL of one
+    of several masters, gets a throttle of its own.
+    """
+    settings = settings or {}
+    key = (
+        scope,
+        int(settings.get("max_in_flight", 0) or 0),
+        float(settings.get("dispatch_rate", 0) or 0),
+        float(settings.get("poll_rate", 0) or 0),
+        float(settings.get("rate_burst", 0) or 0)
+    )
+    with _throttles_lock:
+        throttle = _throttles.get(key)
+        if throttle is None:
+            throttle = _throttles[key] = Throttle(*key[1:])
+        return throttle
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Optional OpenTelemetry spans around activities, their phases and salt-api
+calls.
+
+When the `opentelemetry-api` package is not installed, `span()` returns a
+shared no-op object so tracing costs a single function call and no
+allocation. Otherwise spans are created with the tracer provider configured
+by the application, typically through the chaostoolkit-opentracing controls.
+"""
+from functools import wraps
+from typing import Any, Callable, Dict
+
+__all__ = ["span", "traced", "bind_context", "get_tracer", "NOOP_SPAN"]
+
+_UNSET = object()
+_tracer = _UNSET
+
+
+class _NoopSpan:
+    """
+    Stands for both the context manager and the span it yields.
+    """
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc_info) -> bool:
+        return False
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def is_recording(self) -> bool:
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def get_tracer():
+    """
+    Return the OpenTelemetry tracer of this extension, `None` when the
+    library is not available. The import is attempted only once.
+    """
+    global _tracer
+    if _tracer is _UNSET:
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            _tracer = None
+        else:
+            _tracer = trace.get_tracer("chaossaltstack")
+    return _tracer
+
+
+def span(name: str, attributes: Dict[str, Any] = None):
+    """
+    Context manager opening a span named `name` as a child of the current
+    one. The object it yields accepts `set_attribute()` in all cases.
+    """
+    tracer = _tracer if _tracer is not _UNSET else get_tracer()
+    if tracer is None:
+        return NOOP_SPAN
+    return tracer.start_as_current_span(name, attributes=attributes)
+
+
+def traced(func: Callable) -> Callable:
+    """
+    Decorate a chaostoolkit activity so it runs within its own span.
+    """
+    name = "chaossaltstack.{}".format(func.__name__)
+    attributes = {"chaossaltstack.activity": func.__name__}
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with span(name, attributes):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def bind_context(func: Callable) -> Callable:
+    """
+    Wrap `func` so that the spans it opens when called from another thread,
+    such as an executor worker, are children of the current span.
+    """
+    tracer = _tracer if _tracer is not _UNSET else get_tracer()
+    if tracer is None:
+        return func
+    from opentelemetry import context
+    current = context.get_current()
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        token = context.attach(current)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            context.detach(token)
+    return wrapper
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP sessions used to talk to salt-api.
+
+Besides the usual `http(s)://` URLs, a salt-api bound to a Unix domain
+socket can be reached with `unix:///path/to/salt-api.sock`, which saves the
+TCP and TLS overhead when the chaostoolkit runner lives on the master.
+Connections are pooled in both cases.
+"""
+import socket
+import threading
+from urllib.parse import quote, unquote, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool
+from urllib3.exceptions import NewConnectionError
+
+__all__ = ["UNIX_SCHEME", "UnixSocketAdapter", "new_session",
+           "to_requests_url"]
+
+UNIX_SCHEME = "unix://"
+# requests needs a scheme it can mount an adapter on, the socket path is
+# carried, quoted, as the host of the URL
+REQUESTS_UNIX_SCHEME = "http+unix://"
+
+
+def to_requests_url(url: str) -> str:
+    """
+    Translate `unix:///run/salt-api.sock` into the URL requests is given.
+    Other URLs are returned as they are.
+    """
+    if not url.startswith(UNIX_SCHEME):
+        return url
+    return REQUESTS_UNIX_SCHEME + quote(url[len(UNIX_SCHEME):], safe="")
+
+
+class UnixHTTPConnection(HTTPConnection):
+    def __init__(self, socket_path: str, **kwargs):
+        kwargs.pop("host", None)
+        HTTPConnection.__init__(self, "localhost", **kwargs)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        timeout = self.timeout
+        if isinstance(timeout, (int, float)):
+            sock.settimeout(timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError as x:
+            sock.close()
+            # told apart from failures once the request is sent
+            raise NewConnectionError(
+                self, "Failed to connect to {}: {}".format(
+                    self.socket_path, x))
+        self.sock = sock
+
+
+class UnixHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = UnixHTTPConnection
+
+    def __init__(self, socket_path: str, **kwargs):
+        HTTPConnectionPool.__init__(self, "localhost", **kwargs)
+        self.socket_path = socket_path
+
+    def _new_conn(self) -> UnixHTTPConnection:
+        self.num_connections += 1
+        return UnixHTTPConnection(
+            self.socket_path, timeout=self.timeout.connect_timeout)
+
+
+class UnixSocketAdapter(HTTPAdapter):
+    """
+    Adapter sending requests over Unix domain sockets, with one connection
+    pool per socket.
+    """
+    def __init__(self, pool_maxsize: int = 10, **kwargs):
+        self._unix_pools = dict()
+        self._unix_pools_lock = threading.Lock()
+        self._unix_pool_maxsize = pool_maxsize
+        HTTPAdapter.__init__(self, pool_maxsize=pool_maxsize, **kwargs)
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None,
+                                        cert=None):
+        return self.get_connection(request.url, proxies)
+
+    def get_connection(self, url, proxies=None):
+        socket_path = unquote(urlparse(url).netloc)
+        with self._unix_pools_lock:
+            pool = self._unix_pools.get(socket_path)
+            if pool is None:
+                pool = self._unix_pools[socket_path] = UnixHTTPConnectionPool(
+                    socket_path, maxsize=self._unix_pool_maxsize, block=False)
+            return pool
+
+    def request_url(self, request, proxies):
+        return request.path_url
+
+    def close(self):
+        with self._unix_pools_lock:
+            for pool in self._unix_pools.values():
+                pool.close()
+            self._unix_pools.clear()
+        HTTPAdapter.close(self)
+
+
+def new_session(pool_maxsize: int = 10) -> requests.Session:
+    """
+    Create a session with pooled connections over TCP and Unix sockets.
+    """
+    session = requests.Session()
+    session.mount(REQUESTS_UNIX_SCHEME, UnixSocketAdapter(pool_maxsize))
+    for scheme in ("http://", "https://"):
+        session.mount(scheme, HTTPAdapter(pool_maxsize=pool_maxsize))
+    return session
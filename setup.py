@@ -6,6 +6,7 @@ import sys
 import io
 import os
 import setuptools
+from setuptools.command.build_py import build_py
 
 
 def get_version_from_package() -> str:
@@ -21,6 +22,22 @@ def get_version_from_package() -> str:
                 version = version.replace("'", "").strip()
                 return version
 
+
+class build_py_with_manifest(build_py):
+    """
+    Regenerate the discovery manifest of the activities before building,
+    keeping the committed one when the dependencies are not installed.
+    """
+    def run(self):
+        try:
+            from chaossaltstack.discovery import write_manifest
+        except ImportError:
+            pass
+        else:
+            write_manifest(get_version_from_package())
+        build_py.run(self)
+
+
 name = 'chaostoolkit-saltstack'
 desc = 'Chaos Toolkit Extension for SaltStack'
 
@@ -74,6 +91,7 @@ setup_params = dict(
     license=license,
     packages=packages,
     include_package_data=True,
+    cmdclass={'build_py': build_py_with_manifest},
     install_requires=install_require,
     tests_require=test_require,
     setup_requires=pytest_runner,
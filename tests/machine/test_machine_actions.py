@@ -1,3 +1,4 @@
+import threading
 from unittest.mock import MagicMock, patch, mock_open, call
 
 from chaoslib.exceptions import FailedActivity
@@ -5,7 +6,9 @@ import pytest
 
 from chaossaltstack.machine.actions import burn_cpu, burn_io, \
     network_advanced, network_corruption, network_latency, network_loss, \
-    fill_disk, kill_process, killall_processes
+    fill_disk, kill_process, killall_processes, run_faults, rollback, \
+    run_parallel
+from chaossaltstack.machine.preflight import clear_capabilities
 
 
 class AnyStringWith(str):
@@ -13,6 +16,11 @@ class AnyStringWith(str):
         return self in other
 
 
+def pairs(result):
+    # mimics the (minion, value) pairs streamed by the client
+    return lambda jid: iter(result.items())
+
+
 @patch("builtins.open", new_callable=mock_open, read_data="script")
 @patch('chaossaltstack.machine.actions.saltstack_api_client', autospec=True)
 def test_burn_cpu_on_windows(init, open):
@@ -22,18 +30,23 @@ def test_burn_cpu_on_windows(init, open):
 
     client.get_grains_get.return_value = {'CLIENT1': "Windows"}
     client.async_run_cmd.return_value = "20190830103239148771"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': True}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True})
 
     # do
     burn_cpu(instance_ids=['CLIENT1'],
-             execution_duration="1")
+             execution_duration="1", utilisation=50)
 
     open.assert_called_with(AnyStringWith("cpu_stress_test.ps1"))
     client.get_grains_get.assert_called_with(['CLIENT1'], 'kernel')
-    client.async_run_cmd.assert_called_with('CLIENT1', 'cmd.run', AnyStringWith('script'))
-    client.async_cmd_exit_success.assert_called_with('20190830103239148771')
-    client.get_async_cmd_result.assert_called_with('20190830103239148771')
+    client.async_run_cmd.assert_called_with(
+        'CLIENT1', 'cmd.run', AnyStringWith("$utilisation = '50'"),
+        kwarg={'shell': 'powershell'})
+    script = client.async_run_cmd.call_args[0][2]
+    assert "$duration = '1'" in script
+    assert "$instance_id = 'CLIENT1'" in script
+    client.iter_async_cmd_exit_success.assert_called_with('20190830103239148771')
+    client.iter_async_cmd_result.assert_called_with('20190830103239148771')
 
 
 @patch("builtins.open", new_callable=mock_open, read_data="script")
@@ -45,8 +58,8 @@ def test_burn_cpu_on_linux(init, open):
 
     client.get_grains_get.return_value = {'CLIENT1': "Linux"}
     client.async_run_cmd.return_value = "20190830103239148771"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': True}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True})
 
     # do
     burn_cpu(instance_ids=['CLIENT1'],
@@ -55,8 +68,8 @@ def test_burn_cpu_on_linux(init, open):
     open.assert_called_with(AnyStringWith("cpu_stress_test.sh"))
     client.get_grains_get.assert_called_with(['CLIENT1'], 'kernel')
     client.async_run_cmd.assert_called_with('CLIENT1', 'cmd.run', AnyStringWith('script'))
-    client.async_cmd_exit_success.assert_called_with('20190830103239148771')
-    client.get_async_cmd_result.assert_called_with('20190830103239148771')
+    client.iter_async_cmd_exit_success.assert_called_with('20190830103239148771')
+    client.iter_async_cmd_result.assert_called_with('20190830103239148771')
 
 
 @patch("builtins.open", new_callable=mock_open, read_data="script")
@@ -68,8 +81,8 @@ def test_killall_processes_linux(init, open):
 
     client.get_grains_get.return_value = {'CLIENT1': "Linux"}
     client.async_run_cmd.return_value = "20190830103239148771"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "experiment killall_processes -> processes <java> on <CLIENT1>: success"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': True}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "experiment killall_processes -> processes <java> on <CLIENT1>: success"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True})
 
     # do
     killall_processes(instance_ids=['CLIENT1'],
@@ -80,8 +93,8 @@ def test_killall_processes_linux(init, open):
     open.assert_called_with(AnyStringWith("killall_processes.sh"))
     client.get_grains_get.assert_called_with(['CLIENT1'], 'kernel')
     client.async_run_cmd.assert_called_with('CLIENT1', 'cmd.run', AnyStringWith('script'))
-    client.async_cmd_exit_success.assert_called_with('20190830103239148771')
-    client.get_async_cmd_result.assert_called_with('20190830103239148771')
+    client.iter_async_cmd_exit_success.assert_called_with('20190830103239148771')
+    client.iter_async_cmd_result.assert_called_with('20190830103239148771')
 
 
 @patch("builtins.open", new_callable=mock_open, read_data="script")
@@ -93,8 +106,8 @@ def test_kill_process_linux(init, open):
 
     client.get_grains_get.return_value = {'CLIENT1': "Linux"}
     client.async_run_cmd.return_value = "20190830103239148771"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "experiment kill_process -> process <java> on <CLIENT1>: success"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': True}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "experiment kill_process -> process <java> on <CLIENT1>: success"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True})
 
     # do
     kill_process(instance_ids=['CLIENT1'],
@@ -105,8 +118,8 @@ def test_kill_process_linux(init, open):
     open.assert_called_with(AnyStringWith("kill_process.sh"))
     client.get_grains_get.assert_called_with(['CLIENT1'], 'kernel')
     client.async_run_cmd.assert_called_with('CLIENT1', 'cmd.run', AnyStringWith('script'))
-    client.async_cmd_exit_success.assert_called_with('20190830103239148771')
-    client.get_async_cmd_result.assert_called_with('20190830103239148771')
+    client.iter_async_cmd_exit_success.assert_called_with('20190830103239148771')
+    client.iter_async_cmd_result.assert_called_with('20190830103239148771')
 
 
 @patch("builtins.open", new_callable=mock_open, read_data="script")
@@ -118,9 +131,9 @@ def test_burn_cpu_on_linux_two(init, open):
 
     client.get_grains_get.return_value = {'CLIENT1': "Linux", 'CLIENT2': "Linux"}
     client.async_run_cmd.return_value = "20190830103239148772"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success",
-                                                'CLIENT2': "Stressing CLIENT2 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT2> -> success"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': True, 'CLIENT2': True}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success",
+                                                'CLIENT2': "Stressing CLIENT2 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT2> -> success"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True, 'CLIENT2': True})
 
     # do
     burn_cpu(instance_ids=['CLIENT1', 'CLIENT2'],
@@ -130,8 +143,8 @@ def test_burn_cpu_on_linux_two(init, open):
     client.get_grains_get.assert_called_with(['CLIENT1', 'CLIENT2'], 'kernel')
     assert client.async_run_cmd.mock_calls == [call('CLIENT1', 'cmd.run', AnyStringWith('script')),
                                                call('CLIENT2', 'cmd.run', AnyStringWith('script'))]
-    assert client.async_cmd_exit_success.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
-    assert client.get_async_cmd_result.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
+    assert client.iter_async_cmd_exit_success.mock_calls == [call('20190830103239148772')]
+    assert client.iter_async_cmd_result.mock_calls == [call('20190830103239148772')]
 
 
 @patch("builtins.open", new_callable=mock_open, read_data="script")
@@ -143,9 +156,9 @@ def test_burn_cpu_on_linux_two_error_in_script(init, open):
 
     client.get_grains_get.return_value = {'CLIENT1': "Linux", 'CLIENT2': "Linux"}
     client.async_run_cmd.return_value = "20190830103239148772"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success",
-                                                'CLIENT2': "experiment strees_cpu <CLIENT2> -> fail"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': True, 'CLIENT2': True}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success",
+                                                'CLIENT2': "experiment strees_cpu <CLIENT2> -> fail"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True, 'CLIENT2': True})
 
     # do
     # with pytest.raises(FailedActivity, match=r"One of experiments are failed among.*"):
@@ -155,8 +168,8 @@ def test_burn_cpu_on_linux_two_error_in_script(init, open):
     client.get_grains_get.assert_called_with(['CLIENT1', 'CLIENT2'], 'kernel')
     assert client.async_run_cmd.mock_calls == [call('CLIENT1', 'cmd.run', AnyStringWith('script')),
                                                call('CLIENT2', 'cmd.run', AnyStringWith('script'))]
-    assert client.async_cmd_exit_success.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
-    assert client.get_async_cmd_result.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
+    assert client.iter_async_cmd_exit_success.mock_calls == [call('20190830103239148772')]
+    assert client.iter_async_cmd_result.mock_calls == [call('20190830103239148772')]
     assert 'success' in response['CLIENT1']
     assert 'fail' in response['CLIENT2']
 
@@ -170,9 +183,9 @@ def test_bad_machines(init, open):
 
     client.get_grains_get.return_value = {}
     client.async_run_cmd.return_value = "20190830103239148772"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success",
-                                                'CLIENT2': "experiment strees_cpu <CLIENT2> -> fail"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': True, 'CLIENT2': True}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success",
+                                                'CLIENT2': "experiment strees_cpu <CLIENT2> -> fail"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True, 'CLIENT2': True})
 
     # do
     with pytest.raises(FailedActivity, match=r"Cannot find any machines.*"):
@@ -188,9 +201,9 @@ def test_burn_cpu_on_linux_two_error_in_execution(init, open):
 
     client.get_grains_get.return_value = {'CLIENT1': "Linux", 'CLIENT2': "Linux"}
     client.async_run_cmd.return_value = "20190830103239148772"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success",
-                                                'CLIENT2': "experiment strees_cpu <CLIENT2> -> failed"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': True, 'CLIENT2': False}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success",
+                                                'CLIENT2': "experiment strees_cpu <CLIENT2> -> failed"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True, 'CLIENT2': False})
 
     # do
     # with pytest.raises(FailedActivity, match=r"One of experiments are failed among.*"):
@@ -200,8 +213,8 @@ def test_burn_cpu_on_linux_two_error_in_execution(init, open):
     client.get_grains_get.assert_called_with(['CLIENT1', 'CLIENT2'], 'kernel')
     assert client.async_run_cmd.mock_calls == [call('CLIENT1', 'cmd.run', AnyStringWith('script')),
                                                call('CLIENT2', 'cmd.run', AnyStringWith('script'))]
-    assert client.async_cmd_exit_success.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
-    assert client.get_async_cmd_result.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
+    assert client.iter_async_cmd_exit_success.mock_calls == [call('20190830103239148772')]
+    assert client.iter_async_cmd_result.mock_calls == [call('20190830103239148772')]
     assert 'success' in response['CLIENT1']
     assert 'failed' in response['CLIENT2']
 
@@ -228,8 +241,8 @@ def test_burn_io_on_linux(init, open):
 
     client.get_grains_get.return_value = {'CLIENT1': "Linux"}
     client.async_run_cmd.return_value = "20190830103239148771"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "success"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': True}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "success"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True})
 
     # do
     burn_io(instance_ids=['CLIENT1'],
@@ -238,8 +251,8 @@ def test_burn_io_on_linux(init, open):
     open.assert_called_with(AnyStringWith("burn_io.sh"))
     client.get_grains_get.assert_called_with(['CLIENT1'], 'kernel')
     client.async_run_cmd.assert_called_with('CLIENT1', 'cmd.run', AnyStringWith('script'))
-    client.async_cmd_exit_success.assert_called_with('20190830103239148771')
-    client.get_async_cmd_result.assert_called_with('20190830103239148771')
+    client.iter_async_cmd_exit_success.assert_called_with('20190830103239148771')
+    client.iter_async_cmd_result.assert_called_with('20190830103239148771')
 
 
 @patch("builtins.open", new_callable=mock_open, read_data="script")
@@ -251,9 +264,9 @@ def test_burn_io_on_linux_two(init, open):
 
     client.get_grains_get.return_value = {'CLIENT1': "Linux", 'CLIENT2': "Linux"}
     client.async_run_cmd.return_value = "20190830103239148772"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "success",
-                                                'CLIENT2': "success"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': True, 'CLIENT2': True}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "success",
+                                                'CLIENT2': "success"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True, 'CLIENT2': True})
 
     # do
     burn_io(instance_ids=['CLIENT1', 'CLIENT2'],
@@ -263,8 +276,8 @@ def test_burn_io_on_linux_two(init, open):
     client.get_grains_get.assert_called_with(['CLIENT1', 'CLIENT2'], 'kernel')
     assert client.async_run_cmd.mock_calls == [call('CLIENT1', 'cmd.run', AnyStringWith('script')),
                                                call('CLIENT2', 'cmd.run', AnyStringWith('script'))]
-    assert client.async_cmd_exit_success.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
-    assert client.get_async_cmd_result.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
+    assert client.iter_async_cmd_exit_success.mock_calls == [call('20190830103239148772')]
+    assert client.iter_async_cmd_result.mock_calls == [call('20190830103239148772')]
 
 
 @patch("builtins.open", new_callable=mock_open, read_data="script")
@@ -276,9 +289,9 @@ def test_burn_io_on_linux_two_error_script(init, open):
 
     client.get_grains_get.return_value = {'CLIENT1': "Linux", 'CLIENT2': "Linux"}
     client.async_run_cmd.return_value = "20190830103239148772"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "success",
-                                                'CLIENT2': "fail"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': True, 'CLIENT2': True}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "success",
+                                                'CLIENT2': "fail"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True, 'CLIENT2': True})
 
     # do
     # with pytest.raises(FailedActivity, match=r"One of experiments are failed among.*"):
@@ -288,8 +301,8 @@ def test_burn_io_on_linux_two_error_script(init, open):
     client.get_grains_get.assert_called_with(['CLIENT1', 'CLIENT2'], 'kernel')
     assert client.async_run_cmd.mock_calls == [call('CLIENT1', 'cmd.run', AnyStringWith('script')),
                                                call('CLIENT2', 'cmd.run', AnyStringWith('script'))]
-    assert client.async_cmd_exit_success.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
-    assert client.get_async_cmd_result.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
+    assert client.iter_async_cmd_exit_success.mock_calls == [call('20190830103239148772')]
+    assert client.iter_async_cmd_result.mock_calls == [call('20190830103239148772')]
     assert 'fail' in response['CLIENT2']
     assert 'success' in response['CLIENT1']
 
@@ -303,9 +316,9 @@ def test_burn_io_on_linux_two_error_execution(init, open):
 
     client.get_grains_get.return_value = {'CLIENT1': "Linux", 'CLIENT2': "Linux"}
     client.async_run_cmd.return_value = "20190830103239148772"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "success",
-                                                'CLIENT2': "success"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': False, 'CLIENT2': True}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "success",
+                                                'CLIENT2': "success"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': False, 'CLIENT2': True})
 
     # do
     # with pytest.raises(FailedActivity, match=r"One of experiments are failed among.*"):
@@ -315,8 +328,8 @@ def test_burn_io_on_linux_two_error_execution(init, open):
     client.get_grains_get.assert_called_with(['CLIENT1', 'CLIENT2'], 'kernel')
     assert client.async_run_cmd.mock_calls == [call('CLIENT1', 'cmd.run', AnyStringWith('script')),
                                                call('CLIENT2', 'cmd.run', AnyStringWith('script'))]
-    assert client.async_cmd_exit_success.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
-    assert client.get_async_cmd_result.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
+    assert client.iter_async_cmd_exit_success.mock_calls == [call('20190830103239148772')]
+    assert client.iter_async_cmd_result.mock_calls == [call('20190830103239148772')]
     assert 'success' in response['CLIENT2']
     assert 'False' in response['CLIENT1']
 
@@ -330,17 +343,19 @@ def test_fill_disk_on_windows(init, open):
 
     client.get_grains_get.return_value = {'CLIENT1': "Windows"}
     client.async_run_cmd.return_value = "20190830103239148771"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': True}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True})
 
     # do
     fill_disk(instance_ids=['CLIENT1'], execution_duration="1")
 
     open.assert_called_with(AnyStringWith("fill_disk.ps1"))
     client.get_grains_get.assert_called_with(['CLIENT1'], 'kernel')
-    client.async_run_cmd.assert_called_with('CLIENT1', 'cmd.run', AnyStringWith('script'))
-    client.async_cmd_exit_success.assert_called_with('20190830103239148771')
-    client.get_async_cmd_result.assert_called_with('20190830103239148771')
+    client.async_run_cmd.assert_called_with(
+        'CLIENT1', 'cmd.run', AnyStringWith("$size = '1000'"),
+        kwarg={'shell': 'powershell'})
+    client.iter_async_cmd_exit_success.assert_called_with('20190830103239148771')
+    client.iter_async_cmd_result.assert_called_with('20190830103239148771')
 
 
 @patch("builtins.open", new_callable=mock_open, read_data="script")
@@ -352,8 +367,8 @@ def test_fill_disk_on_linux(init, open):
 
     client.get_grains_get.return_value = {'CLIENT1': "Linux"}
     client.async_run_cmd.return_value = "20190830103239148771"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': True}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True})
 
     # do
     fill_disk(instance_ids=['CLIENT1'], execution_duration="1")
@@ -361,8 +376,8 @@ def test_fill_disk_on_linux(init, open):
     open.assert_called_with(AnyStringWith("fill_disk.sh"))
     client.get_grains_get.assert_called_with(['CLIENT1'], 'kernel')
     client.async_run_cmd.assert_called_with('CLIENT1', 'cmd.run', AnyStringWith('script'))
-    client.async_cmd_exit_success.assert_called_with('20190830103239148771')
-    client.get_async_cmd_result.assert_called_with('20190830103239148771')
+    client.iter_async_cmd_exit_success.assert_called_with('20190830103239148771')
+    client.iter_async_cmd_result.assert_called_with('20190830103239148771')
 
 
 @patch("builtins.open", new_callable=mock_open, read_data="script")
@@ -374,9 +389,9 @@ def test_fill_disk_on_linux_two(init, open):
 
     client.get_grains_get.return_value = {'CLIENT1': "Linux", 'CLIENT2': "Linux"}
     client.async_run_cmd.return_value = "20190830103239148772"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "success",
-                                                'CLIENT2': "success"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': True, 'CLIENT2': True}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "success",
+                                                'CLIENT2': "success"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True, 'CLIENT2': True})
 
     # do
     fill_disk(instance_ids=['CLIENT1', 'CLIENT2'],
@@ -386,8 +401,8 @@ def test_fill_disk_on_linux_two(init, open):
     client.get_grains_get.assert_called_with(['CLIENT1', 'CLIENT2'], 'kernel')
     assert client.async_run_cmd.mock_calls == [call('CLIENT1', 'cmd.run', AnyStringWith('script')),
                                                call('CLIENT2', 'cmd.run', AnyStringWith('script'))]
-    assert client.async_cmd_exit_success.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
-    assert client.get_async_cmd_result.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
+    assert client.iter_async_cmd_exit_success.mock_calls == [call('20190830103239148772')]
+    assert client.iter_async_cmd_result.mock_calls == [call('20190830103239148772')]
 
 
 @patch("builtins.open", new_callable=mock_open, read_data="script")
@@ -399,9 +414,9 @@ def test_fill_disk_on_linux_two_error_script(init, open):
 
     client.get_grains_get.return_value = {'CLIENT1': "Linux", 'CLIENT2': "Linux"}
     client.async_run_cmd.return_value = "20190830103239148772"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "success",
-                                                'CLIENT2': "fail"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': True, 'CLIENT2': True}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "success",
+                                                'CLIENT2': "fail"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True, 'CLIENT2': True})
 
     # do
     # with pytest.raises(FailedActivity, match=r"One of experiments are failed among.*"):
@@ -411,8 +426,8 @@ def test_fill_disk_on_linux_two_error_script(init, open):
     client.get_grains_get.assert_called_with(['CLIENT1', 'CLIENT2'], 'kernel')
     assert client.async_run_cmd.mock_calls == [call('CLIENT1', 'cmd.run', AnyStringWith('script')),
                                                call('CLIENT2', 'cmd.run', AnyStringWith('script'))]
-    assert client.async_cmd_exit_success.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
-    assert client.get_async_cmd_result.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
+    assert client.iter_async_cmd_exit_success.mock_calls == [call('20190830103239148772')]
+    assert client.iter_async_cmd_result.mock_calls == [call('20190830103239148772')]
     assert 'fail' in response['CLIENT2']
     assert 'success' in response['CLIENT1']
 
@@ -426,9 +441,9 @@ def test_fill_disk_on_linux_two_error_execution(init, open):
 
     client.get_grains_get.return_value = {'CLIENT1': "Linux", 'CLIENT2': "Linux"}
     client.async_run_cmd.return_value = "20190830103239148772"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "success",
-                                                'CLIENT2': "success"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': False, 'CLIENT2': True}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "success",
+                                                'CLIENT2': "success"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': False, 'CLIENT2': True})
 
     # do
     # with pytest.raises(FailedActivity, match=r"One of experiments are failed among.*"):
@@ -438,8 +453,8 @@ def test_fill_disk_on_linux_two_error_execution(init, open):
     client.get_grains_get.assert_called_with(['CLIENT1', 'CLIENT2'], 'kernel')
     assert client.async_run_cmd.mock_calls == [call('CLIENT1', 'cmd.run', AnyStringWith('script')),
                                                call('CLIENT2', 'cmd.run', AnyStringWith('script'))]
-    assert client.async_cmd_exit_success.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
-    assert client.get_async_cmd_result.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
+    assert client.iter_async_cmd_exit_success.mock_calls == [call('20190830103239148772')]
+    assert client.iter_async_cmd_result.mock_calls == [call('20190830103239148772')]
     assert 'success' in response['CLIENT2']
     assert 'False' in response['CLIENT1']
 
@@ -453,8 +468,8 @@ def test_network_latency_on_linux(init, open):
 
     client.get_grains_get.return_value = {'CLIENT1': "Linux"}
     client.async_run_cmd.return_value = "20190830103239148771"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': True}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True})
 
     # do
     network_latency(instance_ids=['CLIENT1'], execution_duration="1")
@@ -462,8 +477,8 @@ def test_network_latency_on_linux(init, open):
     open.assert_called_with(AnyStringWith("network_advanced.sh"))
     client.get_grains_get.assert_called_with(['CLIENT1'], 'kernel')
     client.async_run_cmd.assert_called_with('CLIENT1', 'cmd.run', AnyStringWith('script'))
-    client.async_cmd_exit_success.assert_called_with('20190830103239148771')
-    client.get_async_cmd_result.assert_called_with('20190830103239148771')
+    client.iter_async_cmd_exit_success.assert_called_with('20190830103239148771')
+    client.iter_async_cmd_result.assert_called_with('20190830103239148771')
 
 
 @patch("builtins.open", new_callable=mock_open, read_data="script")
@@ -475,9 +490,9 @@ def test_network_latency_on_linux_two(init, open):
 
     client.get_grains_get.return_value = {'CLIENT1': "Linux", 'CLIENT2': "Linux"}
     client.async_run_cmd.return_value = "20190830103239148772"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success",
-                                                'CLIENT2': "Stressing CLIENT2 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT2> -> success"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': True, 'CLIENT2': True}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success",
+                                                'CLIENT2': "Stressing CLIENT2 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT2> -> success"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True, 'CLIENT2': True})
 
     # do
     network_latency(instance_ids=['CLIENT1', 'CLIENT2'],
@@ -487,8 +502,8 @@ def test_network_latency_on_linux_two(init, open):
     client.get_grains_get.assert_called_with(['CLIENT1', 'CLIENT2'], 'kernel')
     assert client.async_run_cmd.mock_calls == [call('CLIENT1', 'cmd.run', AnyStringWith('script')),
                                                call('CLIENT2', 'cmd.run', AnyStringWith('script'))]
-    assert client.async_cmd_exit_success.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
-    assert client.get_async_cmd_result.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
+    assert client.iter_async_cmd_exit_success.mock_calls == [call('20190830103239148772')]
+    assert client.iter_async_cmd_result.mock_calls == [call('20190830103239148772')]
 
 
 @patch("builtins.open", new_callable=mock_open, read_data="script")
@@ -500,9 +515,9 @@ def test_network_latency_on_linux_two_error_in_script(init, open):
 
     client.get_grains_get.return_value = {'CLIENT1': "Linux", 'CLIENT2': "Linux"}
     client.async_run_cmd.return_value = "20190830103239148772"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success",
-                                                'CLIENT2': "experiment strees_cpu <CLIENT2> -> fail"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': True, 'CLIENT2': True}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success",
+                                                'CLIENT2': "experiment strees_cpu <CLIENT2> -> fail"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True, 'CLIENT2': True})
 
     # do
     # with pytest.raises(FailedActivity, match=r"One of experiments are failed among.*"):
@@ -513,8 +528,8 @@ def test_network_latency_on_linux_two_error_in_script(init, open):
     client.get_grains_get.assert_called_with(['CLIENT1', 'CLIENT2'], 'kernel')
     assert client.async_run_cmd.mock_calls == [call('CLIENT1', 'cmd.run', AnyStringWith('script')),
                                                call('CLIENT2', 'cmd.run', AnyStringWith('script'))]
-    assert client.async_cmd_exit_success.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
-    assert client.get_async_cmd_result.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
+    assert client.iter_async_cmd_exit_success.mock_calls == [call('20190830103239148772')]
+    assert client.iter_async_cmd_result.mock_calls == [call('20190830103239148772')]
     assert 'fail' in response['CLIENT2']
     assert 'success' in response['CLIENT1']
 
@@ -528,9 +543,9 @@ def test_network_latency_on_linux_two_error_in_execution(init, open):
 
     client.get_grains_get.return_value = {'CLIENT1': "Linux", 'CLIENT2': "Linux"}
     client.async_run_cmd.return_value = "20190830103239148772"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success",
-                                                'CLIENT2': "experiment strees_cpu <CLIENT2> -> success"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': True, 'CLIENT2': False}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success",
+                                                'CLIENT2': "experiment strees_cpu <CLIENT2> -> success"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True, 'CLIENT2': False})
 
     # do
     # with pytest.raises(FailedActivity, match=r"One of experiments are failed among.*"):
@@ -540,8 +555,8 @@ def test_network_latency_on_linux_two_error_in_execution(init, open):
     client.get_grains_get.assert_called_with(['CLIENT1', 'CLIENT2'], 'kernel')
     assert client.async_run_cmd.mock_calls == [call('CLIENT1', 'cmd.run', AnyStringWith('script')),
                                                call('CLIENT2', 'cmd.run', AnyStringWith('script'))]
-    assert client.async_cmd_exit_success.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
-    assert client.get_async_cmd_result.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
+    assert client.iter_async_cmd_exit_success.mock_calls == [call('20190830103239148772')]
+    assert client.iter_async_cmd_result.mock_calls == [call('20190830103239148772')]
     assert 'False' in response['CLIENT2']
     assert 'success' in response['CLIENT1']
 
@@ -555,8 +570,8 @@ def test_network_loss_on_linux(init, open):
 
     client.get_grains_get.return_value = {'CLIENT1': "Linux"}
     client.async_run_cmd.return_value = "20190830103239148771"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': True}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True})
 
     # do
     network_loss(instance_ids=['CLIENT1'], execution_duration="1")
@@ -564,8 +579,8 @@ def test_network_loss_on_linux(init, open):
     open.assert_called_with(AnyStringWith("network_advanced.sh"))
     client.get_grains_get.assert_called_with(['CLIENT1'], 'kernel')
     client.async_run_cmd.assert_called_with('CLIENT1', 'cmd.run', AnyStringWith('script'))
-    client.async_cmd_exit_success.assert_called_with('20190830103239148771')
-    client.get_async_cmd_result.assert_called_with('20190830103239148771')
+    client.iter_async_cmd_exit_success.assert_called_with('20190830103239148771')
+    client.iter_async_cmd_result.assert_called_with('20190830103239148771')
 
 
 @patch("builtins.open", new_callable=mock_open, read_data="script")
@@ -577,9 +592,9 @@ def test_network_loss_on_linux_two(init, open):
 
     client.get_grains_get.return_value = {'CLIENT1': "Linux", 'CLIENT2': "Linux"}
     client.async_run_cmd.return_value = "20190830103239148772"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success",
-                                                'CLIENT2': "Stressing CLIENT2 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT2> -> success"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': True, 'CLIENT2': True}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success",
+                                                'CLIENT2': "Stressing CLIENT2 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT2> -> success"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True, 'CLIENT2': True})
 
     # do
     network_loss(instance_ids=['CLIENT1', 'CLIENT2'],
@@ -589,8 +604,8 @@ def test_network_loss_on_linux_two(init, open):
     client.get_grains_get.assert_called_with(['CLIENT1', 'CLIENT2'], 'kernel')
     assert client.async_run_cmd.mock_calls == [call('CLIENT1', 'cmd.run', AnyStringWith('script')),
                                                call('CLIENT2', 'cmd.run', AnyStringWith('script'))]
-    assert client.async_cmd_exit_success.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
-    assert client.get_async_cmd_result.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
+    assert client.iter_async_cmd_exit_success.mock_calls == [call('20190830103239148772')]
+    assert client.iter_async_cmd_result.mock_calls == [call('20190830103239148772')]
 
 
 @patch("builtins.open", new_callable=mock_open, read_data="script")
@@ -602,9 +617,9 @@ def test_network_loss_on_linux_two_error_in_script(init, open):
 
     client.get_grains_get.return_value = {'CLIENT1': "Linux", 'CLIENT2': "Linux"}
     client.async_run_cmd.return_value = "20190830103239148772"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success",
-                                                'CLIENT2': "experiment strees_cpu <CLIENT2> -> fail"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': True, 'CLIENT2': True}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success",
+                                                'CLIENT2': "experiment strees_cpu <CLIENT2> -> fail"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True, 'CLIENT2': True})
 
     # do
     # with pytest.raises(FailedActivity, match=r"One of experiments are failed among.*"):
@@ -614,8 +629,8 @@ def test_network_loss_on_linux_two_error_in_script(init, open):
     client.get_grains_get.assert_called_with(['CLIENT1', 'CLIENT2'], 'kernel')
     assert client.async_run_cmd.mock_calls == [call('CLIENT1', 'cmd.run', AnyStringWith('script')),
                                                call('CLIENT2', 'cmd.run', AnyStringWith('script'))]
-    assert client.async_cmd_exit_success.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
-    assert client.get_async_cmd_result.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
+    assert client.iter_async_cmd_exit_success.mock_calls == [call('20190830103239148772')]
+    assert client.iter_async_cmd_result.mock_calls == [call('20190830103239148772')]
     assert 'fail' in response['CLIENT2']
     assert 'success' in response['CLIENT1']
 
@@ -629,9 +644,9 @@ def test_network_loss_on_linux_two_error_in_execution(init, open):
 
     client.get_grains_get.return_value = {'CLIENT1': "Linux", 'CLIENT2': "Linux"}
     client.async_run_cmd.return_value = "20190830103239148772"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success",
-                                                'CLIENT2': "experiment strees_cpu <CLIENT2> -> success"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': True, 'CLIENT2': False}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success",
+                                                'CLIENT2': "experiment strees_cpu <CLIENT2> -> success"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True, 'CLIENT2': False})
 
     # do
     # with pytest.raises(FailedActivity, match=r"One of experiments are failed among.*"):
@@ -641,8 +656,8 @@ def test_network_loss_on_linux_two_error_in_execution(init, open):
     client.get_grains_get.assert_called_with(['CLIENT1', 'CLIENT2'], 'kernel')
     assert client.async_run_cmd.mock_calls == [call('CLIENT1', 'cmd.run', AnyStringWith('script')),
                                                call('CLIENT2', 'cmd.run', AnyStringWith('script'))]
-    assert client.async_cmd_exit_success.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
-    assert client.get_async_cmd_result.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
+    assert client.iter_async_cmd_exit_success.mock_calls == [call('20190830103239148772')]
+    assert client.iter_async_cmd_result.mock_calls == [call('20190830103239148772')]
     assert 'False' in response['CLIENT2']
     assert 'success' in response['CLIENT1']
 
@@ -656,8 +671,8 @@ def test_network_corruption_on_linux(init, open):
 
     client.get_grains_get.return_value = {'CLIENT1': "Linux"}
     client.async_run_cmd.return_value = "20190830103239148771"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': True}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True})
 
     # do
     network_corruption(instance_ids=['CLIENT1'], execution_duration="1")
@@ -665,8 +680,8 @@ def test_network_corruption_on_linux(init, open):
     open.assert_called_with(AnyStringWith("network_advanced.sh"))
     client.get_grains_get.assert_called_with(['CLIENT1'], 'kernel')
     client.async_run_cmd.assert_called_with('CLIENT1', 'cmd.run', AnyStringWith('script'))
-    client.async_cmd_exit_success.assert_called_with('20190830103239148771')
-    client.get_async_cmd_result.assert_called_with('20190830103239148771')
+    client.iter_async_cmd_exit_success.assert_called_with('20190830103239148771')
+    client.iter_async_cmd_result.assert_called_with('20190830103239148771')
 
 
 @patch("builtins.open", new_callable=mock_open, read_data="script")
@@ -678,9 +693,9 @@ def test_network_corruption_on_linux_two(init, open):
 
     client.get_grains_get.return_value = {'CLIENT1': "Linux", 'CLIENT2': "Linux"}
     client.async_run_cmd.return_value = "20190830103239148772"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success",
-                                                'CLIENT2': "Stressing CLIENT2 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT2> -> success"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': True, 'CLIENT2': True}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success",
+                                                'CLIENT2': "Stressing CLIENT2 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT2> -> success"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True, 'CLIENT2': True})
 
     # do
     network_corruption(instance_ids=['CLIENT1', 'CLIENT2'],
@@ -690,8 +705,8 @@ def test_network_corruption_on_linux_two(init, open):
     client.get_grains_get.assert_called_with(['CLIENT1', 'CLIENT2'], 'kernel')
     assert client.async_run_cmd.mock_calls == [call('CLIENT1', 'cmd.run', AnyStringWith('script')),
                                                call('CLIENT2', 'cmd.run', AnyStringWith('script'))]
-    assert client.async_cmd_exit_success.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
-    assert client.get_async_cmd_result.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
+    assert client.iter_async_cmd_exit_success.mock_calls == [call('20190830103239148772')]
+    assert client.iter_async_cmd_result.mock_calls == [call('20190830103239148772')]
 
 
 @patch("builtins.open", new_callable=mock_open, read_data="script")
@@ -703,9 +718,9 @@ def test_network_corruption_on_linux_two_error_in_script(init, open):
 
     client.get_grains_get.return_value = {'CLIENT1': "Linux", 'CLIENT2': "Linux"}
     client.async_run_cmd.return_value = "20190830103239148772"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success",
-                                                'CLIENT2': "experiment strees_cpu <CLIENT2> -> fail"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': True, 'CLIENT2': True}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success",
+                                                'CLIENT2': "experiment strees_cpu <CLIENT2> -> fail"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True, 'CLIENT2': True})
 
     # do
     # with pytest.raises(FailedActivity, match=r"One of experiments are failed among.*"):
@@ -715,8 +730,8 @@ def test_network_corruption_on_linux_two_error_in_script(init, open):
     client.get_grains_get.assert_called_with(['CLIENT1', 'CLIENT2'], 'kernel')
     assert client.async_run_cmd.mock_calls == [call('CLIENT1', 'cmd.run', AnyStringWith('script')),
                                                call('CLIENT2', 'cmd.run', AnyStringWith('script'))]
-    assert client.async_cmd_exit_success.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
-    assert client.get_async_cmd_result.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
+    assert client.iter_async_cmd_exit_success.mock_calls == [call('20190830103239148772')]
+    assert client.iter_async_cmd_result.mock_calls == [call('20190830103239148772')]
     assert 'fail' in response['CLIENT2']
     assert 'success' in response['CLIENT1']
 
@@ -729,9 +744,9 @@ def test_network_corruption_on_linux_two_error_in_execution(init, open):
 
     client.get_grains_get.return_value = {'CLIENT1': "Linux", 'CLIENT2': "Linux"}
     client.async_run_cmd.return_value = "20190830103239148772"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success",
-                                                'CLIENT2': "experiment strees_cpu <CLIENT2> -> success"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': True, 'CLIENT2': False}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success",
+                                                'CLIENT2': "experiment strees_cpu <CLIENT2> -> success"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True, 'CLIENT2': False})
 
     # do
     # with pytest.raises(FailedActivity, match=r"One of experiments are failed among.*"):
@@ -741,8 +756,8 @@ def test_network_corruption_on_linux_two_error_in_execution(init, open):
     client.get_grains_get.assert_called_with(['CLIENT1', 'CLIENT2'], 'kernel')
     assert client.async_run_cmd.mock_calls == [call('CLIENT1', 'cmd.run', AnyStringWith('script')),
                                                call('CLIENT2', 'cmd.run', AnyStringWith('script'))]
-    assert client.async_cmd_exit_success.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
-    assert client.get_async_cmd_result.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
+    assert client.iter_async_cmd_exit_success.mock_calls == [call('20190830103239148772')]
+    assert client.iter_async_cmd_result.mock_calls == [call('20190830103239148772')]
     assert 'False' in response['CLIENT2']
     assert 'success' in response['CLIENT1']
 
@@ -756,8 +771,8 @@ def test_network_advanced_on_linux(init, open):
 
     client.get_grains_get.return_value = {'CLIENT1': "Linux"}
     client.async_run_cmd.return_value = "20190830103239148771"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': True}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True})
 
     # do
     network_advanced(instance_ids=['CLIENT1'], execution_duration="1", command="loss 5%")
@@ -765,8 +780,8 @@ def test_network_advanced_on_linux(init, open):
     open.assert_called_with(AnyStringWith("network_advanced.sh"))
     client.get_grains_get.assert_called_with(['CLIENT1'], 'kernel')
     client.async_run_cmd.assert_called_with('CLIENT1', 'cmd.run', AnyStringWith('script'))
-    client.async_cmd_exit_success.assert_called_with('20190830103239148771')
-    client.get_async_cmd_result.assert_called_with('20190830103239148771')
+    client.iter_async_cmd_exit_success.assert_called_with('20190830103239148771')
+    client.iter_async_cmd_result.assert_called_with('20190830103239148771')
 
 
 @patch("builtins.open", new_callable=mock_open, read_data="script")
@@ -778,9 +793,9 @@ def test_network_advanced_on_linux_two(init, open):
 
     client.get_grains_get.return_value = {'CLIENT1': "Linux", 'CLIENT2': "Linux"}
     client.async_run_cmd.return_value = "20190830103239148772"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success",
-                                                'CLIENT2': "Stressing CLIENT2 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT2> -> success"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': True, 'CLIENT2': True}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success",
+                                                'CLIENT2': "Stressing CLIENT2 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT2> -> success"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True, 'CLIENT2': True})
 
     # do
     network_advanced(instance_ids=['CLIENT1', 'CLIENT2'], execution_duration="1", command="loss 5%")
@@ -789,8 +804,8 @@ def test_network_advanced_on_linux_two(init, open):
     client.get_grains_get.assert_called_with(['CLIENT1', 'CLIENT2'], 'kernel')
     assert client.async_run_cmd.mock_calls == [call('CLIENT1', 'cmd.run', AnyStringWith('script')),
                                                call('CLIENT2', 'cmd.run', AnyStringWith('script'))]
-    assert client.async_cmd_exit_success.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
-    assert client.get_async_cmd_result.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
+    assert client.iter_async_cmd_exit_success.mock_calls == [call('20190830103239148772')]
+    assert client.iter_async_cmd_result.mock_calls == [call('20190830103239148772')]
 
 
 @patch("builtins.open", new_callable=mock_open, read_data="script")
@@ -802,9 +817,9 @@ def test_network_advanced_on_linux_two_error_in_script(init, open):
 
     client.get_grains_get.return_value = {'CLIENT1': "Linux", 'CLIENT2': "Linux"}
     client.async_run_cmd.return_value = "20190830103239148772"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success",
-                                                'CLIENT2': "experiment strees_cpu <CLIENT2> -> fail"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': True, 'CLIENT2': True}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success",
+                                                'CLIENT2': "experiment strees_cpu <CLIENT2> -> fail"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True, 'CLIENT2': True})
 
     # do
     # with pytest.raises(FailedActivity, match=r"One of experiments are failed among.*"):
@@ -814,8 +829,8 @@ def test_network_advanced_on_linux_two_error_in_script(init, open):
     client.get_grains_get.assert_called_with(['CLIENT1', 'CLIENT2'], 'kernel')
     assert client.async_run_cmd.mock_calls == [call('CLIENT1', 'cmd.run', AnyStringWith('script')),
                                                call('CLIENT2', 'cmd.run', AnyStringWith('script'))]
-    assert client.async_cmd_exit_success.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
-    assert client.get_async_cmd_result.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
+    assert client.iter_async_cmd_exit_success.mock_calls == [call('20190830103239148772')]
+    assert client.iter_async_cmd_result.mock_calls == [call('20190830103239148772')]
     assert 'fail' in response['CLIENT2']
     assert 'success' in response['CLIENT1']
 
@@ -829,9 +844,9 @@ def test_network_advanced_on_linux_two_error_in_execution(init, open):
 
     client.get_grains_get.return_value = {'CLIENT1': "Linux", 'CLIENT2': "Linux"}
     client.async_run_cmd.return_value = "20190830103239148772"
-    client.get_async_cmd_result.return_value = {'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success",
-                                                'CLIENT2': "experiment strees_cpu <CLIENT2> -> success"}
-    client.async_cmd_exit_success.return_value = {'CLIENT1': True, 'CLIENT2': False}
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "Stressing CLIENT1 1 CPUs for 180 seconds.\nStressing 1 CPUs for 180 seconds. Done\nexperiment strees_cpu <CLIENT1> -> success",
+                                                'CLIENT2': "experiment strees_cpu <CLIENT2> -> success"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True, 'CLIENT2': False})
 
     # do
     # with pytest.raises(FailedActivity, match=r"One of experiments are failed among.*"):
@@ -841,8 +856,8 @@ def test_network_advanced_on_linux_two_error_in_execution(init, open):
     client.get_grains_get.assert_called_with(['CLIENT1', 'CLIENT2'], 'kernel')
     assert client.async_run_cmd.mock_calls == [call('CLIENT1', 'cmd.run', AnyStringWith('script')),
                                                call('CLIENT2', 'cmd.run', AnyStringWith('script'))]
-    assert client.async_cmd_exit_success.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
-    assert client.get_async_cmd_result.mock_calls == [call('20190830103239148772'), call('20190830103239148772')]
+    assert client.iter_async_cmd_exit_success.mock_calls == [call('20190830103239148772')]
+    assert client.iter_async_cmd_result.mock_calls == [call('20190830103239148772')]
     assert 'False' in response['CLIENT2']
     assert 'success' in response['CLIENT1']
 
@@ -866,3 +881,319 @@ def test_exception():
         network_loss(instance_ids=['CLIENT1', 'CLIENT2'], execution_duration="1")
     with pytest.raises(FailedActivity, match=r"configuration is not complete.*"):
         network_latency(instance_ids=['CLIENT1'], execution_duration="1")
+
+
+@patch("builtins.open", new_callable=mock_open,
+       read_data="#!/bin/bash\n\n# burn it\nscript\n  # indented\n")
+@patch('chaossaltstack.machine.actions.saltstack_api_client', autospec=True)
+def test_burn_cpu_minified_script(init, open):
+    # mock
+    client = MagicMock()
+    init.return_value = client
+
+    client.get_grains_get.return_value = {'CLIENT1': "Linux"}
+    client.async_run_cmd.return_value = "20190830103239148771"
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "success"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True})
+
+    # do
+    response = burn_cpu(instance_ids=['CLIENT1'], execution_duration="0",
+                        configuration={"saltstack": {
+                            "minify_scripts": True, "metrics_summary": True}})
+
+    script = client.async_run_cmd.call_args[0][2]
+    assert script.endswith("\nscript")
+    assert '#' not in script and '\n\n' not in script
+    scripts = response["_metrics"]["scripts"]["cpu_stress_test.sh"]
+    assert scripts["sent_bytes"] < scripts["raw_bytes"]
+
+
+@patch("builtins.open", new_callable=mock_open, read_data="script")
+@patch('chaossaltstack.machine.actions.saltstack_api_client', autospec=True)
+def test_burn_cpu_minion_without_result(init, open):
+    # mock
+    client = MagicMock()
+    init.return_value = client
+
+    client.get_grains_get.return_value = {'CLIENT1': "Linux", 'CLIENT2': "Linux"}
+    client.async_run_cmd.return_value = "20190830103239148772"
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "success"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True})
+
+    # do
+    with pytest.raises(FailedActivity, match=r".*No result returned by CLIENT2"):
+        burn_cpu(instance_ids=['CLIENT1', 'CLIENT2'], execution_duration="0")
+
+
+@patch("builtins.open", new_callable=mock_open, read_data="script")
+@patch('chaossaltstack.machine.actions.saltstack_api_client', autospec=True)
+def test_burn_cpu_synchronized_start(init, open):
+    # mock
+    client = MagicMock()
+    init.return_value = client
+
+    client.get_grains_get.return_value = {'CLIENT1': "Linux", 'CLIENT2': "Linux"}
+    client.async_run_cmd.return_value = "20190830103239148773"
+    client.iter_async_cmd_result.side_effect = pairs({
+        'CLIENT1': "chaossaltstack-timing started=100.5\nsuccess\nchaossaltstack-timing stopped=101.5",
+        'CLIENT2': "chaossaltstack-timing started=100.75\nsuccess\nchaossaltstack-timing stopped=102.0"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True, 'CLIENT2': True})
+
+    # do
+    response = burn_cpu(instance_ids=['CLIENT1', 'CLIENT2'], execution_duration="0",
+                        configuration={"saltstack": {
+                            "synchronized_start": True, "start_margin": 0}})
+
+    scripts = [c[0][2] for c in client.async_run_cmd.call_args_list]
+    start_at = response["_timing"]["start_at"]
+    assert all("start_at='{:.3f}'".format(start_at) in s for s in scripts)
+    timing = response["_timing"]["minions"]["CLIENT2"]
+    assert timing["scheduled"] == start_at
+    assert (timing["started"], timing["stopped"]) == (100.75, 102.0)
+    assert response["_timing"]["start_skew"] == 0.25
+    assert response["_timing"]["stop_skew"] == 0.5
+    assert 'success' in response['CLIENT1']
+
+
+@patch("builtins.open", new_callable=mock_open, read_data="script")
+@patch('chaossaltstack.machine.actions.saltstack_api_client', autospec=True)
+def test_kill_process_staggered_start_and_recovery(init, open):
+    # mock
+    client = MagicMock()
+    init.return_value = client
+
+    client.get_grains_get.return_value = {'CLIENT3': "Linux", 'CLIENT2': "Linux", 'CLIENT1': "Linux"}
+    client.async_run_cmd.return_value = "20190830103239148774"
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "success", 'CLIENT2': "success", 'CLIENT3': "success"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True, 'CLIENT2': True, 'CLIENT3': True})
+
+    # do
+    with patch('chaossaltstack.machine.actions.sleep') as sleep:
+        response = kill_process(instance_ids=['CLIENT1', 'CLIENT2', 'CLIENT3'],
+                                execution_duration="10", process="java",
+                                configuration={"saltstack": {
+                                    "stagger_window": 20, "recovery_window": 4}})
+
+    # published in the order they start, the first one right away
+    dispatched = [c[0][0] for c in client.async_run_cmd.call_args_list]
+    assert dispatched == ['CLIENT3', 'CLIENT2', 'CLIENT1']
+    minions = response["_timing"]["minions"]
+    starts = [minions[k]["scheduled"] - response["_timing"]["start_at"] for k in dispatched]
+    assert starts == pytest.approx([0, 10, 20])
+    assert [minions[k]["duration"] for k in dispatched] == [10, 12, 14]
+    assert "duration='14'" in client.async_run_cmd.call_args_list[2][0][2]
+    assert 30 < sleep.call_args[0][0] <= 34
+
+
+@patch("builtins.open", new_callable=mock_open, read_data="script")
+@patch('chaossaltstack.machine.actions.saltstack_api_client', autospec=True)
+def test_run_faults_in_one_job(init, open):
+    # mock
+    client = MagicMock()
+    init.return_value = client
+
+    client.get_grains_get.return_value = {'CLIENT1': "Linux"}
+    client.async_run_cmd.return_value = "20190830103239148776"
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "chaossaltstack-fault 1 begin\nstressed\nchaossaltstack-fault 1 end exit=0\nchaossaltstack-fault 2 begin\nexperiment network_latency -> <CLIENT1>: success\nchaossaltstack-fault 2 end exit=0"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True})
+
+    # do
+    response = run_faults(faults=[{"action": "burn_cpu"},
+                                  {"action": "network_latency", "arguments": {"device": "ens3"}}],
+                          instance_ids=['CLIENT1'], execution_duration="0")
+
+    client.async_run_cmd.assert_called_once_with('CLIENT1', 'cmd.run', AnyStringWith("tc qdisc del dev 'ens3' root"))
+    script = client.async_run_cmd.call_args[0][2]
+    assert script.count("duration='0'") == 2
+    assert "device='ens3'" in script
+    assert [f["action"] for f in response["_faults"]["CLIENT1"]] == ["burn_cpu", "network_latency"]
+    assert all(f["success"] for f in response["_faults"]["CLIENT1"])
+
+
+@patch("builtins.open", new_callable=mock_open, read_data="echo ${instance_id}")
+@patch('chaossaltstack.machine.actions.saltstack_api_client', autospec=True)
+def test_burn_cpu_jinja_template_publishes_one_job(init, open):
+    # mock
+    client = MagicMock()
+    init.return_value = client
+
+    client.get_grains_get.return_value = {'CLIENT1': "Linux", 'CLIENT2': "Linux", 'CLIENT3': "Linux"}
+    client.async_run_cmd.return_value = "1"
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "success", 'CLIENT2': "success", 'CLIENT3': "success"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True, 'CLIENT2': True, 'CLIENT3': True})
+
+    # do
+    response = burn_cpu(instance_ids=['CLIENT1', 'CLIENT2', 'CLIENT3'], execution_duration="0",
+                        configuration={"saltstack": {"template": "jinja"}})
+
+    client.async_run_cmd.assert_called_once()
+    args, kwargs = client.async_run_cmd.call_args
+    assert args[0] == ['CLIENT1', 'CLIENT2', 'CLIENT3']
+    assert kwargs == {'kwarg': {'template': 'jinja'}}
+    assert args[2].startswith("{% raw %}")
+    assert "instance_id='{% endraw %}{{ grains['id'] }}{% raw %}'" in args[2]
+    client.iter_async_cmd_result.assert_called_once_with("1")
+    assert all('success' in response[k] for k in ('CLIENT1', 'CLIENT2', 'CLIENT3'))
+
+
+@patch("builtins.open", new_callable=mock_open, read_data="script")
+@patch('chaossaltstack.machine.actions.saltstack_api_client', autospec=True)
+def test_network_latency_sampled(init, open):
+    # mock
+    client = MagicMock()
+    init.return_value = client
+
+    client.get_grains_get.return_value = {'CLIENT1': "Linux", 'CLIENT2': "Windows"}
+    client.async_run_cmd.return_value = "20190830103239148775"
+    client.iter_async_cmd_result.side_effect = pairs({
+        'CLIENT1': "success\nchaossaltstack-samples 100,10,100,5000,0,0,0,0;100,50,100,-8,4,2,2048,1024",
+        'CLIENT2': "success"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True, 'CLIENT2': True})
+
+    # do
+    response = network_latency(instance_ids=['CLIENT1', 'CLIENT2'], execution_duration="0",
+                               configuration={"saltstack": {"sample_interval": 1}})
+
+    scripts = dict((c[0][0], c[0][2]) for c in client.async_run_cmd.call_args_list)
+    assert "while sleep 1; do chaos_sample" in scripts['CLIENT1']
+    assert "chaos_sample" not in scripts['CLIENT2']
+    assert response["_samples"] == {'CLIENT1': {
+        "time": [1.0], "cpu_percent": [50.0], "mem_available_kb": [4992],
+        "disk_read_kb": [2], "disk_write_kb": [1], "net_rx_kb": [2.0],
+        "net_tx_kb": [1.0]}}
+
+
+@patch("builtins.open", new_callable=mock_open, read_data="script")
+@patch('chaossaltstack.machine.actions.saltstack_api_client', autospec=True)
+def test_rollback_one_call_per_os(init, open):
+    # mock
+    client = MagicMock()
+    init.return_value = client
+
+    client.get_grains_get.return_value = {
+        'CLIENT1': "Linux", 'CLIENT2': "Windows", 'CLIENT3': "Linux", 'CLIENT4': "Linux"}
+    linux = iter([
+        ('CLIENT1', "chaossaltstack-cleaned qdisc root of eth0\n"
+                    "chaossaltstack-cleaned file /root/burn\n"
+                    "experiment rollback -> success"),
+        ('CLIENT3', "experiment rollback -> success"),
+        ('CLIENT4', False)])
+    windows = iter([('CLIENT2', "experiment rollback -> success")])
+    client.iter_run_cmd.side_effect = [linux, windows]
+
+    # do
+    response = rollback(instance_ids=['CLIENT1', 'CLIENT2', 'CLIENT3', 'CLIENT4'])
+
+    calls = client.iter_run_cmd.call_args_list
+    assert len(calls) == 2
+    assert calls[0][0][0] == ['CLIENT1', 'CLIENT3', 'CLIENT4']
+    assert calls[0][1]['kwarg'] is None
+    assert calls[1][0][0] == ['CLIENT2']
+    assert calls[1][1]['kwarg'] == {'shell': 'powershell'}
+    assert response['CLIENT1'] == {
+        "success": True,
+        "cleaned": ["qdisc root of eth0", "file /root/burn"]}
+    assert response['CLIENT2'] == {"success": True, "cleaned": []}
+    assert response['CLIENT3'] == {"success": True, "cleaned": []}
+    assert response['CLIENT4'] == {"success": False, "cleaned": []}
+
+
+@patch("builtins.open", new_callable=mock_open, read_data="script")
+@patch('chaossaltstack.machine.actions.saltstack_api_client', autospec=True)
+def test_network_loss_preflight(init, open):
+    clear_capabilities()
+    # mock
+    client = MagicMock()
+    init.return_value = client
+
+    client.get_grains_get.return_value = {'CLIENT1': "Linux", 'CLIENT2': "Linux", 'CLIENT3': "Windows"}
+    client.iter_run_cmd.side_effect = lambda *args, **kwargs: iter([
+        ('CLIENT1', "grep\nsleep\ntc\npreflight-done"),
+        ('CLIENT2', "grep\nsleep\npreflight-done")])
+    client.async_run_cmd.return_value = "20190830103239148776"
+    client.iter_async_cmd_result.side_effect = pairs({'CLIENT1': "success", 'CLIENT3': "success"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True, 'CLIENT3': True})
+
+    # do
+    response = network_loss(instance_ids=['CLIENT1', 'CLIENT2', 'CLIENT3'], execution_duration="0",
+                            configuration={"saltstack": {"preflight": "filter"}})
+
+    # only the Linux minions are checked
+    assert client.iter_run_cmd.call_args[0][0] == ['CLIENT1', 'CLIENT2']
+    dispatched = [c[0][0] for c in client.async_run_cmd.call_args_list]
+    assert sorted(dispatched) == ['CLIENT1', 'CLIENT3']
+    assert response["_preflight"] == {"excluded": {'CLIENT2': ["tc"]}}
+    assert 'CLIENT2' not in response
+
+    # the matrix is cached, failing the action right away
+    with pytest.raises(FailedActivity) as x:
+        network_loss(instance_ids=['CLIENT2'], execution_duration="0",
+                     configuration={"saltstack": {"preflight": "fail"}})
+    assert "CLIENT2: tc" in str(x.value)
+    assert client.iter_run_cmd.call_count == 1
+    clear_capabilities()
+
+
+@patch("builtins.open", new_callable=mock_open, read_data="script")
+@patch('chaossaltstack.machine.actions.saltstack_api_client', autospec=True)
+def test_burn_io_status_only(init, open):
+    # mock
+    client = MagicMock()
+    init.return_value = client
+
+    client.get_grains_get.return_value = {'CLIENT1': "Linux", 'CLIENT2': "Linux"}
+    client.async_run_cmd.return_value = "20190830103239148777"
+    client.iter_async_cmd_result.side_effect = pairs({
+        'CLIENT1': "experiment burnio -> <CLIENT1>: success",
+        'CLIENT2': "experiment brunio -> <CLIENT2>: fail"})
+    client.iter_async_cmd_exit_success.side_effect = pairs({'CLIENT1': True, 'CLIENT2': True})
+    client.iter_run_cmd.return_value = iter([('CLIENT2', "dd: No space left on device\nfail")])
+
+    # do
+    response = burn_io(instance_ids=['CLIENT1', 'CLIENT2'], execution_duration="0",
+                       configuration={"saltstack": {"result_mode": "status"}})
+
+    script = client.async_run_cmd.call_args[0][2]
+    assert "chaos_log='/tmp/chaossaltstack-" in script
+    # the full log of the failed minion only
+    client.iter_run_cmd.assert_called_once_with(
+        ['CLIENT2'], 'cmd.run', AnyStringWith("cat '/tmp/chaossaltstack-"), kwarg=None)
+    assert response["_logs"] == {'CLIENT2': "dd: No space left on device\nfail"}
+
+
+@patch("builtins.open", new_callable=mock_open, read_data="script")
+@patch('chaossaltstack.machine.actions.saltstack_api_client', autospec=True)
+def test_run_parallel_on_disjoint_groups(init, open):
+    # mock
+    client = MagicMock()
+    init.return_value = client
+    barrier = threading.Barrier(2, timeout=5)
+
+    client.get_grains_get.side_effect = lambda tgt, item: dict(
+        (k, "Linux") for k in tgt)
+
+    def run(tgt, method, arg, kwarg=None):
+        # both groups must be in flight at once to get past the barrier
+        barrier.wait()
+        return iter([(k, "experiment rollback -> success") for k in tgt])
+    client.iter_run_cmd.side_effect = run
+
+    # do
+    response = run_parallel(actions=[
+        {"action": "rollback", "name": "caches",
+         "instance_ids": ["cache-1"]},
+        {"action": "rollback", "name": "app",
+         "instance_ids": ["app-1", "app-2"]}])
+
+    assert list(response) == ["caches", "app"]
+    assert response["caches"]["cache-1"]["success"] is True
+    assert sorted(response["app"]) == ["app-1", "app-2"]
+
+
+def test_run_parallel_needs_disjoint_groups():
+    with pytest.raises(FailedActivity) as x:
+        run_parallel(actions=[
+            {"action": "burn_cpu", "instance_ids": ["app-1", "app-2"]},
+            {"action": "kill_process", "instance_ids": ["app-2"],
+             "arguments": {"process": "java"}}])
+    assert "app-2" in str(x.value)
@@ -0,0 +1,69 @@
+import signal
+import subprocess
+from time import sleep
+
+from chaoslib.exceptions import FailedActivity
+import pytest
+
+from chaossaltstack.machine.composite import fault_parameters, \
+    parse_faults, render_composite
+
+
+def test_fault_parameters_mirror_the_actions():
+    specs = fault_parameters([
+        {"action": "burn_cpu"},
+        {"action": "network_latency", "arguments": {"delay": "300ms"}}])
+
+    assert specs[0] == ("burn_cpu", "cpu_stress_test", {"utilisation": "100"})
+    assert specs[1][1:] == ("network_advanced", {
+        "param": "delay 300ms 500ms ", "device": "eth0"})
+
+
+@pytest.mark.parametrize("faults", [
+    [],
+    [{"action": "reboot"}],
+    [{"action": "burn_cpu", "arguments": {"cpus": 2}}],
+    [{"action": "network_loss"}, {"action": "network_latency"}],
+    # validated as by the action
+    [{"action": "burn_cpu", "arguments": {"utilisation": 150}}],
+    # both write /root/burn
+    [{"action": "burn_io"}, {"action": "fill_disk"}],
+])
+def test_invalid_faults(faults):
+    with pytest.raises(FailedActivity):
+        fault_parameters(faults)
+
+
+def test_combined_linux_script_runs_faults_concurrently():
+    script = render_composite([
+        ("cpu_stress_test", "sleep 0.5; echo one"),
+        ("network_advanced", "echo two fail; exit 2")], "Linux",
+        [{}, {"device": "chaos0"}])
+
+    proc = subprocess.run(["sh", "-c", script], stdout=subprocess.PIPE,
+                          universal_newlines=True)
+
+    assert proc.returncode == 2
+    assert parse_faults(proc.stdout, ["burn_cpu", "network_loss"]) == [
+        {"action": "burn_cpu", "exit": 0, "console": "one",
+         "success": True},
+        {"action": "network_loss", "exit": 2, "console": "two fail",
+         "success": False}]
+
+
+def test_combined_linux_script_cleans_up_when_killed(tmpdir):
+    flag = str(tmpdir.join("fault"))
+    script = render_composite([
+        ("fill_disk", "touch {}; sleep 30 & wait".format(flag))], "Linux")
+    script = script.replace("rm -f /root/burn", "rm -f {}".format(flag))
+
+    proc = subprocess.Popen(["sh", "-c", script])
+    sleep(0.5)
+    proc.send_signal(signal.SIGTERM)
+
+    assert proc.wait(5) == 143
+    assert not tmpdir.join("fault").exists()
+
+
+def test_parse_faults_of_an_interrupted_script():
+    assert parse_faults("", ["burn_cpu"])[0]["success"] is False
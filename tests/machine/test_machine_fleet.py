@@ -0,0 +1,79 @@
+import math
+
+import pytest
+from chaoslib.exceptions import FailedActivity
+
+from chaossaltstack.machine import fleet
+from chaossaltstack.machine.fleet import FleetColumns, salt_functions
+
+
+def node(load1, available=None, capacity=None):
+    results = {"status.loadavg": {
+        "1-min": load1, "5-min": load1 / 2, "15-min": load1 / 4}}
+    if available is not None:
+        results["status.meminfo"] = {
+            "MemTotal": {"value": "1000", "unit": "kB"},
+            "MemAvailable": {"value": str(available), "unit": "kB"}}
+    if capacity is not None:
+        results["disk.usage"] = {
+            "/": {"capacity": "{}%".format(capacity)},
+            "/var": {"capacity": "{}%".format(capacity + 10)}}
+    return results
+
+
+def test_salt_functions_are_called_once():
+    assert salt_functions(["load1", "load5", "mem_used_percent"]) == [
+        "status.loadavg", "status.meminfo"]
+
+    with pytest.raises(FailedActivity):
+        salt_functions(["load1", "swap"])
+
+
+@pytest.fixture(params=["python", "numpy"])
+def backend(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(fleet, "_numpy", None)
+    return request.param
+
+
+def test_aggregate(backend):
+    columns = FleetColumns(
+        ["load1", "load15", "mem_used_percent", "disk_used_percent"])
+    for i in range(1, 11):
+        columns.add("m{}".format(i), node(float(i), available=100 * i,
+                                          capacity=i))
+    # a minion without the salt function and one returning an error
+    columns.add("m11", node(5.0))
+    columns.add("m12", {"status.loadavg": "'status.loadavg' is not "
+                                          "available."})
+
+    stats = columns.aggregate([50, 90, 100])
+
+    load1 = stats["load1"]
+    assert load1["count"] == 11
+    assert (load1["min"], load1["max"]) == (1.0, 10.0)
+    assert math.isclose(load1["mean"], 60.0 / 11)
+    assert load1["p50"] == 5.0
+    assert math.isclose(load1["p90"], 9.0)
+    assert load1["p100"] == 10.0
+    assert load1["max_minion"] == "m10"
+    assert stats["load15"]["max"] == 2.5
+
+    memory = stats["mem_used_percent"]
+    assert memory["count"] == 10
+    assert math.isclose(memory["max"], 90.0)
+    assert memory["max_minion"] == "m1"
+    # the fullest filesystem of each minion
+    assert stats["disk_used_percent"]["min"] == 11.0
+
+
+def test_aggregate_without_values(backend):
+    columns = FleetColumns(["load1"])
+    columns.add("m1", {})
+
+    stats = columns.aggregate([95])
+
+    assert stats["load1"]["count"] == 0
+    assert stats["load1"]["p95"] is None
@@ -0,0 +1,77 @@
+import threading
+
+import pytest
+from chaoslib.exceptions import FailedActivity
+
+from chaossaltstack.machine.parallel import parallel_specs, run_specs
+
+
+def action(instance_ids, configuration=None, secrets=None, **arguments):
+    return {"instance_ids": instance_ids, "arguments": arguments}
+
+
+ACTIONS = {"burn_cpu": action, "network_latency": action}
+
+
+def test_specs_are_validated():
+    specs = parallel_specs([
+        {"action": "burn_cpu", "instance_ids": "app-1"},
+        {"action": "burn_cpu", "name": "workers",
+         "instance_ids": ["worker-1", "worker-2"],
+         "arguments": {"utilisation": 50}}], ACTIONS)
+
+    assert [(n, i, a) for n, _, i, a in specs] == [
+        ("burn_cpu", ["app-1"], {}),
+        ("workers", ["worker-1", "worker-2"], {"utilisation": 50})]
+
+
+@pytest.mark.parametrize("specs,error", [
+    ([], "No action"),
+    ([{"action": "rollback", "instance_ids": ["a"]}], "Unknown action"),
+    ([{"action": "burn_cpu"}], "instance_ids of 'burn_cpu'"),
+    ([{"action": "burn_cpu", "instance_ids": ["a"]},
+      {"action": "burn_cpu", "instance_ids": ["b"]}], "distinct name"),
+    ([{"action": "burn_cpu", "instance_ids": ["a", "b"]},
+      {"action": "network_latency", "instance_ids": ["c", "b"]}],
+     "'burn_cpu' and 'network_latency' both target b"),
+    ([{"action": "burn_cpu", "instance_ids": ["a"],
+       "arguments": {"instance_ids": ["b"]}}], "cannot be given"),
+])
+def test_invalid_specs(specs, error):
+    with pytest.raises(FailedActivity) as x:
+        parallel_specs(specs, ACTIONS)
+    assert error in str(x.value)
+
+
+def test_actions_run_concurrently():
+    barrier = threading.Barrier(3, timeout=5)
+
+    def wait(instance_ids, configuration=None, secrets=None):
+        barrier.wait()
+        return {"configuration": configuration, "secrets": secrets}
+
+    specs = [(str(i), wait, ["m{}".format(i)], {}) for i in range(3)]
+    results = run_specs(specs, {"saltstack": {}}, {"SALTMASTER_TOKEN": "t"})
+
+    assert list(results) == ["0", "1", "2"]
+    assert results["2"] == {"configuration": {"saltstack": {}},
+                            "secrets": {"SALTMASTER_TOKEN": "t"}}
+
+
+def test_failures_are_reported_once_all_are_done():
+    done = []
+
+    def fail(instance_ids, configuration=None, secrets=None):
+        raise FailedActivity("Cannot find any machines")
+
+    def succeed(instance_ids, configuration=None, secrets=None):
+        done.append(instance_ids)
+        return {}
+
+    with pytest.raises(FailedActivity) as x:
+        run_specs([("caches", fail, ["c"], {}),
+                   ("app", succeed, ["a"], {})])
+
+    assert done == [["a"]]
+    assert "1 of 2 actions failed, caches: Cannot find any machines" in \
+        str(x.value)
@@ -0,0 +1,56 @@
+from unittest.mock import MagicMock
+
+import pytest
+from chaoslib.exceptions import FailedActivity
+
+from chaossaltstack.machine.constants import BURN_IO, COMPOSITE, \
+    NETWORK_UTIL
+from chaossaltstack.machine.preflight import capabilities, check_mode, \
+    clear_capabilities, missing_commands, requirements
+
+
+@pytest.fixture(autouse=True)
+def empty_matrix():
+    clear_capabilities()
+    yield
+    clear_capabilities()
+
+
+def test_requirements():
+    assert "tc" in requirements(NETWORK_UTIL)
+    assert "date" not in requirements(NETWORK_UTIL)
+    assert "date" in requirements(NETWORK_UTIL, scheduled=True)
+    combined = requirements(COMPOSITE, [NETWORK_UTIL, BURN_IO])
+    assert {"tc", "timeout", "pgrep"} <= combined
+    assert requirements(None) == set()
+
+
+def test_capabilities_are_cached():
+    client = MagicMock()
+    client.iter_run_cmd.side_effect = [
+        iter([("CLIENT1", "tc\nsleep\npreflight-done"),
+              ("CLIENT2", "sleep\npreflight-done"),
+              ("CLIENT3", False)]),
+        iter([("CLIENT3", "tc\npreflight-done")])]
+
+    missing = missing_commands(client, ["CLIENT1", "CLIENT2", "CLIENT3"],
+                               {"tc", "sleep"})
+
+    assert missing == {"CLIENT2": ["tc"], "CLIENT3": ["sleep", "tc"]}
+    assert "command -v" in client.iter_run_cmd.call_args[0][2]
+
+    # only the minion which did not answer is asked again
+    found = capabilities(client, ["CLIENT1", "CLIENT3"])
+    assert client.iter_run_cmd.call_args[0][0] == ["CLIENT3"]
+    assert found["CLIENT1"] == {"tc", "sleep"}
+    assert found["CLIENT3"] == {"tc"}
+
+    # and all of them once expired
+    client.iter_run_cmd.side_effect = [iter([])]
+    assert capabilities(client, ["CLIENT1"], ttl=0) == {}
+
+
+def test_check_mode():
+    assert check_mode("filter") == "filter"
+    with pytest.raises(FailedActivity):
+        check_mode("skip")
@@ -1,7 +1,8 @@
-from unittest.mock import MagicMock, patch
+from unittest.mock import MagicMock, patch, mock_open
 
+from chaossaltstack.machine.actions import burn_cpu
 from chaossaltstack.machine.probes import is_minion_online, \
-    is_iproute_tc_installed
+    is_iproute_tc_installed, await_detached, detached_progress, fleet_metrics
 from chaoslib.exceptions import FailedActivity
 import pytest
 
@@ -19,7 +20,7 @@ def test_is_minion_online_multiple_minions(init):
     client = MagicMock()
     init.return_value = client
     cmd_return_value = {"CLIENT1": True,"CLIENT2": False}
-    client.run_cmd.return_value = cmd_return_value
+    client.iter_run_cmd.return_value = iter(cmd_return_value.items())
     # # do
     res = is_minion_online(instance_ids=THREE_INSTANCE)
     # # assert
@@ -34,7 +35,7 @@ def test_is_minion_online_offline_single(init):
     client = MagicMock()
     init.return_value = client
     cmd_return_value = {"CLIENT2": False}
-    client.run_cmd.return_value = cmd_return_value
+    client.iter_run_cmd.return_value = iter(cmd_return_value.items())
     # do
     res = is_minion_online(instance_ids=OFFLINE_MINION)
 
@@ -47,7 +48,7 @@ def test_is_minion_online_online_single(init):
     client = MagicMock()
     init.return_value = client
     cmd_return_value = {"CLIENT1": True}
-    client.run_cmd.return_value = cmd_return_value
+    client.iter_run_cmd.return_value = iter(cmd_return_value.items())
 
     res = is_minion_online(instance_ids=ONLINE_MINION)
 
@@ -60,7 +61,7 @@ def test_is_minion_online_not_minion(init):
     client = MagicMock()
     init.return_value = client
     cmd_return_value = {"": ''}
-    client.run_cmd.return_value = cmd_return_value
+    client.iter_run_cmd.return_value = iter(cmd_return_value.items())
 
     res = is_minion_online(instance_ids=NO_MINION)
 
@@ -73,7 +74,7 @@ def test_is_minion_online_online_two(init):
     client = MagicMock()
     init.return_value = client
     cmd_return_value = {"CLIENT1": True, "CLIENT4": True}
-    client.run_cmd.return_value = cmd_return_value
+    client.iter_run_cmd.return_value = iter(cmd_return_value.items())
 
     res = is_minion_online(instance_ids=ONLINE_MINIONS)
 
@@ -87,7 +88,7 @@ def test_is_iproute_tc_installed_multiple_minions(init):
     client = MagicMock()
     init.return_value = client
     cmd_return_value = {'CLIENT1': 'Usage: tc xxxxx', 'CLIENT2': 'tc: command not found'}
-    client.run_cmd.return_value = cmd_return_value
+    client.iter_run_cmd.return_value = iter(cmd_return_value.items())
     # do
     res = is_iproute_tc_installed(instance_ids=THREE_INSTANCE)
     # assert
@@ -102,7 +103,7 @@ def test_is_iproute_tc_installed_single_not_installed(init):
     client = MagicMock()
     init.return_value = client
     cmd_return_value = {'CLIENT1': 'Usage: tc xxxxx'}
-    client.run_cmd.return_value = cmd_return_value
+    client.iter_run_cmd.return_value = iter(cmd_return_value.items())
     # do
     res = is_iproute_tc_installed(instance_ids=ONLINE_MINION)
     # assert
@@ -115,7 +116,7 @@ def test_is_iproute_tc_installed_single_installed(init):
     client = MagicMock()
     init.return_value = client
     cmd_return_value = {'CLIENT2': 'tc: command not found'}
-    client.run_cmd.return_value = cmd_return_value
+    client.iter_run_cmd.return_value = iter(cmd_return_value.items())
     # do
     res = is_iproute_tc_installed(instance_ids=OFFLINE_MINION)
     # assert
@@ -128,7 +129,7 @@ def test_is_iproute_tc_installed_two_installed(init):
     client = MagicMock()
     init.return_value = client
     cmd_return_value = {'CLIENT1': 'Usage: tc xxxxx', 'CLIENT4': 'Usage: tc xxxxx'}
-    client.run_cmd.return_value = cmd_return_value
+    client.iter_run_cmd.return_value = iter(cmd_return_value.items())
     # do
     res = is_iproute_tc_installed(instance_ids=ONLINE_MINIONS)
     # assert
@@ -142,9 +143,71 @@ def test_is_iproute_tc_installed_not_minion(init):
     client = MagicMock()
     init.return_value = client
     cmd_return_value = {'': ''}
-    client.run_cmd.return_value = cmd_return_value
+    client.iter_run_cmd.return_value = iter(cmd_return_value.items())
     # do
     res = is_iproute_tc_installed(instance_ids=NO_MINION)
     # assert
     assert res["CLIENT3"] == "Not a Salt Minion"
 
+
+@patch("builtins.open", new_callable=mock_open, read_data="script")
+@patch('chaossaltstack.machine.actions.saltstack_api_client', autospec=True)
+def test_detached_action_is_awaited_later(init, open):
+    # mock
+    client = MagicMock()
+    init.return_value = client
+    client.get_grains_get.return_value = {"CLIENT1": "Linux", "CLIENT2": "Linux"}
+    client.async_run_cmd.side_effect = ["1", "2"]
+    client.iter_async_cmd_exit_success.side_effect = [
+        iter({"CLIENT1": True}.items()), iter({}.items()),
+        iter({"CLIENT1": True}.items()), iter({"CLIENT2": True}.items())]
+    client.iter_async_cmd_result.side_effect = [
+        iter({"CLIENT1": "success"}.items()),
+        iter({"CLIENT2": "success"}.items())]
+
+    # do
+    with patch('chaossaltstack.machine.actions.sleep') as sleep:
+        handle = burn_cpu(instance_ids=["CLIENT1", "CLIENT2"],
+                          execution_duration="60", detached=True)
+        sleep.assert_not_called()
+        assert handle["jids"] == {"CLIENT1": "1", "CLIENT2": "2"}
+
+        progress = detached_progress(handle["handle"])[handle["handle"]]
+        assert (progress["minions"], progress["returned"]) == (2, 1)
+        assert 0 < progress["remaining"] <= 60
+
+        results = await_detached()
+        assert 0 < sleep.call_args[0][0] <= 60
+
+    assert "success" in results[handle["handle"]]["CLIENT2"]
+    with pytest.raises(FailedActivity):
+        detached_progress(handle["handle"])
+
+
+
+@patch('chaossaltstack.machine.probes.saltstack_api_client', autospec=True)
+def test_fleet_metrics_in_one_call(init):
+    client = MagicMock()
+    init.return_value = client
+    client.iter_run_cmd.return_value = iter([
+        ("CLIENT1", {"status.loadavg": {"1-min": 0.5},
+                     "disk.usage": {"/": {"capacity": "40%"}}}),
+        ("CLIENT2", {"status.loadavg": {"1-min": 1.5},
+                     "disk.usage": {"/": {"capacity": "60%"}}}),
+        ("CLIENT3", "Minion did not return. [No response]"),
+    ])
+
+    res = fleet_metrics(instance_ids=THREE_INSTANCE,
+                        metrics=["load1", "disk_used_percent"],
+                        percentiles=[50])
+
+    client.iter_run_cmd.assert_called_once_with(
+        THREE_INSTANCE, ["status.loadavg", "disk.usage"], [[], []])
+    assert res["minions"] == 3
+    assert res["responded"] == 3
+    assert res["metrics"]["load1"]["count"] == 2
+    assert res["metrics"]["load1"]["p50"] == 1.0
+    assert res["metrics"]["disk_used_percent"]["max_minion"] == "CLIENT2"
+
+    with pytest.raises(FailedActivity):
+        fleet_metrics(instance_ids=THREE_INSTANCE, percentiles=[101])
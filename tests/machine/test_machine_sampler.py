@@ -0,0 +1,48 @@
+import os
+import subprocess
+
+import pytest
+from chaoslib.exceptions import FailedActivity
+
+from chaossaltstack.machine.constants import OS_LINUX, OS_WINDOWS
+from chaossaltstack.machine.sampler import parse_samples, sample_script
+
+
+def test_sample_script_wraps_linux_scripts_only():
+    script = sample_script("echo fault", OS_LINUX, 0.5)
+
+    assert "while sleep 0.5; do" in script
+    assert "echo fault" in script
+    assert sample_script("echo fault", OS_WINDOWS, 0.5) == "echo fault"
+    with pytest.raises(FailedActivity):
+        sample_script("echo fault", OS_LINUX, -1)
+
+
+def test_parse_samples_decodes_deltas():
+    series = parse_samples(
+        "Machine CLIENT1 : True - Console: done\n"
+        "chaossaltstack-samples 1000,400,800,2048,10,20,30,40;"
+        "50,20,40,-1024,8,0,4096,0;51,0,0,512,0,16,0,2048")
+
+    assert series["time"] == [0.5, 1.01]
+    assert series["cpu_percent"] == [50.0, None]
+    assert series["mem_available_kb"] == [1024, 1536]
+    assert series["disk_read_kb"] == [4, 0]
+    assert series["disk_write_kb"] == [0, 8]
+    assert series["net_rx_kb"] == [4.0, 0.0]
+    assert series["net_tx_kb"] == [0.0, 2.0]
+    assert parse_samples("done") is None
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/stat"), reason="needs /proc")
+def test_sampled_script_runs():
+    script = sample_script("sleep 0.3; echo fault; exit 3", OS_LINUX, 0.1)
+
+    process = subprocess.run(["sh", "-c", script], stdout=subprocess.PIPE,
+                             universal_newlines=True, timeout=10)
+
+    assert process.returncode == 3
+    assert process.stdout.startswith("fault\n")
+    series = parse_samples(process.stdout)
+    assert len(series["time"]) >= 2
+    assert all(v is None or 0 <= v <= 100 for v in series["cpu_percent"])
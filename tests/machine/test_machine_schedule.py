@@ -0,0 +1,85 @@
+import random
+import subprocess
+from time import time
+
+from chaoslib.exceptions import FailedActivity
+import pytest
+
+from chaossaltstack.machine.schedule import parse_timing, plan_schedule, \
+    schedule_script, stagger_offsets
+
+
+def test_scheduled_linux_script_waits_and_reports_timing():
+    start_at = time() + 0.5
+    script = schedule_script("duration='0'\necho chaos\nexit 3", "Linux",
+                             start_at)
+
+    proc = subprocess.run(["sh", "-c", script], stdout=subprocess.PIPE,
+                          universal_newlines=True)
+
+    assert proc.returncode == 3
+    assert "chaos" in proc.stdout
+    timing = parse_timing(proc.stdout)
+    assert start_at - 0.01 <= timing["started"] <= timing["stopped"]
+
+
+def test_scheduled_windows_script_wraps_the_body():
+    script = schedule_script("Write-Output chaos", "Windows", 100.0)
+
+    assert script.startswith("$start_at = [double]'100.000'")
+    assert "& {\nWrite-Output chaos\n}" in script
+
+
+def test_schedule_unknown_os():
+    with pytest.raises(FailedActivity):
+        schedule_script("script", "Solaris", 100.0)
+
+
+def test_parse_timing_of_an_interrupted_script():
+    assert parse_timing("chaossaltstack-timing started=12\nKilled") == {
+        "started": 12.0}
+
+
+def test_stagger_profiles():
+    assert stagger_offsets(5, 8.0, "linear") == [0, 2, 4, 6, 8]
+    # waves of 1, 2, 4 then 1 minions
+    assert stagger_offsets(8, 6.0, "exponential") == [0, 2, 2, 4, 4, 4, 4, 6]
+    jitter = stagger_offsets(100, 5.0, "random", random.Random(1))
+    assert all(0 <= offset <= 5.0 for offset in jitter)
+    assert jitter == stagger_offsets(100, 5.0, "random", random.Random(1))
+    assert stagger_offsets(3, 0, "random") == [0, 0, 0]
+
+
+def test_stagger_unknown_profile():
+    with pytest.raises(FailedActivity):
+        stagger_offsets(3, 1.0, "sawtooth")
+
+
+def test_plan_schedule_is_off_by_default():
+    assert plan_schedule({}, ["CLIENT1"], 60) is None
+
+
+def test_recovery_window_spreads_the_ends_further():
+    minions = ["CLIENT{}".format(i) for i in range(4)]
+    plan = plan_schedule({"stagger_window": 60, "recovery_window": 30},
+                         minions, 100)
+
+    starts = [start for start, _ in plan.values()]
+    ends = [start + length for start, length in plan.values()]
+    assert list(plan) == minions
+    assert [round(s - starts[0]) for s in starts] == [0, 20, 40, 60]
+    assert [round(e - starts[0]) for e in ends] == [100, 130, 160, 190]
+    assert round(max(ends) - min(ends)) == 60 + 30
+    assert [length for _, length in plan.values()] == [100, 110, 120, 130]
+
+
+def test_plan_schedule_spreads_thousands_of_minions():
+    minions = ["minion{}".format(i) for i in range(10000)]
+    plan = plan_schedule({"stagger_window": 60, "stagger_profile": "random",
+                          "stagger_seed": 7}, minions, 30)
+
+    starts = [start for start, _ in plan.values()]
+    assert len(plan) == 10000
+    assert starts == sorted(starts)
+    assert 59 < starts[-1] - starts[0] <= 60
+    assert set(length for _, length in plan.values()) == {30}
@@ -0,0 +1,62 @@
+import subprocess
+
+import pytest
+from chaoslib.exceptions import FailedActivity
+
+from chaossaltstack.machine import status
+from chaossaltstack.machine.constants import OS_LINUX, OS_WINDOWS
+from chaossaltstack.machine.status import check_result_mode, log_command, \
+    log_path, status_script
+
+
+def test_status_script_logs_on_the_minion(tmpdir, monkeypatch):
+    monkeypatch.setitem(status._LOG_PATHS, OS_LINUX,
+                        str(tmpdir.join("{token}.log")))
+    script = status_script(
+        "echo starting\necho step 1 fail\necho chaossaltstack-fault 1 end "
+        "exit=0\necho more\necho 'experiment -> success'\nexit 3",
+        OS_LINUX, "abc")
+
+    process = subprocess.run(["sh", "-c", script], stdout=subprocess.PIPE,
+                             universal_newlines=True, timeout=10)
+
+    assert process.returncode == 3
+    assert process.stdout.splitlines() == [
+        "step 1 fail", "chaossaltstack-fault 1 end exit=0",
+        "experiment -> success"]
+    assert tmpdir.join("abc.log").read().startswith("starting\n")
+
+    # fetching the log deletes it
+    process = subprocess.run(
+        ["sh", "-c", log_command(OS_LINUX, "abc")], stdout=subprocess.PIPE,
+        universal_newlines=True, timeout=10)
+    assert process.stdout.startswith("starting\n")
+    assert not tmpdir.join("abc.log").exists()
+
+
+def test_log_of_a_successful_script_is_deleted(tmpdir, monkeypatch):
+    monkeypatch.setitem(status._LOG_PATHS, OS_LINUX,
+                        str(tmpdir.join("{token}.log")))
+    script = status_script(
+        "echo starting\necho 'experiment -> success'", OS_LINUX, "abc")
+
+    process = subprocess.run(["sh", "-c", script], stdout=subprocess.PIPE,
+                             universal_newlines=True, timeout=10)
+
+    assert process.returncode == 0
+    assert process.stdout == "experiment -> success\n"
+    assert not tmpdir.join("abc.log").exists()
+
+
+def test_log_command():
+    assert log_command(OS_LINUX, "abc") == \
+        "cat '/tmp/chaossaltstack-abc.log'; " \
+        "rm -f '/tmp/chaossaltstack-abc.log'"
+    assert log_path(OS_WINDOWS, "abc") in log_command(OS_WINDOWS, "abc")
+    assert "Out-File" in status_script("Write-Output 1", OS_WINDOWS, "abc")
+
+
+def test_check_result_mode():
+    assert check_result_mode("status") == "status"
+    with pytest.raises(FailedActivity):
+        check_result_mode("quiet")
@@ -0,0 +1,139 @@
+import json
+import threading
+from time import sleep, time
+from unittest.mock import MagicMock
+
+import pytest
+import requests_mock
+from chaoslib.exceptions import FailedActivity
+
+from chaossaltstack import saltstack_api_client
+from chaossaltstack.fanout import STREAM_QUEUE_SIZE, stream_all
+from chaossaltstack.chunking import ChunkedClient, split_jid, target_list
+from chaossaltstack.machine.probes import is_minion_online
+
+
+def test_targets_are_sent_in_chunks():
+    client = MagicMock()
+    client.get_grains_get.side_effect = lambda tgt, item: dict(
+        (k, "Linux") for k in tgt)
+    chunked = ChunkedClient(client, 2)
+
+    machines = chunked.get_grains_get(
+        ("m{}".format(i) for i in range(5)), "kernel")
+
+    assert sorted(machines) == ["m0", "m1", "m2", "m3", "m4"]
+    targets = sorted(c[0][0] for c in client.get_grains_get.call_args_list)
+    assert targets == [["m0", "m1"], ["m2", "m3"], ["m4"]]
+
+    # a single minion, or a small list, is sent as it is
+    chunked.run_cmd("m0", "test.ping")
+    chunked.run_cmd(["m0", "m1"], "test.ping")
+    assert [c[0][0] for c in client.run_cmd.call_args_list] == [
+        "m0", ["m0", "m1"]]
+
+
+def test_jobs_published_in_chunks():
+    client = MagicMock()
+    client.async_run_cmd.side_effect = lambda tgt, *args: "1{}".format(
+        tgt[0][1:])
+    client.iter_async_cmd_result.side_effect = lambda jid: iter([
+        ("m{}".format(jid[1:]), "done")])
+    chunked = ChunkedClient(client, 1)
+
+    jid = chunked.async_run_cmd(["m0", "m1", "m2"], "cmd.run", "ls")
+
+    assert jid == "chunks:10,11,12"
+    # another client, such as the one of a detached run, can look it up
+    results = dict(ChunkedClient(client, 1).iter_async_cmd_result(jid))
+    assert results == {"m0": "done", "m1": "done", "m2": "done"}
+    assert chunked.async_run_cmd(["m0"], "cmd.run", "ls") == "10"
+
+
+def test_chunks_are_sent_concurrently():
+    barrier = threading.Barrier(3, timeout=5)
+
+    def stream(tgt, method, arg=None, kwarg=None):
+        # every chunk must be in flight at once to get past the barrier
+        barrier.wait()
+        return iter([(k, True) for k in tgt])
+
+    client = MagicMock()
+    client.iter_run_cmd.side_effect = stream
+    chunked = ChunkedClient(client, 2, max_workers=3)
+
+    results = dict(chunked.iter_run_cmd(
+        ["m{}".format(i) for i in range(6)], "test.ping"))
+
+    assert len(results) == 6
+
+
+def test_failed_chunks_are_raised():
+    client = MagicMock()
+    client.iter_async_cmd_result.side_effect = [
+        iter([("m0", "done")]), IOError("timed out")]
+
+    with pytest.raises(IOError):
+        list(ChunkedClient(client, 1).iter_async_cmd_result("chunks:1,2"))
+    with pytest.raises(FailedActivity):
+        ChunkedClient(client, 0)
+
+
+def test_targets_read_from_a_file(tmpdir):
+    path = tmpdir.join("minions.txt")
+    path.write("# web tier\nweb-1\n\n  web-2 \n")
+
+    assert target_list(str(path)) == ["web-1", "web-2"]
+    assert target_list(iter(["web-1"])) == ["web-1"]
+    assert target_list("web-1") == "web-1"
+    assert target_list(None) is None
+
+
+def test_probe_with_chunks_of_a_file(tmpdir):
+    path = tmpdir.join("minions.txt")
+    path.write("\n".join("minion-{}".format(i) for i in range(25)))
+    secrets = {"SALTMASTER_HOST": "http://salt-chunks",
+               "SALTMASTER_TOKEN": "t"}
+    configuration = {"saltstack": {"chunk_size": 10}}
+    assert isinstance(
+        saltstack_api_client(secrets, configuration), ChunkedClient)
+
+    def ping(request, context):
+        return {"return": [dict(
+            (k, True) for k in json.loads(request.body)["tgt"])]}
+
+    with requests_mock.Mocker() as m:
+        m.post("http://salt-chunks", json=ping)
+        result = is_minion_online(str(path), configuration, secrets)
+
+    assert len(result) == 25
+    assert set(result.values()) == {"Online"}
+    sizes = sorted(len(json.loads(r.body)["tgt"]) for r in m.request_history)
+    assert sizes == [5, 10, 10]
+
+
+def test_composite_jids_are_split():
+    assert split_jid("chunks:1,multi:eu=2;us=3") == ["1", "2", "3"]
+    assert split_jid(20190830103239148771) == ["20190830103239148771"]
+
+
+def test_streams_wait_for_their_consumer():
+    produced = []
+
+    def stream(n):
+        def items():
+            for i in range(STREAM_QUEUE_SIZE * 4):
+                produced.append(n)
+                yield i
+        return items
+
+    merged = stream_all([stream(0), stream(1)])
+    next(merged)
+    deadline = time() + 2
+    while time() < deadline and len(produced) < STREAM_QUEUE_SIZE:
+        sleep(0.01)
+    sleep(0.2)
+
+    # the producers are held back by the queue, not reading ahead
+    assert len(produced) <= STREAM_QUEUE_SIZE + 3
+    merged.close()
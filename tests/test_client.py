@@ -0,0 +1,249 @@
+import gzip
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.client import RemoteDisconnected
+from time import time
+
+import pytest
+import requests
+import requests_mock
+from chaoslib.exceptions import FailedActivity
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from chaossaltstack import COMPRESSION_THRESHOLD, close_clients, \
+    saltstack_api_client
+from chaossaltstack.metrics import activity_metrics
+
+SECRETS = {"SALTMASTER_HOST": "http://salt", "SALTMASTER_TOKEN": "t"}
+
+
+def test_large_request_bodies_are_gzipped():
+    configuration = {"saltstack": {"compress_requests": True}}
+    client = saltstack_api_client(SECRETS, configuration)
+    script = "echo chaos\n" * COMPRESSION_THRESHOLD
+
+    with requests_mock.Mocker() as m, activity_metrics("test") as metrics:
+        m.post("http://salt", json={"return": [{"jid": "1"}]})
+        client.async_run_cmd("CLIENT1", "cmd.run", script)
+
+    request = m.request_history[0]
+    assert request.headers["Content-Encoding"] == "gzip"
+    assert request.headers["Accept-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(request.body).decode())["arg"] == script
+    sent = metrics.summary()["requests"]["cmd.run"]
+    assert sent["sent_bytes"] < sent["sent_raw_bytes"]
+
+
+def test_small_or_uncompressed_request_bodies_are_sent_as_is():
+    client = saltstack_api_client(
+        SECRETS, {"saltstack": {"compress_requests": True}})
+
+    with requests_mock.Mocker() as m:
+        m.post("http://salt", json={"return": [{"CLIENT1": True}]})
+        client.run_cmd(["CLIENT1"], "test.ping")
+
+    assert "Content-Encoding" not in m.request_history[0].headers
+    assert json.loads(m.request_history[0].body)["fun"] == "test.ping"
+
+
+def test_streamed_results_are_yielded_as_parsed():
+    client = saltstack_api_client(SECRETS)
+    body = json.dumps({"return": [dict(
+        ("minion-{}".format(i), "done") for i in range(500))]})
+
+    with requests_mock.Mocker() as m, activity_metrics("test") as metrics:
+        m.post("http://salt", text=body)
+        results = client.iter_async_cmd_result("20190830103239148771")
+        assert next(results) == ("minion-0", "done")
+        assert len(list(results)) == 499
+
+    assert json.loads(m.request_history[0].body)["fun"] == "jobs.lookup_jid"
+    summary = metrics.summary()["requests"]["jobs.lookup_jid"]
+    assert summary["received_raw_bytes"] == len(body)
+
+
+def test_unix_socket_transport(tmpdir):
+    import socketserver
+    import threading
+    from http.server import BaseHTTPRequestHandler
+
+    bodies = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers["Content-Length"])
+            bodies.append((self.path, json.loads(self.rfile.read(length))))
+            result = {"token": "t", "expire": time() + 3600} \
+                if self.path == "/login" else {"CLIENT1": "Linux"}
+            body = json.dumps({"return": [result]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def address_string(self):
+            return "unix"
+
+        def log_message(self, *args):
+            pass
+
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    path = str(tmpdir.join("salt-api.sock"))
+    server = Server(path, Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        client = saltstack_api_client({
+            "SALTMASTER_HOST": "unix://{}".format(path),
+            "SALTMASTER_USER": "salt", "SALTMASTER_PASSWORD": "salt"})
+        assert client.get_grains_get(["CLIENT1"], "kernel") == {
+            "CLIENT1": "Linux"}
+        assert dict(client.iter_run_cmd(["CLIENT1"], "test.ping")) == {
+            "CLIENT1": "Linux"}
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # the token is obtained once for both calls
+    assert [p for p, _ in bodies] == ["/login", "/", "/"]
+    assert bodies[1][1]["fun"] == "grains.get"
+
+
+def test_keyword_arguments_are_sent_as_kwarg():
+    client = saltstack_api_client(SECRETS)
+
+    with requests_mock.Mocker() as m:
+        m.post("http://salt", json={"return": [{"jid": "1"}]})
+        client.async_run_cmd(["CLIENT1", "CLIENT2"], "cmd.run", "echo",
+                             kwarg={"template": "jinja"})
+
+    low = json.loads(m.request_history[0].body)
+    assert low["tgt"] == ["CLIENT1", "CLIENT2"]
+    assert low["kwarg"] == {"template": "jinja"}
+
+
+def test_clients_are_shared_per_master_and_credentials():
+    client = saltstack_api_client(SECRETS)
+
+    assert saltstack_api_client(dict(SECRETS)) is client
+    assert saltstack_api_client(
+        dict(SECRETS, SALTMASTER_TOKEN="other")) is not client
+    assert saltstack_api_client(
+        SECRETS, {"saltstack": {"retries": 2}}) is not client
+
+    close_clients()
+    assert saltstack_api_client(SECRETS) is not client
+
+
+def test_threads_share_one_login():
+    secrets = {"SALTMASTER_HOST": "http://salt-login",
+               "SALTMASTER_USER": "salt", "SALTMASTER_PASSWORD": "salt"}
+    client = saltstack_api_client(secrets)
+    barrier = threading.Barrier(8, timeout=5)
+
+    def ping():
+        barrier.wait()
+        return client.run_cmd(["CLIENT1"], "test.ping")
+
+    with requests_mock.Mocker() as m:
+        m.post("http://salt-login/login", json={"return": [
+            {"token": "t1", "expire": time() + 3600}]})
+        m.post("http://salt-login", json={"return": [{"CLIENT1": True}]})
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda _: ping(), range(8)))
+
+        assert results == [{"CLIENT1": True}] * 8
+        logins = [r for r in m.request_history if r.path == "/login"]
+        assert len(logins) == 1
+        assert "X-Auth-Token" not in client.headers
+        assert all(r.headers["X-Auth-Token"] == "t1"
+                   for r in m.request_history if r.path == "/")
+
+
+@pytest.mark.parametrize("streamed", [False, True])
+def test_refused_token_is_renewed_and_the_request_replayed(streamed):
+    secrets = {"SALTMASTER_HOST": "http://salt-renew",
+               "SALTMASTER_USER": "salt", "SALTMASTER_PASSWORD": "salt"}
+    close_clients()
+    client = saltstack_api_client(secrets)
+    tokens = iter(["t1", "t2"])
+
+    def login(request, context):
+        return {"return": [{"token": next(tokens),
+                            "expire": time() + 3600}]}
+
+    def ping(request, context):
+        # the master revoked t1 early
+        if request.headers["X-Auth-Token"] == "t1":
+            context.status_code = 401
+            return {"return": ["Please log in"]}
+        return {"return": [{"CLIENT1": True}]}
+
+    with requests_mock.Mocker() as m:
+        m.post("http://salt-renew/login", json=login)
+        m.post("http://salt-renew", json=ping)
+        if streamed:
+            result = dict(client.iter_run_cmd(["CLIENT1"], "test.ping"))
+        else:
+            result = client.run_cmd(["CLIENT1"], "test.ping")
+
+    assert result == {"CLIENT1": True}
+    assert [r.path for r in m.request_history] == [
+        "/login", "/", "/login", "/"]
+    assert client.token == "t2"
+
+
+def test_bad_credentials_fail_without_hanging():
+    secrets = {"SALTMASTER_HOST": "http://salt-denied",
+               "SALTMASTER_USER": "salt", "SALTMASTER_PASSWORD": "wrong"}
+    client = saltstack_api_client(secrets)
+    errors = []
+
+    def ping():
+        try:
+            client.run_cmd(["CLIENT1"], "test.ping")
+        except FailedActivity as x:
+            errors.append(str(x))
+
+    with requests_mock.Mocker() as m:
+        m.post("http://salt-denied/login", status_code=401,
+               text="Could not authenticate")
+        thread = threading.Thread(target=ping, daemon=True)
+        thread.start()
+        thread.join(5)
+
+    assert not thread.is_alive()
+    assert errors == ["Cannot log in to http://salt-denied as salt"]
+
+
+def test_dispatch_is_not_replayed_once_sent():
+    client = saltstack_api_client(SECRETS, {"saltstack": {"retries": 2}})
+    aborted = requests.exceptions.ConnectionError(
+        "Connection aborted.", RemoteDisconnected("closed without response"))
+
+    with requests_mock.Mocker() as m:
+        m.post("http://salt", exc=aborted)
+        with pytest.raises(requests.exceptions.ConnectionError):
+            client.async_run_cmd("CLIENT1", "cmd.run", "script")
+        assert m.call_count == 1
+
+        m.post("http://salt", [
+            {"exc": aborted}, {"json": {"return": [{"CLIENT1": True}]}}])
+        assert client.async_cmd_exit_success("1") == {"CLIENT1": True}
+        assert m.call_count == 3
+
+
+def test_dispatch_is_retried_when_the_master_is_unreachable():
+    client = saltstack_api_client(SECRETS, {"saltstack": {"retries": 2}})
+    refused = requests.exceptions.ConnectionError(MaxRetryError(
+        None, "/", NewConnectionError(None, "Connection refused")))
+
+    with requests_mock.Mocker() as m:
+        m.post("http://salt", [
+            {"exc": refused}, {"json": {"return": [{"jid": "1"}]}}])
+        assert client.async_run_cmd("CLIENT1", "cmd.run", "script") == "1"
+        assert m.call_count == 2
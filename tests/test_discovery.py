@@ -0,0 +1,51 @@
+import json
+import subprocess
+import sys
+
+from chaossaltstack import __version__, discover
+from chaossaltstack import discovery
+
+
+def test_shipped_manifest_is_up_to_date():
+    with open(discovery.MANIFEST_PATH) as f:
+        manifest = json.load(f)
+
+    assert manifest["version"] == __version__
+    assert manifest["activities"] == json.loads(
+        json.dumps(discovery.introspect_activities()))
+
+
+def test_discover_lists_activities_of_this_package():
+    activities = discover()["activities"]
+    names = set(a["name"] for a in activities)
+
+    assert {"burn_cpu", "is_minion_online"} <= names
+    assert set(a["mod"] for a in activities) == set(
+        discovery.ACTIVITY_MODULES.values())
+
+
+def test_discover_does_not_import_activities():
+    code = "import sys, chaossaltstack; chaossaltstack.discover(); " \
+           "print([m for m in sys.modules if m.startswith(" \
+           "'chaossaltstack.machine') or m == 'requests'])"
+    output = subprocess.check_output(
+        [sys.executable, "-c", code], universal_newlines=True,
+        stderr=subprocess.DEVNULL)
+
+    assert output.strip() == "[]"
+
+
+def test_stale_manifest_falls_back_to_cache(tmpdir, monkeypatch):
+    manifest = tmpdir.join("activities.json")
+    manifest.write(json.dumps({"version": "0.0.0", "activities": []}))
+    monkeypatch.setattr(discovery, "MANIFEST_PATH", str(manifest))
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmpdir.join("cache")))
+
+    activities = discovery.load_activities(__version__)
+    assert activities
+
+    cached = tmpdir.join("cache", "chaostoolkit-saltstack").listdir()
+    assert len(cached) == 1
+    monkeypatch.setattr(discovery, "introspect_activities", None)
+    assert discovery.load_activities(__version__) == json.loads(
+        json.dumps(activities))
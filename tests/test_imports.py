@@ -0,0 +1,14 @@
+import subprocess
+import sys
+
+
+def test_package_import_does_not_load_transport():
+    code = "import sys, chaossaltstack, chaossaltstack.machine.actions, " \
+           "chaossaltstack.machine.probes; " \
+           "print(sorted(m for m in ('requests', 'urllib3', " \
+           "'chaoslib.discovery', 'sqlite3', 'numpy', 'logzero') " \
+           "if m in sys.modules))"
+    output = subprocess.check_output(
+        [sys.executable, "-c", code], universal_newlines=True)
+
+    assert output.strip() == "[]"
@@ -0,0 +1,176 @@
+import sqlite3
+from unittest.mock import MagicMock, patch, mock_open
+
+from chaossaltstack.jobstore import JobStore, collect_jobs, get_job_store, \
+    kill_jobs
+from chaossaltstack.machine.actions import burn_cpu
+
+
+def test_store_records_runs_and_jobs(tmpdir):
+    store = JobStore(str(tmpdir.join("jobs.db")))
+    run_id = store.start_run("cpu_stress_test", {"duration": "60"})
+    store.record_dispatch(run_id, "cpu_stress_test", "CLIENT1", "1",
+                          {"duration": "60", "instance_id": "CLIENT1"})
+    store.record_dispatch(run_id, "cpu_stress_test", "CLIENT2", "2")
+    store.record_result("1", "CLIENT1", False, "experiment -> fail")
+
+    assert [j["minion"] for j in store.pending(run_id)] == ["CLIENT2"]
+    failed = store.jobs(failed=True)
+    assert [j["minion"] for j in failed] == ["CLIENT1"]
+    assert failed[0]["result"] == '"experiment -> fail"'
+    assert store.jobs(minion="CLIENT2", action="cpu_stress_test")[0][
+        "jid"] == "2"
+
+    summary = store.summary()
+    assert summary[0]["jobs"] == 2
+    assert summary[0]["failures"] == 1
+    assert summary[0]["pending"] == 1
+
+    store.end_run(run_id)
+    store.close()
+
+
+def test_store_survives_reopening(tmpdir):
+    path = str(tmpdir.join("jobs.db"))
+    store = JobStore(path)
+    run_id = store.start_run("kill_process")
+    store.record_dispatch(run_id, "kill_process", "CLIENT1", "1")
+    store.close()
+
+    assert JobStore(path).pending()[0]["jid"] == "1"
+
+
+def test_job_store_is_shared_per_path(tmpdir):
+    settings = {"job_store": str(tmpdir.join("jobs.db"))}
+
+    assert get_job_store(settings) is get_job_store(dict(settings))
+    assert get_job_store({}) is None
+
+
+@patch('chaossaltstack.saltstack_api_client', autospec=True)
+def test_reattach_to_pending_jobs(init, tmpdir):
+    client = MagicMock()
+    init.return_value = client
+    client.iter_async_cmd_exit_success.side_effect = \
+        lambda jid: iter({'CLIENT1': True}.items())
+    client.iter_async_cmd_result.side_effect = \
+        lambda jid: iter({'CLIENT1': "success", 'OTHER': "success"}.items())
+    store = JobStore(str(tmpdir.join("jobs.db")))
+    run_id = store.start_run("cpu_stress_test")
+    for minion in ("CLIENT1", "CLIENT2"):
+        store.record_dispatch(run_id, "cpu_stress_test", minion, "1")
+
+    assert collect_jobs(store, run_id) == {"CLIENT1": "success"}
+    assert [j["minion"] for j in store.pending()] == ["CLIENT2"]
+    assert _run_status(store, run_id) == ("running", False)
+
+    kill_jobs(store, run_id)
+    client.run_cmd.assert_called_once_with(
+        ["CLIENT2"], "saltutil.kill_job", "1")
+    assert store.pending() == []
+    killed = store.jobs(minion="CLIENT2")[0]
+    assert (killed["success"], killed["result"]) == (0, '"killed"')
+    assert store.summary()[0]["pending"] == 0
+    assert _run_status(store, run_id) == ("killed", True)
+
+    kill_jobs(store, run_id)
+    client.run_cmd.assert_called_once()
+
+
+@patch('chaossaltstack.saltstack_api_client', autospec=True)
+def test_collect_ends_runs_without_pending_jobs(init, tmpdir):
+    client = MagicMock()
+    init.return_value = client
+    client.iter_async_cmd_exit_success.side_effect = \
+        lambda jid: iter({'CLIENT1': True}.items())
+    client.iter_async_cmd_result.side_effect = \
+        lambda jid: iter({'CLIENT1': "success"}.items())
+    store = JobStore(str(tmpdir.join("jobs.db")))
+    failed_run = store.start_run("cpu_stress_test")
+    store.record_dispatch(failed_run, "cpu_stress_test", "CLIENT1", "1")
+    store.end_run(failed_run, "failed")
+    run_id = store.start_run("cpu_stress_test")
+    store.record_dispatch(run_id, "cpu_stress_test", "CLIENT1", "2")
+
+    collect_jobs(store)
+
+    assert store.pending() == []
+    assert _run_status(store, run_id) == ("completed", True)
+    assert _run_status(store, failed_run) == ("failed", True)
+
+
+@patch('chaossaltstack.saltstack_api_client', autospec=True)
+def test_collect_jobs_published_in_chunks(init, tmpdir):
+    client = MagicMock()
+    init.return_value = client
+    answers = {"1": {"CLIENT1": "success"}, "2": {"CLIENT2": "success"},
+               "3": {"CLIENT3": "experiment -> fail"}}
+    client.iter_async_cmd_exit_success.side_effect = \
+        lambda jid: iter({m: True for m in answers[jid]}.items())
+    client.iter_async_cmd_result.side_effect = \
+        lambda jid: iter(answers[jid].items())
+    store = JobStore(str(tmpdir.join("jobs.db")))
+    run_id = store.start_run("cpu_stress_test")
+    for minion in ("CLIENT1", "CLIENT2", "CLIENT3"):
+        store.record_dispatch(
+            run_id, "cpu_stress_test", minion, "chunks:1,multi:eu=2;us=3")
+
+    collected = collect_jobs(store, run_id)
+
+    assert sorted(collected) == ["CLIENT1", "CLIENT2", "CLIENT3"]
+    assert [c[0][0] for c in client.iter_async_cmd_result.call_args_list] \
+        == ["1", "2", "3"]
+    assert store.pending(run_id) == []
+    failed = store.jobs(failed=True)
+    assert [(j["jid"], j["minion"]) for j in failed] == [
+        ("chunks:1,multi:eu=2;us=3", "CLIENT3")]
+
+
+@patch('chaossaltstack.saltstack_api_client', autospec=True)
+def test_kill_jobs_published_in_chunks(init, tmpdir):
+    client = MagicMock()
+    init.return_value = client
+    store = JobStore(str(tmpdir.join("jobs.db")))
+    run_id = store.start_run("cpu_stress_test")
+    for minion in ("CLIENT1", "CLIENT2", "CLIENT3"):
+        store.record_dispatch(
+            run_id, "cpu_stress_test", minion, "chunks:1,multi:eu=2;us=3")
+
+    killed = kill_jobs(store, run_id)
+
+    assert sorted(killed) == ["1", "2", "3"]
+    assert [c[0][2] for c in client.run_cmd.call_args_list] == [
+        "1", "2", "3"]
+    assert all(c[0][:2] == (["CLIENT1", "CLIENT2", "CLIENT3"],
+                            "saltutil.kill_job")
+               for c in client.run_cmd.call_args_list)
+
+
+@patch("builtins.open", new_callable=mock_open, read_data="script")
+@patch('chaossaltstack.machine.actions.saltstack_api_client', autospec=True)
+def test_action_records_its_jobs(init, open, tmpdir):
+    client = MagicMock()
+    init.return_value = client
+    client.get_grains_get.return_value = {'CLIENT1': "Linux"}
+    client.async_run_cmd.return_value = "20190830103239148775"
+    client.iter_async_cmd_result.return_value = iter(
+        {'CLIENT1': "success"}.items())
+    client.iter_async_cmd_exit_success.return_value = iter(
+        {'CLIENT1': True}.items())
+    path = str(tmpdir.join("jobs.db"))
+
+    burn_cpu(instance_ids=['CLIENT1'], execution_duration="0",
+             configuration={"saltstack": {"job_store": path}})
+
+    job = JobStore(path).jobs(action="cpu_stress_test")[0]
+    assert job["jid"] == "20190830103239148775"
+    assert job["success"] == 1
+    assert job["collected"] >= job["dispatched"]
+
+
+def _run_status(store, run_id):
+    with sqlite3.connect(store.path) as db:
+        status, ended = db.execute(
+            "SELECT status, ended FROM runs WHERE id = ?",
+            (run_id,)).fetchone()
+    return status, ended is not None
@@ -0,0 +1,98 @@
+from unittest.mock import MagicMock, patch, mock_open
+
+import requests_mock
+
+from chaossaltstack import saltstack_api_client
+from chaossaltstack.machine.actions import burn_cpu
+from chaossaltstack.metrics import Collector, Histogram, MetricsHook, \
+    PrometheusTextfileExporter, activity_metrics, add_metrics_hook, \
+    phase, remove_metrics_hook
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.6, 3.0):
+        histogram.observe(value)
+
+    assert list(histogram.cumulative()) == [
+        ("0.1", 1), ("1.0", 3), ("+Inf", 4)]
+    assert histogram.count == 4
+    assert 0.1 < histogram.quantile(0.5) <= 1.0
+
+
+def test_client_reports_requests_to_activity():
+    secrets = {"SALTMASTER_HOST": "http://salt", "SALTMASTER_TOKEN": "t"}
+    client = saltstack_api_client(secrets)
+
+    with requests_mock.Mocker() as m, activity_metrics("test") as metrics:
+        m.post("http://salt", json={"return": [{"CLIENT1": "Linux"}]})
+        client.get_grains_get(["CLIENT1"], "kernel")
+        with phase("wait"):
+            pass
+
+    summary = metrics.summary()
+    assert summary["requests"]["grains.get"]["count"] == 1
+    assert summary["requests"]["grains.get"]["sent_bytes"] > 0
+    assert summary["requests"]["grains.get"]["received_bytes"] > 0
+    assert "wait" in summary["phases"]
+
+
+def test_registered_hook_is_called_and_flushed():
+    hook = MagicMock(spec=MetricsHook)
+    add_metrics_hook(hook)
+    try:
+        with activity_metrics("test"):
+            with phase("dispatch"):
+                pass
+    finally:
+        remove_metrics_hook(hook)
+
+    hook.observe_phase.assert_called_once()
+    assert hook.observe_phase.call_args[0][:2] == ("test", "dispatch")
+    hook.flush.assert_called_once_with()
+
+
+def test_prometheus_textfile_exporter(tmpdir):
+    path = str(tmpdir.join("chaossaltstack.prom"))
+    exporter = PrometheusTextfileExporter(path)
+    exporter.observe_request({
+        "fun": "cmd.run", "seconds": 0.2, "sent_bytes": 10,
+        "received_bytes": 20, "retries": 1, "status": 200})
+    exporter.observe_phase("cpu_stress_test", "wait", 1.5)
+    exporter.flush()
+
+    with open(path) as f:
+        text = f.read()
+    assert 'chaossaltstack_request_seconds_bucket{fun="cmd.run",le="0.25"} 1' \
+        in text
+    assert 'chaossaltstack_request_retries_total{fun="cmd.run"} 1' in text
+    assert 'chaossaltstack_phase_seconds_total' \
+        '{activity="cpu_stress_test",phase="wait"} 1.5' in text
+
+
+@patch("builtins.open", new_callable=mock_open, read_data="script")
+@patch('chaossaltstack.machine.actions.saltstack_api_client', autospec=True)
+def test_action_attaches_metrics_summary(init, open):
+    client = MagicMock()
+    init.return_value = client
+    client.get_grains_get.return_value = {'CLIENT1': "Linux"}
+    client.async_run_cmd.return_value = "20190830103239148771"
+    client.iter_async_cmd_result.return_value = iter(
+        {'CLIENT1': "success"}.items())
+    client.iter_async_cmd_exit_success.return_value = iter(
+        {'CLIENT1': True}.items())
+
+    response = burn_cpu(instance_ids=['CLIENT1'], execution_duration="0",
+                        configuration={"saltstack": {"metrics_summary": True}})
+
+    assert set(response["_metrics"]["phases"]) == {
+        "resolve", "dispatch", "wait", "collect"}
+    assert 'success' in response['CLIENT1']
+
+
+def test_collector_counts_errors():
+    collector = Collector()
+    collector.observe_request({"fun": "login", "seconds": 1.0,
+                               "status": "error"})
+
+    assert collector.summary()["requests"]["login"]["errors"] == 1
@@ -0,0 +1,120 @@
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+import requests_mock
+from chaoslib.exceptions import FailedActivity
+
+from chaossaltstack import saltstack_api_client
+from chaossaltstack.multimaster import MultiMasterClient, master_jid, \
+    parse_master_jid
+
+
+def master(minions, jid):
+    """
+    A master knowing only the given minions.
+    """
+    client = MagicMock()
+    client.get_grains_get.side_effect = lambda tgt, item: dict(
+        (k, "Linux") for k in ([tgt] if isinstance(tgt, str) else tgt)
+        if k in minions)
+    client.async_run_cmd.return_value = jid
+    client.iter_async_cmd_result.side_effect = lambda j: iter(
+        (k, "done on {}".format(j)) for k in minions)
+    return client
+
+
+def test_minions_are_routed_to_their_master():
+    eu, us = master(["eu-1", "eu-2"], "1"), master(["us-1"], "2")
+    client = MultiMasterClient([("eu", eu, ["eu-*"]), ("us", us, None)])
+
+    machines = client.get_grains_get(["eu-1", "us-1", "eu-2"], "kernel")
+
+    assert sorted(machines) == ["eu-1", "eu-2", "us-1"]
+    eu.get_grains_get.assert_called_once_with(["eu-1", "eu-2"], "kernel")
+    us.get_grains_get.assert_called_once_with(["us-1"], "kernel")
+    assert client.routes == {"eu-1": "eu", "eu-2": "eu", "us-1": "us"}
+
+    # a single minion is still targeted as such
+    assert client.async_run_cmd("us-1", "cmd.run", "ls") == "2"
+    us.async_run_cmd.assert_called_once_with("us-1", "cmd.run", "ls", None)
+    eu.async_run_cmd.assert_not_called()
+
+
+def test_jobs_spanning_masters():
+    eu, us = master(["eu-1"], "1"), master(["us-1"], "2")
+    client = MultiMasterClient([("eu", eu, None), ("us", us, None)])
+
+    # unknown minions are sent to every master without patterns
+    jid = client.async_run_cmd(["eu-1", "us-1"], "cmd.run", "ls")
+    assert eu.async_run_cmd.call_args[0][0] == ["eu-1", "us-1"]
+    assert jid == "multi:eu=1;us=2"
+
+    # another client, such as one reattaching after a restart, looks it up
+    client = MultiMasterClient([("eu", eu, None), ("us", us, None)])
+    results = dict(client.iter_async_cmd_result(jid))
+
+    assert results == {"eu-1": "done on 1", "us-1": "done on 2"}
+    eu.iter_async_cmd_result.assert_called_once_with("1")
+    us.iter_async_cmd_result.assert_called_once_with("2")
+
+
+def test_master_jids_round_trip():
+    jobs = [("http://salt-eu:8000/", "1"), ("us;a=b", "multi")]
+
+    assert parse_master_jid(master_jid(jobs)) == jobs
+    assert "," not in master_jid(jobs)
+    assert parse_master_jid("20190830103239148771") is None
+
+
+def test_masters_are_called_concurrently():
+    barrier = threading.Barrier(2, timeout=5)
+
+    def grains(name):
+        def get(tgt, item):
+            # both masters must be waiting at once to get past the barrier
+            barrier.wait()
+            return {name: "Linux"}
+        return get
+
+    eu, us = MagicMock(), MagicMock()
+    eu.get_grains_get.side_effect = grains("eu-1")
+    us.get_grains_get.side_effect = grains("us-1")
+    client = MultiMasterClient([("eu", eu, ["eu-*"]), ("us", us, ["us-*"])])
+
+    assert client.get_grains_get(["eu-1", "us-1"], "kernel") == {
+        "eu-1": "Linux", "us-1": "Linux"}
+
+
+def test_failures_of_a_master_are_raised():
+    eu, us = master(["eu-1"], "1"), MagicMock()
+    us.iter_async_cmd_result.side_effect = IOError("unreachable")
+    client = MultiMasterClient([("eu", eu, None), ("us", us, None)])
+
+    with pytest.raises(IOError):
+        list(client.iter_async_cmd_result("20190830103239148771"))
+    with pytest.raises(FailedActivity):
+        MultiMasterClient([("eu", eu, ["eu-*"])]).async_run_cmd(
+            ["us-1"], "cmd.run", "ls")
+
+
+def test_client_factory_with_several_masters():
+    secrets = {"SALTMASTERS": [
+        {"name": "eu", "SALTMASTER_HOST": "http://salt-eu",
+         "SALTMASTER_TOKEN": "t1", "minions": ["eu-*"]},
+        {"SALTMASTER_HOST": "http://salt-us", "SALTMASTER_TOKEN": "t2"}]}
+    configuration = {"saltstack": {"max_in_flight": 4}}
+
+    client = saltstack_api_client(secrets, configuration)
+
+    assert list(client.masters) == ["eu", "http://salt-us"]
+    eu, us = client.masters["eu"][0], client.masters["http://salt-us"][0]
+    assert eu.throttle is not us.throttle
+    with requests_mock.Mocker() as m:
+        m.post("http://salt-eu", json={"return": [{"eu-1": "Linux"}]})
+        m.post("http://salt-us", json={"return": [{"us-1": "Windows"}]})
+        machines = client.get_grains_get(["eu-1", "us-1"], "kernel")
+
+    assert machines == {"eu-1": "Linux", "us-1": "Windows"}
+    tokens = sorted(r.headers["X-Auth-Token"] for r in m.request_history)
+    assert tokens == ["t1", "t2"]
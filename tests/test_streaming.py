@@ -0,0 +1,35 @@
+import json
+
+import pytest
+
+from chaossaltstack.streaming import iter_return_items
+
+
+def chunked(payload, size):
+    raw = json.dumps(payload).encode("utf-8")
+    return [raw[i:i + size] for i in range(0, len(raw), size)]
+
+
+@pytest.mark.parametrize("size", [1, 3, 64, 65536])
+def test_pairs_survive_any_chunking(size):
+    returns = {
+        "CLIENT1": True, "CLIENT2": 12345, "CLIENT3": "out é \"{}\"",
+        "CLIENT4": {"retcode": 0, "stdout": ["a", 2.5, None]}
+    }
+    payload = {"_links": {"jobs": [1]}, "return": [returns]}
+
+    assert list(iter_return_items(chunked(payload, size))) == \
+        list(returns.items())
+
+
+def test_empty_returns():
+    assert list(iter_return_items(chunked({"return": []}, 4))) == []
+    assert list(iter_return_items(chunked({"return": [{}]}, 4))) == []
+
+
+def test_unexpected_returns_are_reported():
+    with pytest.raises(ValueError, match="salt-api returned Not found"):
+        list(iter_return_items(chunked({"return": ["Not found"]}, 4)))
+
+    with pytest.raises(ValueError):
+        list(iter_return_items([b'{"return": [{"CLIENT1": tr']))
@@ -0,0 +1,80 @@
+import threading
+from time import sleep
+from unittest.mock import patch
+
+import requests_mock
+
+from chaossaltstack import saltstack_api_client
+from chaossaltstack.throttle import DISPATCH, POLL, Throttle, TokenBucket, \
+    get_throttle
+
+
+def test_token_bucket_allows_burst_then_waits():
+    bucket = TokenBucket(rate=10, burst=2)
+
+    with patch("chaossaltstack.throttle.sleep") as sleep_:
+        assert bucket.acquire() == 0
+        assert bucket.acquire() == 0
+        waited = bucket.acquire()
+
+    assert 0 < waited <= 0.1
+    sleep_.assert_called_once_with(waited)
+
+
+def test_throttle_caps_in_flight_requests():
+    throttle = Throttle(max_in_flight=2)
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def work():
+        with throttle.slot(DISPATCH):
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+            sleep(0.02)
+            with lock:
+                running.pop()
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert max(peak) == 2
+
+
+def test_throttle_disabled_by_default():
+    throttle = Throttle()
+
+    assert throttle.enabled is False
+    with throttle.slot(POLL) as waited:
+        assert waited == 0
+
+
+def test_get_throttle_is_shared_per_limits():
+    settings = {"max_in_flight": "4", "dispatch_rate": 5}
+
+    assert get_throttle(settings) is get_throttle(dict(settings))
+    assert get_throttle(settings) is not get_throttle({"max_in_flight": 5})
+
+
+def test_client_draws_from_budget_per_salt_client():
+    configuration = {"saltstack": {"dispatch_rate": 100, "poll_rate": 100}}
+    secrets = {"SALTMASTER_HOST": "http://salt", "SALTMASTER_TOKEN": "t"}
+    client = saltstack_api_client(secrets, configuration)
+    budgets = []
+    slot = client.throttle.slot
+
+    def record(budget=None):
+        budgets.append(budget)
+        return slot(budget)
+
+    with requests_mock.Mocker() as m, \
+            patch.object(client.throttle, "slot", side_effect=record):
+        m.post("http://salt", json={"return": [{"jid": "1"}]})
+        client.async_run_cmd("CLIENT1", "cmd.run", "ls")
+        client.get_async_cmd_result("1")
+
+    assert budgets == [DISPATCH, POLL]
@@ -0,0 +1,61 @@
+import sys
+from unittest.mock import MagicMock, patch
+
+import requests_mock
+
+from chaossaltstack import saltstack_api_client, tracing
+from chaossaltstack.machine.actions import burn_cpu
+from chaossaltstack.machine.parallel import run_specs
+
+
+def test_span_is_shared_noop_without_opentelemetry():
+    with patch.object(tracing, "_tracer", None):
+        with tracing.span("test", {"a": 1}) as s:
+            s.set_attribute("b", 2)
+            assert s.is_recording() is False
+
+        assert tracing.span("other") is tracing.NOOP_SPAN
+
+
+def test_traced_keeps_activity_signature():
+    assert burn_cpu.__name__ == "burn_cpu"
+    assert burn_cpu.__wrapped__.__code__.co_varnames[0] == "instance_ids"
+
+
+def test_http_call_span_attributes():
+    tracer = MagicMock()
+    current = tracer.start_as_current_span.return_value.__enter__.return_value
+    secrets = {"SALTMASTER_HOST": "http://salt", "SALTMASTER_TOKEN": "t"}
+    client = saltstack_api_client(secrets)
+
+    with patch.object(tracing, "_tracer", tracer), \
+            requests_mock.Mocker() as m:
+        m.post("http://salt", json={"return": [{"jid": "2019083010"}]})
+        client.async_run_cmd(["CLIENT1", "CLIENT2"], "cmd.run", "ls")
+
+    tracer.start_as_current_span.assert_called_once_with(
+        "salt-api", attributes={"salt.client": "local_async",
+                                "salt.fun": "cmd.run", "salt.minions": 2})
+    current.set_attribute.assert_any_call("salt.jid", "2019083010")
+
+
+def test_parallel_actions_run_within_the_caller_span():
+    otel = MagicMock()
+    context = otel.context
+    context.get_current.return_value = "caller span context"
+    attached = []
+
+    def action(instance_ids, configuration=None, secrets=None):
+        attached.append(context.attach.call_args[0][0])
+        return {}
+
+    with patch.object(tracing, "_tracer", MagicMock()), \
+            patch.dict(sys.modules, {"opentelemetry": otel,
+                                     "opentelemetry.context": context}):
+        run_specs([("caches", action, ["c"], {}),
+                   ("app", action, ["a"], {})])
+
+    assert attached == ["caller span context"] * 2
+    assert context.detach.call_count == 2
+    with patch.object(tracing, "_tracer", None):
+        assert tracing.bind_context(len) is len